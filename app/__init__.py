@@ -10,9 +10,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from config import Config
+from .database import RoutingSession, configure_engines
+from .instrumentation import init_instrumentation
+from .assets import init_assets
+from .templating import init_templating
 
 # Initialize extensions (not bound to app yet)
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'main_bp.login'  # Redirects to login page when not authenticated
 migrate = Migrate()
@@ -26,15 +30,24 @@ def create_app():
     """
     app = Flask(__name__)
     app.config.from_object(Config)
+    from .reservations import check_hold_ttl
+    check_hold_ttl(app.config)
 
     # Initialize extensions with the app
     db.init_app(app)
+    configure_engines(app, db)
+    init_instrumentation(app)
+    init_assets(app)
+    init_templating(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    from .search import include_object, search_cli
+    migrate.init_app(app, db, include_object=include_object)
 
     # Register context processors
-    from .context_processors import inject_current_year
+    from .context_processors import inject_current_year, inject_image_helpers, inject_csrf_token
     app.context_processor(inject_current_year)
+    app.context_processor(inject_image_helpers)
+    app.context_processor(inject_csrf_token)
 
     with app.app_context():
         # Ensure models are registered before migrations or blueprints
@@ -44,4 +57,23 @@ def create_app():
         # Register main blueprint for all routes
         app.register_blueprint(routes.main_bp)
 
+    # Register CLI commands
+    from .analytics import analytics_cli
+    from .assets import assets_cli
+    from .catalog_io import catalog_cli
+    from .images import images_cli
+    from .jobs import jobs_cli
+    from .reservations import holds_cli
+    from .query_plans import indexes_cli
+    from .recommendations import recommendations_cli
+    app.cli.add_command(search_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(holds_cli)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(recommendations_cli)
+
     return app
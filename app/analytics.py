@@ -0,0 +1,205 @@
+"""
+analytics.py
+
+Sales rollups for the admin analytics dashboard.
+Fulfillment adds each new order to three rollup tables (per day, per
+product per day and per category per day) in the same transaction that
+creates the order. The dashboard reads only those tables, so its cost
+depends on the date range shown, not on how much order history exists.
+`flask analytics backfill` rebuilds the rollups from Order/OrderItem, one
+table per transaction, e.g. after the first deploy or a data fix.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select, text
+
+from . import db
+from .models import Order, OrderItem, Product, SalesDaily, SalesDailyCategory, SalesDailyProduct
+
+MEASURES = ("revenue", "units", "orders")
+
+# Rollup model -> its key columns besides the day
+ROLLUPS = {
+    SalesDaily: (),
+    SalesDailyProduct: ("product_id",),
+    SalesDailyCategory: ("category",),
+}
+
+
+def _insert():
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Sales rollups do not support the '{dialect}' database.")
+    return insert
+
+
+def aggregate(lines):
+    """
+    Fold (order_id, day, product_id, category, quantity, unit_price) lines into
+    rollup rows: {model: [row, ...]}. Every line of an order must be in `lines`
+    for its order counts to be right.
+    """
+    totals = {model: defaultdict(lambda: {"revenue": 0.0, "units": 0, "orders": set()}) for model in ROLLUPS}
+    for order_id, day, product_id, category, quantity, unit_price in lines:
+        for model, key in ((SalesDaily, (day,)),
+                           (SalesDailyProduct, (day, product_id)),
+                           (SalesDailyCategory, (day, category or ""))):
+            bucket = totals[model][key]
+            bucket["revenue"] += quantity * unit_price
+            bucket["units"] += quantity
+            bucket["orders"].add(order_id)
+
+    rows = {}
+    for model, buckets in totals.items():
+        names = ("day",) + ROLLUPS[model]
+        # Sorted keys make concurrent writers lock rows in the same order
+        rows[model] = [
+            dict(zip(names, key), revenue=round(bucket["revenue"], 2),
+                 units=bucket["units"], orders=len(bucket["orders"]))
+            for key, bucket in sorted(buckets.items())
+        ]
+    return rows
+
+
+def add_to_rollups(rows):
+    """Add aggregated rows onto the stored totals. Does not commit."""
+    insert = _insert()
+    for model, model_rows in rows.items():
+        if not model_rows:
+            continue
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", *ROLLUPS[model]],
+            set_={measure: getattr(model, measure) + stmt.excluded[measure] for measure in MEASURES},
+        )
+        db.session.execute(stmt, model_rows)
+
+
+def record_order(order_id, day, lines):
+    """
+    Add one fulfilled order to the rollups, in the caller's transaction.
+    `lines` are (product_id, category, quantity, unit_price).
+    """
+    add_to_rollups(aggregate(
+        (order_id, day, product_id, category, quantity, unit_price)
+        for product_id, category, quantity, unit_price in lines
+    ))
+
+
+# -------------------------------
+# Backfill
+# -------------------------------
+
+def _rebuild_query(model):
+    """SELECT of `model`'s rows computed from the whole order history."""
+    day = func.date(Order.timestamp)
+    keys = {
+        SalesDaily: (),
+        SalesDailyProduct: (OrderItem.product_id,),
+        # Categories are today's: order items don't snapshot them
+        SalesDailyCategory: (func.coalesce(Product.category, ""),),
+    }[model]
+    quantity = func.coalesce(OrderItem.quantity, 0)
+    query = select(
+        day, *keys,
+        func.round(func.sum(quantity * func.coalesce(OrderItem.unit_price, 0.0)), 2),
+        func.sum(quantity),
+        func.count(func.distinct(Order.id)),
+    ).join(OrderItem, OrderItem.order_id == Order.id)
+    if model is SalesDailyCategory:
+        query = query.outerjoin(Product, Product.id == OrderItem.product_id)
+    return query.group_by(day, *keys)
+
+
+def backfill(log=click.echo):
+    """
+    Rebuild all rollups from order history, one table per transaction.
+    Each table is locked against writes, emptied and refilled in a single
+    transaction: the dashboard keeps reading the old totals until the commit,
+    and fulfillment waits, so every order is counted exactly once, either by
+    the rebuild or by its own record_order() after it. Returns the number of
+    orders rolled up.
+    """
+    postgresql = db.session.get_bind().dialect.name == "postgresql"
+    for model in ROLLUPS:
+        if postgresql:
+            # Readers are let through; record_order() waits for the commit
+            db.session.execute(text(f"LOCK TABLE {model.__tablename__} IN EXCLUSIVE MODE"))
+        # On SQLite the DELETE takes the database write lock, which does the same
+        db.session.execute(delete(model))
+        db.session.execute(_insert()(model).from_select(
+            ["day", *ROLLUPS[model], *MEASURES], _rebuild_query(model)
+        ))
+        db.session.commit()
+        log(f"Rebuilt {model.__tablename__}.")
+    return db.session.scalar(select(func.coalesce(func.sum(SalesDaily.orders), 0)))
+
+
+# -------------------------------
+# Dashboard queries
+# -------------------------------
+
+def dashboard(days, top=10):
+    """Everything the analytics view shows for the last `days` days, read from the rollups only."""
+    # Rollup days are UTC, like Order.timestamp
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+
+    series = db.session.execute(
+        select(SalesDaily.day, SalesDaily.revenue, SalesDaily.units, SalesDaily.orders)
+        .where(SalesDaily.day.between(start, end)).order_by(SalesDaily.day)
+    ).all()
+    by_day = {row.day: row for row in series}
+    daily = [{
+        "day": day,
+        "revenue": by_day[day].revenue if day in by_day else 0.0,
+        "units": by_day[day].units if day in by_day else 0,
+        "orders": by_day[day].orders if day in by_day else 0,
+    } for day in (start + timedelta(days=n) for n in range(days))]
+
+    revenue = func.sum(SalesDailyProduct.revenue).label("revenue")
+    products = db.session.execute(
+        select(SalesDailyProduct.product_id, Product.name, revenue,
+               func.sum(SalesDailyProduct.units).label("units"))
+        .outerjoin(Product, Product.id == SalesDailyProduct.product_id)
+        .where(SalesDailyProduct.day.between(start, end))
+        .group_by(SalesDailyProduct.product_id, Product.name)
+        .order_by(revenue.desc()).limit(top)
+    ).all()
+
+    category_revenue = func.sum(SalesDailyCategory.revenue).label("revenue")
+    categories = db.session.execute(
+        select(SalesDailyCategory.category, category_revenue,
+               func.sum(SalesDailyCategory.units).label("units"),
+               func.sum(SalesDailyCategory.orders).label("orders"))
+        .where(SalesDailyCategory.day.between(start, end))
+        .group_by(SalesDailyCategory.category)
+        .order_by(category_revenue.desc())
+    ).all()
+
+    totals = {measure: sum(day[measure] for day in daily) for measure in MEASURES}
+    totals["average_order"] = totals["revenue"] / totals["orders"] if totals["orders"] else 0.0
+    return {"start": start, "end": end, "daily": daily, "totals": totals,
+            "products": products, "categories": categories}
+
+
+# -------------------------------
+# CLI: flask analytics ...
+# -------------------------------
+
+analytics_cli = AppGroup("analytics", help="Maintain the sales rollup tables.")
+
+
+@analytics_cli.command("backfill")
+def backfill_command():
+    """Rebuild the sales rollups from all existing orders."""
+    processed = backfill()
+    click.echo(f"Done: {processed} order(s) rolled up.")
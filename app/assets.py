@@ -0,0 +1,200 @@
+"""
+assets.py
+
+Fingerprinted, precompressed static assets.
+`flask assets build` copies every file in app/static to app/static/dist
+under a content-hashed name, writes gzip (and, when the brotli package is
+installed, brotli) siblings for text assets, and records the mapping in
+dist/manifest.json. `/assets/<path>` serves those files with far-future
+immutable caching, choosing the best precompressed variant the client
+accepts. Templates call `asset_url('static', filename=...)`, a drop-in for
+url_for that resolves the hashed name.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .gz siblings are written
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+# One year, the conventional maximum for immutable assets
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Only text formats gain from compression; images and fonts are already compressed
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml"}
+MIN_COMPRESS_SIZE = 256
+
+# Accept-Encoding token -> file suffix, in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+_manifest = None
+
+
+def dist_folder(app):
+    return os.path.join(app.static_folder, DIST_DIR)
+
+
+def load_manifest(app):
+    """Read dist/manifest.json, or return an empty mapping if assets were never built."""
+    global _manifest
+    try:
+        with open(os.path.join(dist_folder(app), MANIFEST)) as fh:
+            _manifest = json.load(fh)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(endpoint, **values):
+    """
+    url_for() that maps static files to their fingerprinted copies.
+    Falls back to the plain static URL in debug mode or for unbuilt files.
+    """
+    if endpoint == "static" and not current_app.debug:
+        manifest = _manifest if _manifest is not None else load_manifest(current_app)
+        hashed = manifest.get(values.get("filename"))
+        if hashed:
+            return url_for("assets", **dict(values, filename=hashed))
+    return url_for(endpoint, **values)
+
+
+# -------------------------------
+# Build
+# -------------------------------
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _write_compressed(path):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    written = []
+    # mtime=0 keeps .gz output identical across builds
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as fh:
+                fh.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def build_assets(app):
+    """Fingerprint and precompress every static file; returns the new manifest."""
+    static_folder = app.static_folder
+    output = dist_folder(app)
+    manifest = {}
+    for directory, subdirs, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirs[:] = [d for d in subdirs if d != DIST_DIR]
+        for filename in filenames:
+            source = os.path.join(directory, filename)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(relative)
+            hashed = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(output, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if ext.lower() in COMPRESSIBLE and os.path.getsize(target) >= MIN_COMPRESS_SIZE:
+                    _write_compressed(target)
+            manifest[relative] = hashed
+
+    # Write the manifest last so a half-finished build is never referenced
+    tmp_path = os.path.join(output, MANIFEST + ".tmp")
+    os.makedirs(output, exist_ok=True)
+    with open(tmp_path, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(output, MANIFEST))
+    load_manifest(app)
+    return manifest
+
+
+def clean_assets(app, keep):
+    """Delete built files not referenced by `keep` (a manifest); returns the count."""
+    output = dist_folder(app)
+    referenced = set(keep.values())
+    removed = 0
+    for directory, _, filenames in os.walk(output):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, output).replace(os.sep, "/")
+            base = relative
+            for _, suffix in ENCODINGS:
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            if base != MANIFEST and base not in referenced:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+# -------------------------------
+# Serving
+# -------------------------------
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, precompressed when the client accepts it."""
+    folder = dist_folder(current_app)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+    for token, suffix in ENCODINGS:
+        if request.accept_encodings[token] and os.path.isfile(os.path.join(folder, filename + suffix)):
+            encoding = token
+            response = send_from_directory(folder, filename + suffix, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            break
+    else:
+        response = send_from_directory(folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Register the /assets route and the asset_url template helper."""
+    app.add_url_rule("/assets/<path:filename>", endpoint="assets", view_func=serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+
+assets_cli = AppGroup("assets", help="Build fingerprinted static assets.")
+
+
+@assets_cli.command("build")
+@click.option("--clean", is_flag=True, help="Also delete files from earlier builds.")
+def build_command(clean):
+    """Fingerprint and precompress app/static into app/static/dist."""
+    manifest = build_assets(current_app)
+    click.echo(f"Built {len(manifest)} asset(s) into {dist_folder(current_app)}.")
+    if brotli is None:
+        click.echo("brotli is not installed; only .gz files were written.")
+    if clean:
+        click.echo(f"Removed {clean_assets(current_app, manifest)} stale file(s).")
@@ -0,0 +1,390 @@
+"""
+autocomplete.py
+
+Search-as-you-type suggestions for the catalog search box.
+Each worker keeps a prefix index of product-name words in memory: a sorted
+list of the distinct words, searched with bisect, and for each word an
+array of the ids of the products whose name contains it, most popular
+first. Popularity is units sold (from the sales rollups) plus the review
+count. Prefixes of up to three characters match too many words to merge on
+every keystroke, so their most popular products are precomputed. Category
+suggestions come from the cached facets.
+
+The index is built in a background thread when a worker serves its first
+request; until it is ready there are no suggestions, and the search form
+works as before. When the catalog version changes, the thread re-reads only
+the products updated since its last pass (Product.updated_at) and patches
+them into a copy of the index, which then replaces the old one, so readers
+never see a half-applied update. Sales change neither, so only catalog
+edits cause a refresh.
+"""
+
+import bisect
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db
+from .catalog import current_catalog_version
+from .facets import get_category_facets
+from .models import Product, SalesDailyProduct
+
+logger = logging.getLogger(__name__)
+
+# Prefixes up to this length get a precomputed list of their top products
+SHORT_PREFIX = 3
+SHORT_PREFIX_TOP = 64
+
+# Candidates checked against the other words of a multi-word query
+MAX_SCAN = 1000
+
+# Each refresh also re-reads products updated this long before the previous
+# one started, covering transactions that were still open at the time
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+# A refresh that would re-read more than this share of the catalog (say,
+# after a bulk import) rebuilds the index instead
+REBUILD_FRACTION = 0.1
+
+# Seconds to wait before retrying a failed build
+RETRY_DELAY = 30
+
+# Sorts after every character, so word + _LAST bounds the words starting with word
+_LAST = "\U0010ffff"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def words(text):
+    """The distinct lowercased, accent-free words of `text`, in order."""
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return list(dict.fromkeys(_WORD_RE.findall(text)))
+
+
+def _unique(ids):
+    seen = set()
+    for product_id in ids:
+        if product_id not in seen:
+            seen.add(product_id)
+            yield product_id
+
+
+def _short_prefixes(product_words):
+    return {word[:length] for word in product_words for length in range(1, SHORT_PREFIX + 1)}
+
+
+# -------------------------------
+# Loading products
+# -------------------------------
+
+def _product_rows(ids=None):
+    """(id, name, popularity) for all products, or only those in `ids`."""
+    units = select(SalesDailyProduct.product_id, func.sum(SalesDailyProduct.units).label("units")) \
+        .group_by(SalesDailyProduct.product_id)
+    query = select(Product.id, Product.name, Product.rating_count)
+    if ids is not None:
+        units = units.where(SalesDailyProduct.product_id.in_(ids))
+        query = query.where(Product.id.in_(ids))
+    units = units.subquery()
+    query = query.add_columns(func.coalesce(units.c.units, 0)) \
+        .outerjoin(units, units.c.product_id == Product.id)
+    return [(product_id, name or "", (rating_count or 0) + sold)
+            for product_id, name, rating_count, sold in db.session.connection().execute(query)]
+
+
+def _changed_rows(ids, batch_size=500):
+    rows = []
+    for start in range(0, len(ids), batch_size):
+        rows.extend(_product_rows(ids[start:start + batch_size]))
+    return rows
+
+
+# -------------------------------
+# The index
+# -------------------------------
+
+class PrefixIndex:
+    """
+    One immutable snapshot of the suggestion data. Product ids index the
+    `names` list and `popularity` array directly; missing ids hold None.
+    """
+
+    def __init__(self, version, synced_at):
+        self.version = version
+        self.synced_at = synced_at  # Start of the pass that produced this snapshot
+        self.words = []  # Sorted distinct name words
+        self.postings = []  # array('i') of product ids per word, best first
+        self.names = []
+        self.popularity = array("q")
+        self.top = {}  # Short prefix -> array('i') of its best product ids
+        self.count = 0
+        self.categories = []  # Sorted (word, -product_count, category name)
+        self.category_words = {}
+
+    def rank_key(self, product_id):
+        return -self.popularity[product_id], product_id
+
+    def word_range(self, prefix):
+        return bisect.bisect_left(self.words, prefix), bisect.bisect_left(self.words, prefix + _LAST)
+
+    # ---- building and patching ----
+
+    @classmethod
+    def build(cls, rows, version, synced_at):
+        index = cls(version, synced_at)
+        index._grow(max((row[0] for row in rows), default=0))
+        for product_id, name, popularity in rows:
+            index.names[product_id] = name
+            index.popularity[product_id] = popularity
+        index.count = len(rows)
+
+        # Walking products best first leaves every list in rank order
+        by_word, top = {}, {}
+        for product_id in sorted((row[0] for row in rows), key=index.rank_key):
+            product_words = words(index.names[product_id])
+            for word in product_words:
+                by_word.setdefault(word, []).append(product_id)
+            for prefix in _short_prefixes(product_words):
+                best = top.setdefault(prefix, [])
+                if len(best) < SHORT_PREFIX_TOP:
+                    best.append(product_id)
+
+        index.words = sorted(by_word)
+        index.postings = [array("i", by_word[word]) for word in index.words]
+        index.top = {prefix: array("i", ids) for prefix, ids in top.items()}
+        index._load_categories()
+        return index
+
+    def refreshed(self, version, synced_at):
+        """A copy of this index with products changed since the last pass patched in."""
+        changed = db.session.scalars(
+            select(Product.id).where(Product.updated_at >= self.synced_at - REFRESH_OVERLAP)
+        ).all()
+        if len(changed) > max(self.count * REBUILD_FRACTION, 1000):
+            return PrefixIndex.build(_product_rows(), version, synced_at)
+
+        rows = _changed_rows(changed)
+        index = PrefixIndex(version, synced_at)
+        index.words, index.postings = list(self.words), list(self.postings)
+        index.names, index.popularity = list(self.names), array("q", self.popularity)
+        index.top, index.count = dict(self.top), self.count
+
+        deleted = []
+        total = db.session.scalar(select(func.count(Product.id)))
+        if total != self.count + sum(1 for row in rows if not self._has(row[0])):
+            live = set(db.session.scalars(select(Product.id)))
+            deleted = [product_id for product_id, name in enumerate(self.names)
+                       if name is not None and product_id not in live]
+        index._patch(rows, deleted)
+        index._load_categories()
+        return index
+
+    def _has(self, product_id):
+        return product_id < len(self.names) and self.names[product_id] is not None
+
+    def _grow(self, max_id):
+        missing = max_id + 1 - len(self.names)
+        if missing > 0:
+            self.names.extend([None] * missing)
+            self.popularity.extend(itertools.repeat(0, missing))
+
+    def _patch(self, rows, deleted):
+        """Re-file changed and deleted products under their old and new words."""
+        touched = {row[0] for row in rows} | set(deleted)
+        old_words = {product_id: words(self.names[product_id]) for product_id in touched if self._has(product_id)}
+
+        self._grow(max((row[0] for row in rows), default=0))
+        for product_id, name, popularity in rows:
+            self.count += not self._has(product_id)
+            self.names[product_id] = name
+            self.popularity[product_id] = popularity
+        for product_id in deleted:
+            self.count -= 1
+            self.names[product_id] = None
+            self.popularity[product_id] = 0
+
+        new_words = {}
+        for product_id, name, _ in rows:
+            for word in words(name):
+                new_words.setdefault(word, []).append(product_id)
+        affected = set(new_words).union(*old_words.values())
+
+        for word in sorted(affected):
+            position = bisect.bisect_left(self.words, word)
+            exists = position < len(self.words) and self.words[position] == word
+            ids = [product_id for product_id in self.postings[position] if product_id not in touched] \
+                if exists else []
+            # Only touched products changed popularity, so the kept ids are still in rank order
+            added = new_words.get(word, ())
+            if len(added) < 64:
+                for product_id in added:
+                    bisect.insort(ids, product_id, key=self.rank_key)
+            else:
+                ids.extend(added)
+                ids.sort(key=self.rank_key)
+            if exists and ids:
+                self.postings[position] = array("i", ids)
+            elif exists:
+                del self.words[position], self.postings[position]
+            elif ids:
+                self.words.insert(position, word)
+                self.postings.insert(position, array("i", ids))
+
+        new_prefixes = {}
+        for product_id, name, _ in rows:
+            for prefix in _short_prefixes(words(name)):
+                new_prefixes.setdefault(prefix, []).append(product_id)
+        for prefix in _short_prefixes(affected):
+            self._update_top(prefix, touched, new_prefixes.get(prefix, []))
+
+    def _update_top(self, prefix, touched, added):
+        old = self.top.get(prefix)
+        kept = [product_id for product_id in old if product_id not in touched] if old is not None else None
+        if kept is not None and (len(old) < SHORT_PREFIX_TOP or len(kept) == len(old)):
+            # The old list still holds every untouched product that can make the cut
+            best = sorted(kept + added, key=self.rank_key)[:SHORT_PREFIX_TOP]
+        else:
+            # Each word's list is in rank order, so only the heads can make the cut
+            lo, hi = self.word_range(prefix)
+            heads = {product_id for ids in self.postings[lo:hi] for product_id in ids[:SHORT_PREFIX_TOP]}
+            best = heapq.nsmallest(SHORT_PREFIX_TOP, heads, key=self.rank_key)
+        if best:
+            self.top[prefix] = array("i", best)
+        else:
+            self.top.pop(prefix, None)
+
+    def _load_categories(self):
+        facets = get_category_facets()
+        self.category_words = {facet.name: words(facet.name) for facet in facets}
+        self.categories = sorted((word, -facet.product_count, facet.name)
+                                 for facet in facets for word in self.category_words[facet.name])
+
+    # ---- lookups ----
+
+    def suggest(self, query, max_products, max_categories):
+        """([(product id, name)], [category name]) for a partial search string."""
+        terms = words(query)
+        if not terms:
+            return [], []
+        return self._products(terms, max_products), self._categories(terms, max_categories)
+
+    def _products(self, terms, limit):
+        ranges = [self.word_range(term) for term in terms]
+        if any(lo == hi for lo, hi in ranges):
+            return []
+
+        # Drive from the term matching the fewest words; check the rest per candidate
+        driver = min(range(len(terms)), key=lambda n: (ranges[n][1] - ranges[n][0], -len(terms[n])))
+        others = terms[:driver] + terms[driver + 1:]
+        lo, hi = ranges[driver]
+        if not others and terms[driver] in self.top:
+            candidates = self.top[terms[driver]]
+        else:
+            candidates = _unique(heapq.merge(*self.postings[lo:hi], key=self.rank_key))
+
+        # A term at a word boundary starts a word; non-ASCII names need words()' folding
+        checks = [re.compile(r"\b" + re.escape(term), re.IGNORECASE).search for term in others]
+        found = []
+        for product_id in itertools.islice(candidates, MAX_SCAN):
+            name = self.names[product_id]
+            if others:
+                if name.isascii():
+                    matched = all(check(name) for check in checks)
+                else:
+                    name_words = words(name)
+                    matched = all(any(word.startswith(term) for word in name_words) for term in others)
+                if not matched:
+                    continue
+            found.append((product_id, name))
+            if len(found) == limit:
+                break
+        return found
+
+    def _categories(self, terms, limit):
+        lo = bisect.bisect_left(self.categories, (terms[0],))
+        hi = bisect.bisect_left(self.categories, (terms[0] + _LAST,))
+        found = {}
+        for _, negative_count, name in self.categories[lo:hi]:
+            if name not in found and all(any(word.startswith(term) for word in self.category_words[name])
+                                         for term in terms[1:]):
+                found[name] = negative_count
+        return sorted(found, key=found.get)[:limit]
+
+
+# -------------------------------
+# Per-worker index maintenance
+# -------------------------------
+
+_lock = threading.Lock()
+_index = None
+_updater = None
+_failed_at = None
+
+
+def _update(app):
+    global _index, _failed_at
+    with app.app_context():
+        try:
+            # Read the version before the data, so writes made meanwhile trigger another pass
+            version = current_catalog_version()
+            started = datetime.utcnow()
+            clock = time.perf_counter()
+            if _index is None:
+                _index = PrefixIndex.build(_product_rows(), version, started)
+                action = "Built"
+            else:
+                _index = _index.refreshed(version, started)
+                action = "Refreshed"
+            _failed_at = None
+            logger.info("%s autocomplete index: %s products, %s words in %.2f s",
+                        action, _index.count, len(_index.words), time.perf_counter() - clock)
+        except Exception:
+            _failed_at = time.monotonic()
+            logger.exception("Autocomplete index update failed")
+        finally:
+            db.session.remove()
+
+
+def current_index():
+    """
+    The latest index snapshot, or None before the first build finishes.
+    Starts a background build or refresh when the catalog has changed.
+    """
+    global _updater
+    index = _index
+    if index is not None and index.version == current_catalog_version():
+        return index
+    with _lock:
+        retry_wait = _failed_at is not None and time.monotonic() - _failed_at < RETRY_DELAY
+        if not retry_wait and (_updater is None or not _updater.is_alive()):
+            _updater = threading.Thread(target=_update, args=(current_app._get_current_object(),),
+                                        name="autocomplete-index", daemon=True)
+            _updater.start()
+    return index
+
+
+def warm_index():
+    """Start building this worker's index in the background if nothing has yet."""
+    if _index is None and _updater is None:
+        current_index()
+
+
+def suggest(query):
+    """([(product id, name)], [category name]) for what has been typed so far."""
+    index = current_index()
+    if index is None:
+        # Still building; a full-text fallback costs far more than a keystroke allows
+        return [], []
+    config = current_app.config
+    return index.suggest(query, config["AUTOCOMPLETE_MAX_PRODUCTS"], config["AUTOCOMPLETE_MAX_CATEGORIES"])
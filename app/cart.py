@@ -0,0 +1,153 @@
+"""
+cart.py
+
+Batched cart mutations for the JSON cart API.
+A batch is a list of operations applied in order:
+
+    {"op": "add", "product_id": 7, "quantity": 2}
+    {"op": "set", "product_id": 7, "quantity": 5}
+    {"op": "remove", "product_id": 7}
+
+The cart and the available stock (stock minus checkout holds, see
+app/reservations.py) of every product involved are read with two queries,
+and the result is written in one transaction. If any line is invalid the
+whole batch is rejected and nothing is written.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import CartItem, Product
+from .reservations import available_stock
+
+OPERATIONS = {"add", "set", "remove"}
+
+# Upper bound on operations per request; the client coalesces well below this
+MAX_OPERATIONS = 100
+
+
+class CartError(Exception):
+    """Raised when a batch is malformed or can't be applied; nothing has been written."""
+
+    def __init__(self, message, status=400, product_id=None):
+        super().__init__(message)
+        self.status = status
+        self.product_id = product_id
+
+
+def _quantity(value):
+    # bool is an int subclass, but {"quantity": true} is a client bug
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise CartError("Quantities must be non-negative integers.")
+    return value
+
+
+def parse_operations(payload):
+    """Validate a request body and return a list of (op, product_id, quantity)."""
+    operations = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartError('Expected a JSON body like {"operations": [...]}.')
+    if len(operations) > MAX_OPERATIONS:
+        raise CartError(f"At most {MAX_OPERATIONS} operations per request.")
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise CartError(f"Each operation needs an op of {', '.join(sorted(OPERATIONS))}.")
+        product_id = operation.get("product_id")
+        if isinstance(product_id, bool) or not isinstance(product_id, int):
+            raise CartError("Each operation needs an integer product_id.")
+        quantity = 0 if operation["op"] == "remove" else _quantity(operation.get("quantity", 1))
+        parsed.append((operation["op"], product_id, quantity))
+    return parsed
+
+
+def cart_state(quantities, products, available):
+    """The JSON-ready cart: lines ordered by product, plus the item count and total."""
+    lines = [{
+        "product_id": product_id,
+        "name": products[product_id].name,
+        "price": products[product_id].price,
+        "stock": max(available[product_id], 0),
+        "quantity": quantity,
+        "subtotal": round(products[product_id].price * quantity, 2),
+    } for product_id, quantity in sorted(quantities.items()) if quantity > 0]
+    return {
+        "items": lines,
+        "count": sum(line["quantity"] for line in lines),
+        "total": round(sum(line["subtotal"] for line in lines), 2),
+    }
+
+
+def _load(user_id, product_ids=()):
+    items = {item.product_id: item for item in CartItem.query.filter_by(user_id=user_id)}
+    wanted = set(product_ids) | set(items)
+    products, available = {}, {}
+    if wanted:
+        for product, stock in db.session.execute(
+            select(Product, available_stock()).where(Product.id.in_(wanted))
+        ):
+            products[product.id] = product
+            available[product.id] = stock
+    return items, products, available
+
+
+def get_cart(user_id):
+    """The user's current cart state."""
+    items, products, available = _load(user_id)
+    return cart_state({pid: item.quantity for pid, item in items.items() if pid in products},
+                      products, available)
+
+
+def apply_cart_operations(user_id, operations):
+    """
+    Apply parsed operations to the user's cart in one transaction and return
+    the new cart state. Raises CartError, with nothing written, if a product
+    doesn't exist or a line would grow beyond the product's stock.
+    """
+    items, products, available = _load(user_id, {product_id for _, product_id, _ in operations})
+
+    # Fold the batch into one final quantity per product
+    quantities = {product_id: item.quantity for product_id, item in items.items()}
+    for op, product_id, quantity in operations:
+        if op == "add":
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        else:
+            quantities[product_id] = quantity
+
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            if quantity and product_id not in items:
+                raise CartError(f"Product {product_id} does not exist.", 404, product_id)
+            continue
+        # Lines that only shrink (or stay put) are fine even if stock dropped since
+        if quantity > available[product_id] and quantity > getattr(items.get(product_id), "quantity", 0):
+            raise CartError(f"Only {max(available[product_id], 0)} of {product.name} available.",
+                            409, product_id)
+
+    changed = False
+    for product_id, quantity in quantities.items():
+        item = items.get(product_id)
+        if item is None:
+            if quantity:
+                db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+                changed = True
+        elif not quantity or product_id not in products:
+            db.session.delete(item)
+            changed = True
+        elif item.quantity != quantity:
+            item.quantity = quantity
+            changed = True
+
+    # Build the response before committing, which would expire the loaded products
+    state = cart_state({pid: q for pid, q in quantities.items() if pid in products}, products, available)
+    if changed:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request added the same product in the meantime
+            db.session.rollback()
+            raise CartError("Your cart was changed elsewhere. Please try again.", 409) from None
+    return state
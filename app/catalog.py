@@ -0,0 +1,95 @@
+"""
+catalog.py
+
+The catalog version counter.
+A single row in `catalog_version` is incremented in the same transaction as
+any Product or Review write, except sales' stock decrements (see
+fulfillment.py). Caches of catalog data (facets, rendered pages, fragments)
+key on the version, so a bump invalidates them in every worker.
+Workers re-read the counter at most every Config.CATALOG_VERSION_TTL seconds,
+and immediately after their own commits.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import CatalogVersion, Product, Review
+
+CatalogState = namedtuple("CatalogState", ["version", "updated_at"])
+
+_lock = threading.Lock()
+_state = CatalogState(0, None)
+_checked_at = None
+
+
+def current_catalog_state():
+    """Return the (version, updated_at) of the catalog, cached for a short TTL."""
+    global _state, _checked_at
+    ttl = current_app.config["CATALOG_VERSION_TTL"]
+    checked_at = _checked_at
+    if checked_at is not None and time.monotonic() - checked_at < ttl:
+        return _state
+
+    with _lock:
+        if _checked_at is None or time.monotonic() - _checked_at >= ttl:
+            row = db.session.execute(
+                select(CatalogVersion.version, CatalogVersion.updated_at).where(CatalogVersion.id == 1)
+            ).first()
+            _state = CatalogState(row.version, row.updated_at) if row else CatalogState(0, None)
+            _checked_at = time.monotonic()
+        return _state
+
+
+def current_catalog_version():
+    """Shortcut for the integer catalog version."""
+    return current_catalog_state().version
+
+
+def bump_catalog_version(session):
+    """
+    Increment the catalog version inside the session's current transaction.
+    Call this after bulk SQL writes to products that the ORM hooks can't see;
+    it only runs once per transaction.
+    """
+    if session.info.get("catalog_bumped"):
+        return
+    session.connection().execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1)
+        .values(version=CatalogVersion.version + 1, updated_at=datetime.utcnow())
+    )
+    session.info["catalog_bumped"] = True
+
+
+def _expire_local_state():
+    global _checked_at
+    with _lock:
+        _checked_at = None
+
+
+# -------------------------------
+# Bump on Product / Review writes
+# -------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _track_catalog_changes(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, (Product, Review)) for obj in changed):
+        bump_catalog_version(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("catalog_bumped", False):
+        _expire_local_state()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("catalog_bumped", None)
@@ -0,0 +1,296 @@
+"""
+catalog_io.py
+
+Bulk catalog import and export for syncing with the ERP.
+`flask catalog import` streams a CSV or JSONL file, validates each row with
+the admin ProductForm's rules (adjusted for imports, see ProductImportForm)
+and upserts by SKU in batches, one transaction per batch, with an optional
+checkpoint file so an interrupted run can resume.
+`flask catalog export` streams every product back out in either format.
+Both run in constant memory regardless of catalog size, except that a dry
+run remembers the SKUs it has seen so repeats aren't counted as new.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+from wtforms import FloatField, IntegerField, StringField
+from wtforms.validators import DataRequired, InputRequired, Length, NumberRange, Optional, URL
+
+from . import db
+from .catalog import bump_catalog_version
+from .forms import ProductForm
+from .models import Product
+
+FIELDS = ["sku", "name", "description", "price", "image_url", "category", "stock"]
+FORMATS = ("csv", "jsonl")
+
+# Columns overwritten when an imported SKU already exists
+UPDATE_FIELDS = ["name", "description", "price", "image_url", "category", "stock"]
+
+
+def detect_format(path, fmt=None):
+    """Pick the file format from --format or the file extension."""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    raise click.UsageError(f"Cannot tell the format of '{path}'; pass --format csv or --format jsonl.")
+
+
+def read_rows(fh, fmt):
+    """
+    Yield (line_number, raw row, error) from an open CSV or JSONL file;
+    error is set (and the row None) for a line that can't be parsed.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line_number, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line), None
+            except json.JSONDecodeError as exc:
+                yield line_number, None, f"invalid JSON: {exc.msg} at column {exc.colno}"
+
+
+class ProductImportForm(ProductForm):
+    """
+    ProductForm as the import applies it: rows carry a SKU, a price or stock
+    of 0 is valid (DataRequired rejects 0), the image is optional, and text
+    must fit its column.
+    """
+    sku = StringField("SKU", validators=[DataRequired(), Length(max=64)])
+    name = StringField("Product Name", validators=[DataRequired(), Length(max=120)])
+    price = FloatField("Price", validators=[InputRequired(), NumberRange(min=0)])
+    image_url = StringField("Image URL", validators=[Optional(), URL(), Length(max=300)])
+    category = StringField("Category", validators=[Length(max=100)])
+    stock = IntegerField("Stock", validators=[InputRequired(), NumberRange(min=0)])
+
+
+class RowValidator:
+    """
+    Validates raw rows with ProductImportForm's rules.
+    One form instance is re-processed for every row; binding a fresh form
+    per row costs more than the validation itself.
+    """
+
+    def __init__(self):
+        self.form = ProductImportForm(formdata=None, meta={"csrf": False})
+
+    def __call__(self, raw):
+        """Return (values, None) for a valid row or (None, error message)."""
+        if not isinstance(raw, dict):
+            return None, f"expected a JSON object, got {type(raw).__name__}"
+        formdata = MultiDict({
+            field: "" if raw.get(field) is None else str(raw[field]).strip()
+            for field in FIELDS
+        })
+        form = self.form
+        form.process(formdata)
+        if not form.validate():
+            return None, "; ".join(f"{name}: {' '.join(errors)}" for name, errors in form.errors.items())
+        return {
+            "sku": form.sku.data,
+            "name": form.name.data,
+            "description": form.description.data or None,
+            "price": form.price.data,
+            "image_url": form.image_url.data or None,
+            "category": form.category.data or None,
+            "stock": form.stock.data,
+        }, None
+
+
+def _upsert_statement():
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise click.ClickException(f"Catalog import does not support the '{dialect}' database.")
+    stmt = insert(Product)
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={**{field: stmt.excluded[field] for field in UPDATE_FIELDS},
+              "version": Product.version + 1, "updated_at": datetime.utcnow()},
+    )
+
+
+def write_batch(batch):
+    """Upsert one batch of validated rows and commit it as one transaction."""
+    # A SKU repeated within a batch would hit the same row twice in one statement
+    rows = list({row["sku"]: row for row in batch}.values())
+    db.session.execute(_upsert_statement(), rows)
+    bump_catalog_version(db.session)
+    db.session.commit()
+
+
+def count_existing(skus):
+    """How many of these SKUs are already in the catalog."""
+    return db.session.scalar(
+        select(db.func.count()).select_from(Product).where(Product.sku.in_(skus))
+    )
+
+
+# -------------------------------
+# Checkpoints
+# -------------------------------
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(checkpoint_path, source_path):
+    """Number of source rows already committed by an earlier run of this file, else 0."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as fh:
+        state = json.load(fh)
+    if {key: state.get(key) for key in ("source", "size", "mtime")} != _source_signature(source_path):
+        raise click.ClickException(
+            f"Checkpoint {checkpoint_path} belongs to a different or modified file; delete it to start over."
+        )
+    return state["rows"]
+
+
+def save_checkpoint(checkpoint_path, source_path, rows):
+    """Record that the first `rows` source rows are committed (atomic replace)."""
+    state = dict(_source_signature(source_path), rows=rows)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp_path, checkpoint_path)
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+
+catalog_cli = AppGroup("catalog", help="Bulk import and export the product catalog.")
+
+
+@catalog_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per transaction.")
+@click.option("--dry-run", is_flag=True, help="Validate and count changes without writing.")
+@click.option("--checkpoint", type=click.Path(dir_okay=False),
+              help="Progress file; an interrupted import resumes from it.")
+@click.option("--max-errors", default=100, show_default=True,
+              help="Abort after this many invalid rows (0 for no limit).")
+def import_command(path, fmt, batch_size, dry_run, checkpoint, max_errors):
+    """Upsert products by SKU from a CSV or JSONL file."""
+    fmt = detect_format(path, fmt)
+    skip = 0 if dry_run else load_checkpoint(checkpoint, path)
+    if skip:
+        click.echo(f"Resuming after row {skip} from {checkpoint}.")
+
+    processed = skip
+    valid = invalid = existing = repeated = 0
+    # Dry run only: a SKU seen earlier in the file is an update by the time the real run reaches it
+    seen_skus = set()
+    batch = []
+    validate_row = RowValidator()
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal existing, repeated
+        if dry_run:
+            skus = {row["sku"] for row in batch} - seen_skus
+            repeated += len(batch) - len(skus)
+            seen_skus.update(skus)
+            existing += count_existing(skus)
+        else:
+            write_batch(batch)
+            if checkpoint:
+                save_checkpoint(checkpoint, path, processed)
+        batch.clear()
+        elapsed = time.perf_counter() - started
+        click.echo(f"{processed} rows ({(processed - skip) / elapsed:.0f} rows/s)", err=True)
+
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row_number, (line_number, raw, error) in enumerate(read_rows(fh, fmt), start=1):
+            if row_number <= skip:
+                continue
+            processed = row_number
+            if not error:
+                values, error = validate_row(raw)
+            if error:
+                invalid += 1
+                click.echo(f"line {line_number}: {error}", err=True)
+                if max_errors and invalid >= max_errors:
+                    if batch and not dry_run:
+                        flush()
+                    raise click.ClickException(f"Stopped after {invalid} invalid rows.")
+                continue
+            valid += 1
+            batch.append(values)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    if checkpoint and not dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    elapsed = time.perf_counter() - started
+    rate = (processed - skip) / elapsed if elapsed else 0
+    if dry_run:
+        click.echo(f"Dry run: {valid} valid rows ({valid - existing - repeated} new, {existing} existing SKUs, "
+                   f"{repeated} repeating an earlier row), {invalid} invalid, {rate:.0f} rows/s.")
+    else:
+        click.echo(f"Imported {valid} rows, {invalid} invalid, in {elapsed:.1f}s ({rate:.0f} rows/s).")
+    if invalid:
+        sys.exit(1)
+
+
+@catalog_cli.command("export")
+@click.argument("path", default="-")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension, or CSV.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows fetched per round trip.")
+def export_command(path, fmt, batch_size):
+    """Stream every product to a CSV or JSONL file (or stdout with '-')."""
+    if path == "-":
+        fmt = fmt or "csv"
+    else:
+        fmt = detect_format(path, fmt)
+
+    columns = [getattr(Product, field) for field in FIELDS]
+    query = select(*columns).order_by(Product.id).execution_options(yield_per=batch_size)
+
+    fh = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    count = 0
+    started = time.perf_counter()
+    try:
+        writer = csv.writer(fh) if fmt == "csv" else None
+        if writer:
+            writer.writerow(FIELDS)
+        for row in db.session.execute(query):
+            if writer:
+                writer.writerow(["" if value is None else value for value in row])
+            else:
+                fh.write(json.dumps(dict(zip(FIELDS, row))) + "\n")
+            count += 1
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    click.echo(f"Exported {count} products in {elapsed:.1f}s ({rate:.0f} rows/s).", err=True)
@@ -1,5 +1,16 @@
 # context_processors.py
 from datetime import datetime
 
+from flask_wtf.csrf import generate_csrf
+
+from .images import product_image_urls
+
 def inject_current_year():
     return {'current_year': datetime.now().year}
+
+def inject_image_helpers():
+    return {'product_image_urls': product_image_urls}
+
+def inject_csrf_token():
+    # Called lazily, so pages that don't render the meta tag never touch the session
+    return {'csrf_token': generate_csrf}
@@ -0,0 +1,110 @@
+"""
+database.py
+
+Database engine tuning and read-replica routing.
+Applies WAL mode and the other SQLite pragmas from Config on every new
+connection, and routes SELECTs issued by read-only views (marked with
+@use_replica) to the optional replica engine. Writes, flushes and anything
+outside those views always go to the primary.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event
+
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(BaseSession):
+    """Session that sends reads from replica-enabled views to the replica engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and getattr(clause, "is_select", False)
+            and _reads_from_replica()
+        ):
+            return current_app.extensions["sqlalchemy"].engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reads_from_replica():
+    if not has_request_context() or not g.get("use_replica"):
+        return False
+    if REPLICA_BIND not in current_app.extensions["sqlalchemy"].engines:
+        return False
+    # Read-your-writes: stay on the primary for a moment after this user wrote
+    return session.get("primary_until", 0) < time.time()
+
+
+def use_replica(view):
+    """Let GET requests to this view read from the replica, if one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = request.method == "GET"
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def stick_to_primary():
+    """Pin this browser session's reads to the primary for REPLICA_STICKY_SECONDS."""
+    if current_app.config["SQLALCHEMY_BINDS"].get(REPLICA_BIND):
+        session["primary_until"] = time.time() + current_app.config["REPLICA_STICKY_SECONDS"]
+
+
+def _set_sqlite_pragmas(app):
+    config = app.config
+    pragmas = {
+        "busy_timeout": config["SQLITE_BUSY_TIMEOUT_MS"],
+        "synchronous": config["SQLITE_SYNCHRONOUS"],
+        "mmap_size": config["SQLITE_MMAP_SIZE"],
+    }
+    if config["SQLITE_WAL"]:
+        # Readers no longer block behind the single writer
+        pragmas = {"journal_mode": "WAL", **pragmas}
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return on_connect
+
+
+def configure_engines(app, db):
+    """Attach per-connection tuning to every engine the app uses."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _set_sqlite_pragmas(app))
+
+
+def _on_flush(db_session, flush_context):
+    db_session.info["wrote"] = True
+
+
+def _on_execute(orm_execute_state):
+    # Bulk UPDATE/DELETE/INSERT statements bypass the flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+def _on_commit(db_session):
+    # A commit made while serving a request makes the replica briefly stale for this user
+    if db_session.info.pop("wrote", False) and has_request_context():
+        stick_to_primary()
+
+
+def _on_rollback(db_session):
+    db_session.info.pop("wrote", None)
+
+
+event.listen(RoutingSession, "after_flush", _on_flush)
+event.listen(RoutingSession, "do_orm_execute", _on_execute)
+event.listen(RoutingSession, "after_commit", _on_commit)
+event.listen(RoutingSession, "after_rollback", _on_rollback)
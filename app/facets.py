@@ -0,0 +1,64 @@
+"""
+facets.py
+
+Cached category facets for the catalog homepage.
+Holds every category with its product count and in-stock count so index()
+can fill the category dropdown without querying the product table.
+The cache is rebuilt with a single GROUP BY query whenever the catalog
+version changes (see catalog.py), in every worker process. Sales don't
+change the version, so the in-stock counts are also re-read once they are
+STOCK_DISPLAY_TTL seconds old.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import case, func
+
+from . import db
+from .catalog import current_catalog_version
+from .models import Product
+
+CategoryFacet = namedtuple("CategoryFacet", ["name", "product_count", "in_stock_count"])
+
+_lock = threading.Lock()
+_facets = None
+_facets_version = None
+_loaded_at = None
+
+
+def _load_facets():
+    rows = (
+        db.session.query(
+            Product.category,
+            func.count(Product.id),
+            func.sum(case((Product.stock > 0, 1), else_=0)),
+        )
+        .filter(Product.category.isnot(None), Product.category != "")
+        .group_by(Product.category)
+        .order_by(Product.category)
+        .all()
+    )
+    return [CategoryFacet(name, count, in_stock or 0) for name, count, in_stock in rows]
+
+
+def get_category_facets():
+    """Return the cached list of CategoryFacet tuples, rebuilding it if stale."""
+    global _facets, _facets_version, _loaded_at
+    version = current_catalog_version()
+    ttl = current_app.config["STOCK_DISPLAY_TTL"]
+
+    def fresh():
+        return _facets_version == version and time.monotonic() - _loaded_at < ttl
+
+    if fresh():
+        return _facets
+
+    with _lock:
+        if not fresh():
+            _facets = _load_facets()
+            _facets_version = version
+            _loaded_at = time.monotonic()
+        return _facets
@@ -0,0 +1,148 @@
+"""
+fulfillment.py
+
+Turns a paid checkout into an Order in one atomic transaction.
+Paid checkouts are fulfilled from the job queue after Stripe confirms payment
+via webhook, from the stock holds the checkout took: they record exactly the
+lines, quantities and prices the buyer was charged for, whatever happened to
+the cart or the catalog since. Stock is decremented with conditional UPDATEs
+(stock = stock - q WHERE what other checkouts haven't held still covers q),
+so concurrent checkouts can never oversell: if any line can't be satisfied
+the whole transaction is rolled back and nothing is written. The checkout's
+own holds are released in the same transaction, which turns them into the
+decrement. A sale does not bump the catalog version: pages and facets that
+show stock are refreshed within STOCK_DISPLAY_TTL seconds instead, so
+checkout traffic doesn't flush the catalog caches in every worker.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+
+from . import db
+from .analytics import record_order
+from .jobs import PermanentJobError, job_handler
+from .models import CartItem, Order, OrderItem, Product, StockHold
+from .reservations import OutOfStockError, held_quantity, release
+
+# Product fields snapshotted into OrderItem; derivatives built from an older
+# image_url would show the wrong picture, so their key is dropped
+_PRODUCT_SNAPSHOT = (
+    Product.category,
+    Product.image_url,
+    case((Product.image_source == Product.image_url, Product.image_key)).label("image_key"),
+    case((Product.image_source == Product.image_url, Product.image_width)).label("image_width"),
+)
+
+
+def fulfill_checkout(user_id, checkout_key, commit=True):
+    """
+    Create the Order for a paid checkout from the holds taken under
+    `checkout_key`, at the held quantities and prices, and take the bought
+    units out of the user's cart. Returns the new Order, or None if the
+    checkout has no holds (already fulfilled, released or swept).
+    Raises OutOfStockError (after rolling back) if any line can't be filled.
+    With commit=False the caller owns the transaction and must commit it.
+    """
+    lines = db.session.execute(
+        select(StockHold.product_id, StockHold.quantity,
+               # Holds taken before the snapshot columns existed fall back to the catalog
+               func.coalesce(StockHold.unit_price, Product.price).label("price"),
+               func.coalesce(StockHold.product_name, Product.name).label("name"),
+               *_PRODUCT_SNAPSHOT)
+        .join(Product, Product.id == StockHold.product_id)
+        .where(StockHold.checkout_key == checkout_key, StockHold.user_id == user_id)
+        .order_by(StockHold.product_id)
+    ).all()
+    if not lines:
+        return None
+
+    def remove_bought_units():
+        # Units added to the cart after checkout weren't paid for; they stay in the cart
+        cart = CartItem.__table__
+        # Core executemany: one statement, one parameter set per line
+        db.session.connection().execute(
+            update(cart)
+            .where(cart.c.user_id == bindparam("uid"), cart.c.product_id == bindparam("pid"))
+            .values(quantity=cart.c.quantity - bindparam("bought")),
+            [{"uid": user_id, "pid": line.product_id, "bought": line.quantity} for line in lines],
+        )
+        db.session.execute(
+            delete(CartItem).where(CartItem.user_id == user_id, CartItem.quantity <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+    return _place_order(user_id, lines, checkout_key, remove_bought_units, commit)
+
+
+def _place_order(user_id, lines, checkout_key, clear_cart, commit):
+    """
+    Decrement stock for `lines` and write the Order, its items and rollups.
+    Stock held for `checkout_key` counts as available and the holds are released.
+    """
+    now = datetime.utcnow()
+    try:
+        for line in lines:
+            result = db.session.execute(
+                update(Product)
+                .where(Product.id == line.product_id,
+                       Product.stock - held_quantity(Product.id, now, exclude_key=checkout_key)
+                       >= line.quantity)
+                # Only stock changes. Keeping version and updated_at leaves the cached
+                # product cards and every worker's autocomplete index alone.
+                .values(stock=Product.stock - line.quantity,
+                        version=Product.version, updated_at=Product.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                raise OutOfStockError(line.name)
+
+        order = Order(user_id=user_id, total_amount=sum(line.price * line.quantity for line in lines))
+        db.session.add(order)
+        db.session.flush()
+
+        db.session.execute(insert(OrderItem), [
+            {
+                "order_id": order.id,
+                "product_id": line.product_id,
+                "quantity": line.quantity,
+                "unit_price": line.price,
+                "product_name": line.name,
+                "image_url": line.image_url,
+                "image_key": line.image_key,
+                "image_width": line.image_width,
+            }
+            for line in lines
+        ])
+        clear_cart()
+        release(checkout_key, commit=False)
+        # The dashboard's rollups commit (or roll back) together with the order
+        record_order(order.id, order.timestamp.date(),
+                     [(line.product_id, line.category, line.quantity, line.price) for line in lines])
+        if commit:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return order
+
+
+@job_handler("fulfill_order")
+def fulfill_order_job(payload):
+    """
+    Job handler queued by the Stripe webhook once a checkout session is paid.
+    Runs in the job's transaction, so the order and the job status commit together.
+    A paid checkout that can't be turned into an order fails the job, so it
+    shows up as failed (to the buyer and in `flask jobs status`) instead of done.
+    """
+    hold_key = payload.get("hold_key")
+    if not hold_key:
+        raise PermanentJobError(f"Checkout session {payload.get('checkout_session_id')} has no hold key.")
+    try:
+        order = fulfill_checkout(payload["user_id"], hold_key, commit=False)
+    except OutOfStockError as exc:
+        raise PermanentJobError(str(exc))
+    if order is None:
+        raise PermanentJobError(f"No stock holds left for checkout session {payload.get('checkout_session_id')}.")
+    return {"order_id": order.id}
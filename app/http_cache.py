@@ -0,0 +1,144 @@
+"""
+http_cache.py
+
+Rendered-page cache and conditional GET support for anonymous catalog pages.
+Responses are keyed by endpoint, view arguments and the query arguments the
+view renders from, as normalized by the view's own `key_args` helper (so two
+URLs share an entry only if they render the same page), and tagged with the
+catalog version, so any product or review write invalidates them everywhere.
+Pages that show stock also expire after STOCK_DISPLAY_TTL seconds, since
+sales don't change the catalog version. Entries live in an LRU bounded by
+both entry count and total body size.
+Every cached page carries an ETag and Last-Modified header and answers
+matching conditional requests with 304.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from .catalog import current_catalog_state
+
+CachedPage = namedtuple("CachedPage", ["body", "mimetype", "etag", "version", "last_modified", "stored_at"])
+
+
+class PageCache:
+    """Thread-safe LRU of rendered pages, bounded by entries and bytes."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version, max_age=None):
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                return None
+            if page.version != version or (max_age is not None and time.monotonic() - page.stored_at >= max_age):
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def put(self, key, page, max_entries, max_bytes):
+        if len(page.body) > max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = page
+            self._size += len(page.body)
+            while self._entries and (len(self._entries) > max_entries or self._size > max_bytes):
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        page = self._entries.pop(key, None)
+        if page is not None:
+            self._size -= len(page.body)
+
+
+page_cache = PageCache()
+
+
+def cache_key(key_args):
+    """Build the cache key for the current request from the view's normalized arguments."""
+    args = tuple(sorted((name, value) for name, value in key_args().items() if value))
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return (request.endpoint, view_args, args)
+
+
+def _is_cacheable_request():
+    # Anonymous visitors only, and never while a flash message is waiting to be shown
+    return (
+        request.method == "GET"
+        and not current_user.is_authenticated
+        and "_flashes" not in session
+    )
+
+
+def _conditional(page):
+    response = make_response(page.body)
+    response.mimetype = page.mimetype
+    response.set_etag(page.etag)
+    if page.last_modified is not None:
+        response.last_modified = page.last_modified
+    # Browsers may keep the page but must revalidate; logged-in users see different HTML
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+def cache_anonymous_page(key_args, shows_stock=False):
+    """
+    Serve anonymous GETs of a catalog view from the page cache.
+    `key_args()` must return every query argument the view renders from,
+    normalized exactly as the view uses it; nothing else goes into the key.
+    Pass shows_stock=True for views that render stock levels.
+    """
+    def decorator(view):
+        return _cached_view(view, key_args, shows_stock)
+    return decorator
+
+
+def _cached_view(view, key_args, shows_stock):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _is_cacheable_request():
+            return view(*args, **kwargs)
+
+        state = current_catalog_state()
+        key = cache_key(key_args)
+        config = current_app.config
+        page = page_cache.get(key, state.version, config["STOCK_DISPLAY_TTL"] if shows_stock else None)
+        if page is not None:
+            return _conditional(page)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        body = response.get_data()
+        page = CachedPage(
+            body=body,
+            mimetype=response.mimetype,
+            etag=f"{state.version}-{hashlib.sha1(body).hexdigest()[:16]}",
+            version=state.version,
+            last_modified=state.updated_at,
+            stored_at=time.monotonic(),
+        )
+        page_cache.put(key, page, config["PAGE_CACHE_MAX_ENTRIES"], config["PAGE_CACHE_MAX_BYTES"])
+        return _conditional(page)
+
+    return wrapper
@@ -0,0 +1,136 @@
+"""
+identity.py
+
+Cached identity for flask_login's user_loader.
+Authenticated requests get a lightweight, detached UserSnapshot (id, email,
+is_admin) from a per-process LRU with a short TTL instead of loading the
+full User row. Routes that need the row itself use `current_user.record`
+(or any other User attribute, which loads it on first access). Committed
+changes to a User invalidate that user's cache entry.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import User
+
+
+class UserSnapshot(UserMixin):
+    """The identity fields flask_login and the templates need on every request."""
+
+    __slots__ = ("id", "email", "is_admin")
+
+    def __init__(self, id, email, is_admin):
+        self.id = id
+        self.email = email
+        self.is_admin = bool(is_admin)
+
+    @property
+    def record(self):
+        """The full User row, loaded once per request on first use."""
+        records = g.setdefault("user_records", {})
+        if self.id not in records:
+            records[self.id] = db.session.get(User, self.id)
+        return records[self.id]
+
+    def __getattr__(self, name):
+        # Anything beyond the snapshot (address, relationships, ...) comes from the row
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.record, name)
+
+    def __setattr__(self, name, value):
+        if name in self.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.record, name, value)
+
+
+class IdentityCache:
+    """Thread-safe LRU of user snapshots with a per-entry TTL."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, ttl):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            snapshot, stored_at = entry
+            if time.monotonic() - stored_at >= ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def put(self, user_id, snapshot, max_entries):
+        with self._lock:
+            self._entries[user_id] = (snapshot, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def load_identity(user_id):
+    """Return the UserSnapshot for `user_id`, or None if the user no longer exists."""
+    config = current_app.config
+    snapshot = identity_cache.get(user_id, config["IDENTITY_CACHE_TTL"])
+    if snapshot is not None:
+        return snapshot
+
+    row = db.session.execute(
+        select(User.id, User.email, User.is_admin).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    snapshot = UserSnapshot(row.id, row.email, row.is_admin)
+    identity_cache.put(user_id, snapshot, config["IDENTITY_CACHE_SIZE"])
+    return snapshot
+
+
+def invalidate_identity(user_id):
+    """Drop a user's cached snapshot; call after bulk SQL writes the ORM hooks can't see."""
+    identity_cache.discard(user_id)
+
+
+# -------------------------------
+# Invalidate on User writes
+# -------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _track_user_changes(session, flush_context):
+    changed = session.dirty | session.deleted
+    user_ids = {obj.id for obj in changed if isinstance(obj, User)}
+    if user_ids:
+        session.info.setdefault("changed_user_ids", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_identity(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changed_user_ids", None)
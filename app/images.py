@@ -0,0 +1,239 @@
+"""
+images.py
+
+Product image derivatives.
+`flask images process` downloads each product's image_url once and renders
+resized WebP and JPEG variants (thumb, card, detail) in a process pool.
+Files are stored under IMAGE_STORAGE_DIR with names derived from a hash of
+the source bytes, so they can be served with immutable cache headers and a
+changed image always gets new URLs. Only products whose image_url changed
+since the last run are processed again (or, with --recheck, whose image
+content changed). Templates use `product_image_urls` to build srcsets.
+An image_url that isn't http(s) is read as a path under IMAGE_SOURCE_DIR;
+without that setting, local paths are rejected.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from sqlalchemy import or_, select, union, update
+
+from . import db
+from .catalog import bump_catalog_version
+from .models import OrderItem, Product
+
+# Variant name -> maximum width in pixels (never upscaled)
+VARIANTS = {"thumb": 200, "card": 480, "detail": 1200}
+
+# File extension -> (Pillow format, save options)
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Bump when VARIANTS or FORMATS change so every image gets regenerated under new names
+PIPELINE_VERSION = b"2"
+
+
+def derivative_path(key, variant, ext):
+    """Path of one derivative, relative to IMAGE_STORAGE_DIR."""
+    return f"{key[:2]}/{key}-{variant}.{ext}"
+
+
+def product_image_urls(product):
+    """
+    URLs of a product's derivatives, or None if they are missing or stale.
+    Returns {"thumb": ..., "card": ..., "detail": ...} JPEG URLs plus
+    "webp_srcset" and "jpeg_srcset" strings. The srcsets list each width
+    once, as actually rendered: a narrow source gives fewer candidates.
+    """
+    key = product.image_key
+    if not key or product.image_source != product.image_url or not product.image_width:
+        return None
+    urls = {}
+    for ext in FORMATS:
+        candidates = {}
+        for variant, max_width in VARIANTS.items():
+            url = url_for("main_bp.media", filename=derivative_path(key, variant, ext))
+            candidates.setdefault(min(product.image_width, max_width), url)
+            if ext == "jpg":
+                urls[variant] = url
+        candidates = [f"{url} {width}w" for width, url in candidates.items()]
+        urls[f"{'jpeg' if ext == 'jpg' else ext}_srcset"] = ", ".join(candidates)
+    return urls
+
+
+# -------------------------------
+# Work done in the pool processes
+# -------------------------------
+
+def _read_source(source, source_dir, timeout, max_bytes):
+    if source.startswith(("http://", "https://")):
+        request = urllib.request.Request(source, headers={"User-Agent": "ShopNow image pipeline"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    else:
+        # An image_url is catalog data, so it may only name files under IMAGE_SOURCE_DIR
+        if not source_dir:
+            raise ValueError("local image paths are disabled (set IMAGE_SOURCE_DIR)")
+        root = os.path.realpath(source_dir)
+        path = os.path.realpath(os.path.join(root, source))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("image path is outside IMAGE_SOURCE_DIR")
+        with open(path, "rb") as fh:
+            data = fh.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"image is larger than {max_bytes} bytes")
+    return data
+
+
+def render_derivatives(product_id, source, source_dir, storage_dir, known_key, timeout, max_bytes):
+    """
+    Fetch one source image and write its derivatives.
+    Returns (product_id, key, width, generated, error); `width` is the
+    upright source width, and `generated` is False when the content hash
+    matched `known_key` and the files already existed.
+    """
+    from PIL import ExifTags, Image, ImageOps  # Only the pool processes need Pillow
+
+    try:
+        data = _read_source(source, source_dir, timeout, max_bytes)
+        key = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()[:24]
+        paths = {(variant, ext): os.path.join(storage_dir, derivative_path(key, variant, ext))
+                 for variant in VARIANTS for ext in FORMATS}
+        with Image.open(io.BytesIO(data)) as original:
+            if key == known_key and all(os.path.exists(path) for path in paths.values()):
+                # Read from the header; orientations 5-8 are turned a quarter
+                rotated = original.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+                return product_id, key, original.height if rotated else original.width, False, None
+            image = ImageOps.exif_transpose(original).convert("RGB")
+
+        os.makedirs(os.path.dirname(next(iter(paths.values()))), exist_ok=True)
+        for (variant, ext), path in paths.items():
+            resized = image
+            width = min(image.width, VARIANTS[variant])
+            if width < image.width:
+                # Exactly `width` wide, as the srcset says
+                resized = image.resize((width, max(1, round(image.height * width / image.width))),
+                                       Image.Resampling.LANCZOS, reducing_gap=2.0)
+            pil_format, options = FORMATS[ext]
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            resized.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, path)
+        return product_id, key, image.width, True, None
+    except Exception as exc:  # one bad image must not stop the batch
+        return product_id, None, None, False, f"{type(exc).__name__}: {exc}"
+
+
+# -------------------------------
+# Orchestration
+# -------------------------------
+
+def pending_products(recheck=False):
+    """Products with an image whose derivatives are missing, built from another URL, or of unknown width."""
+    query = (select(Product.id, Product.image_url, Product.image_key, Product.image_width)
+             .where(Product.image_url.isnot(None)))
+    if not recheck:
+        query = query.where(or_(Product.image_source.is_(None), Product.image_source != Product.image_url,
+                                Product.image_width.is_(None)))
+    return db.session.execute(query.order_by(Product.id)).all()
+
+
+def process_images(rows, workers, log=click.echo, batch_size=200):
+    """Render derivatives for `rows` in a process pool and record them; returns counts."""
+    config = current_app.config
+    storage_dir = config["IMAGE_STORAGE_DIR"]
+    counts = {"generated": 0, "unchanged": 0, "failed": 0}
+    updates = []
+
+    def save():
+        if updates:
+            db.session.execute(update(Product), updates)
+            bump_catalog_version(db.session)
+            db.session.commit()
+            updates.clear()
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(render_derivatives, row.id, row.image_url, config["IMAGE_SOURCE_DIR"], storage_dir,
+                        row.image_key, config["IMAGE_FETCH_TIMEOUT"], config["IMAGE_MAX_BYTES"])
+            for row in rows
+        ]
+        sources = {row.id: row.image_url for row in rows}
+        for future in as_completed(futures):
+            product_id, key, width, generated, error = future.result()
+            if error:
+                counts["failed"] += 1
+                log(f"product {product_id}: {error}", err=True)
+                continue
+            counts["generated" if generated else "unchanged"] += 1
+            updates.append({"id": product_id, "image_key": key, "image_source": sources[product_id],
+                            "image_width": width})
+            if len(updates) >= batch_size:
+                save()
+    save()
+
+    if any(row.image_width is None for row in rows):
+        # Order lines snapshotted before widths were recorded take them from the same image
+        db.session.execute(
+            update(OrderItem)
+            .where(OrderItem.image_width.is_(None), OrderItem.image_key.isnot(None))
+            .values(image_width=select(Product.image_width)
+                    .where(Product.id == OrderItem.product_id, Product.image_url == OrderItem.image_url)
+                    .scalar_subquery())
+        )
+        db.session.commit()
+    return counts
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+
+images_cli = AppGroup("images", help="Build and clean up product image derivatives.")
+
+
+@images_cli.command("process")
+@click.option("--workers", default=None, type=int, help="Processes to use (default IMAGE_WORKERS).")
+@click.option("--recheck", is_flag=True,
+              help="Re-download every image and regenerate the ones whose content changed.")
+def process_command(workers, recheck):
+    """Generate derivatives for new or changed product images."""
+    rows = pending_products(recheck)
+    if not rows:
+        click.echo("All product images are up to date.")
+        return
+    workers = workers or current_app.config["IMAGE_WORKERS"]
+    click.echo(f"Processing {len(rows)} image(s) with {workers} worker(s)...")
+    counts = process_images(rows, workers)
+    click.echo(f"{counts['generated']} generated, {counts['unchanged']} unchanged, {counts['failed']} failed.")
+
+
+@images_cli.command("prune")
+@click.option("--dry-run", is_flag=True, help="Only list the files that would be deleted.")
+def prune_command(dry_run):
+    """Delete derivative files no product or past order refers to any more."""
+    storage_dir = current_app.config["IMAGE_STORAGE_DIR"]
+    # Order history shows the image a buyer saw, so its keys are kept as well
+    keys = set(db.session.scalars(
+        union(select(Product.image_key).where(Product.image_key.isnot(None)),
+              select(OrderItem.image_key).where(OrderItem.image_key.isnot(None)))
+    ))
+    removed = 0
+    for directory, _, filenames in os.walk(storage_dir):
+        for filename in filenames:
+            if filename.split("-", 1)[0] not in keys:
+                path = os.path.join(directory, filename)
+                if dry_run:
+                    click.echo(path)
+                else:
+                    os.remove(path)
+                removed += 1
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {removed} file(s).")
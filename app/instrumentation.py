@@ -0,0 +1,191 @@
+"""
+instrumentation.py
+
+Opt-in per-request SQL and template instrumentation.
+When SQL_INSTRUMENTATION is enabled, every request records its query count,
+total DB time and template render time, flags statements repeated often
+enough to look like N+1 lazy loads, adds a Server-Timing header and logs
+slow requests and slow queries. `max_queries` and `assert_max_queries`
+reuse the same counters to pin a route's query budget in tests.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import before_render_template, current_app, g, request, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Every collector active in the current context (a request and/or a test helper)
+_collectors = ContextVar("sql_collectors", default=())
+
+# Expanded IN lists differ only in their number of placeholders
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Normalize a SQL string so executions that differ only in parameters compare equal."""
+    return _IN_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """Queries and timings collected for one request or one `max_queries` block."""
+
+    def __init__(self, slow_query_seconds=None):
+        self.slow_query_seconds = slow_query_seconds
+        self.count = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.shapes = Counter()
+        self.slow_queries = []
+
+    def record(self, statement, seconds):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.db_seconds += seconds
+        self.shapes[shape] += 1
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            self.slow_queries.append((shape, seconds))
+
+    def n_plus_one_suspects(self, threshold):
+        """Statement shapes executed at least `threshold` times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def collect_queries():
+    """Collect every statement executed in this context into a fresh QueryStats."""
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+# -------------------------------
+# SQLAlchemy engine events
+# -------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _collectors.get()
+    if not collectors:
+        return
+    seconds = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    for stats in collectors:
+        stats.record(statement, seconds)
+
+
+def _listen(engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _listen_all():
+    for engine in current_app.extensions["sqlalchemy"].engines.values():
+        _listen(engine)
+
+
+# -------------------------------
+# Template render timing
+# -------------------------------
+
+def _template_started(app, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+def _template_finished(app, template, context, **extra):
+    started = g.pop("template_started", None)
+    stats = g.get("query_stats")
+    if started is not None and stats is not None:
+        stats.template_seconds += time.perf_counter() - started
+
+
+# -------------------------------
+# Request hooks
+# -------------------------------
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_stats = QueryStats(current_app.config["SLOW_QUERY_MS"] / 1000)
+    g.query_stats_token = _collectors.set(_collectors.get() + (g.query_stats,))
+
+
+def _finish_request(response):
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    db_ms = stats.db_seconds * 1000
+    template_ms = stats.template_seconds * 1000
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={db_ms:.1f};desc="{stats.count} queries", '
+        f"tpl;dur={template_ms:.1f}, total;dur={total_ms:.1f}",
+    )
+
+    config = current_app.config
+    suspects = stats.n_plus_one_suspects(config["N_PLUS_ONE_THRESHOLD"])
+    for shape, seconds in stats.slow_queries:
+        logger.warning("Slow query (%.1f ms) on %s: %s", seconds * 1000, _describe_request(), shape)
+    for shape, n in suspects:
+        logger.warning("Possible N+1 on %s: %d x %s", _describe_request(), n, shape)
+    if total_ms >= config["SLOW_REQUEST_MS"]:
+        logger.warning("Slow request %s: %.1f ms total, %d queries in %.1f ms, templates %.1f ms",
+                       _describe_request(), total_ms, stats.count, db_ms, template_ms)
+    return response
+
+
+def _teardown_request(exc):
+    token = g.pop("query_stats_token", None)
+    if token is not None:
+        _collectors.reset(token)
+
+
+def _describe_request():
+    return f"{request.method} {request.full_path.rstrip('?')}"
+
+
+def init_instrumentation(app):
+    """Install the request hooks and engine listeners if SQL_INSTRUMENTATION is on."""
+    if not app.config["SQL_INSTRUMENTATION"]:
+        return
+    with app.app_context():
+        _listen_all()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+
+# -------------------------------
+# Test helpers
+# -------------------------------
+
+@contextmanager
+def max_queries(limit):
+    """Fail with the executed statements if the block runs more than `limit` queries."""
+    _listen_all()
+    with collect_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "\n".join(f"  {n} x {shape}" for shape, n in stats.shapes.most_common())
+        raise AssertionError(f"Expected at most {limit} queries, got {stats.count}:\n{listing}")
+
+
+def assert_max_queries(client, path, limit, method="GET", **kwargs):
+    """Request `path` with a Flask test client and assert its query budget; returns the response."""
+    with client.application.app_context(), max_queries(limit):
+        return client.open(path, method=method, **kwargs)
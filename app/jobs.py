@@ -0,0 +1,186 @@
+"""
+jobs.py
+
+A small persistent job queue backed by the `job` table.
+Jobs are enqueued with an idempotency key (enqueueing the same key twice is a
+no-op), claimed atomically by worker threads with a conditional UPDATE, and
+retried with exponential backoff until Config.JOB_MAX_ATTEMPTS is reached.
+Run workers with `flask jobs work`; start the command several times to use
+more processes.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Job
+from .reservations import start_sweeper
+
+logger = logging.getLogger(__name__)
+
+# Registered handlers: job kind -> callable(payload) returning a JSON-able result
+_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job can never succeed."""
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of the given kind."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, key, payload=None):
+    """
+    Add a job unless one with the same idempotency key already exists.
+    Returns the (new or existing) Job.
+    """
+    job = Job(kind=kind, key=key, payload=payload or {})
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        job = Job.query.filter_by(key=key).one()
+    return job
+
+
+def claim_next_job():
+    """
+    Atomically move one runnable job to 'running' and return it.
+    Jobs whose worker died (lock older than JOB_LOCK_TIMEOUT) are reclaimed.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT"])
+    runnable = or_(
+        (Job.status == "pending") & (Job.run_after <= now),
+        (Job.status == "running") & (Job.locked_at < stale),
+    )
+
+    candidate = db.session.execute(
+        select(Job.id, Job.status).where(runnable).order_by(Job.run_after, Job.id).limit(1)
+    ).first()
+    if candidate is None:
+        db.session.rollback()
+        return None
+
+    # Only one worker can win the row: the status must still be what we read
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate.id, Job.status == candidate.status, runnable)
+        .values(status="running", locked_at=now, attempts=Job.attempts + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        return None
+    return db.session.get(Job, candidate.id)
+
+
+def run_job(job):
+    """
+    Execute a claimed job. The handler's writes and the job's status change
+    are committed together, so a crash can never record work twice.
+    """
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise PermanentJobError(f"No handler registered for job kind '{job.kind}'.")
+        job.result = handler(job.payload)
+        job.status = "done"
+        job.last_error = None
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = f"{type(exc).__name__}: {exc}"[:500]
+        if isinstance(exc, PermanentJobError) or job.attempts >= current_app.config["JOB_MAX_ATTEMPTS"]:
+            job.status = "failed"
+            logger.error("Job %s (%s) failed permanently: %s", job.id, job.kind, job.last_error)
+        else:
+            job.status = "pending"
+            job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+            logger.warning("Job %s (%s) failed, retrying: %s", job.id, job.kind, job.last_error)
+    job.locked_at = None
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def work(app, stop_event, poll_interval):
+    """Worker loop: claim and run jobs until stop_event is set."""
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                job = claim_next_job()
+                if job is not None:
+                    run_job(job)
+            except Exception:
+                logger.exception("Job worker error")
+                db.session.rollback()
+                job = None
+            finally:
+                db.session.remove()
+        if job is None:
+            stop_event.wait(poll_interval)
+
+
+def start_workers(app, threads):
+    """Start `threads` daemon worker threads; returns (threads, stop_event)."""
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(
+            target=work, args=(app, stop_event, app.config["JOB_POLL_INTERVAL"]),
+            name=f"job-worker-{n}", daemon=True,
+        )
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers, stop_event
+
+
+# -------------------------------
+# CLI: flask jobs work
+# -------------------------------
+
+jobs_cli = AppGroup("jobs", help="Run and inspect background jobs.")
+
+
+@jobs_cli.command("work")
+@click.option("--threads", default=None, type=int, help="Worker threads in this process.")
+def work_command(threads):
+    """Process queued jobs until interrupted."""
+    app = current_app._get_current_object()
+    threads = threads or app.config["JOB_WORKER_THREADS"]
+    workers, stop_event = start_workers(app, threads)
+    # Expired checkout stock holds are cleared from the same process
+    workers.append(start_sweeper(app, stop_event))
+    click.echo(f"Started {threads} job worker thread(s). Press Ctrl+C to stop.")
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+
+@jobs_cli.command("status")
+def status_command():
+    """Show job counts by kind and status."""
+    rows = db.session.query(Job.kind, Job.status, db.func.count(Job.id)) \
+        .group_by(Job.kind, Job.status).order_by(Job.kind, Job.status).all()
+    for kind, status, count in rows:
+        click.echo(f"{kind:<20} {status:<10} {count}")
@@ -2,7 +2,7 @@
 models.py
 
 Defines all SQLAlchemy models for the eCommerce web app:
-User accounts, Products, Cart, Orders, Wishlist, and Reviews.
+User accounts, Products, Cart, Orders, Wishlist, Reviews, and background Jobs.
 """
 
 from flask_login import UserMixin
@@ -34,21 +34,70 @@ class User(UserMixin, db.Model):
 class Product(db.Model):
     """
     Product model for items in the store.
-    Includes category, price, stock, and image URL.
+    Includes category, price, stock, image URL, and rating aggregates.
     """
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
+    sku = db.Column(db.String(64))  # Stock keeping unit from the ERP; the bulk import key
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(300))
+    image_key = db.Column(db.String(24))  # Content hash naming the resized derivatives (see app/images.py)
+    image_source = db.Column(db.String(300))  # The image_url those derivatives were built from
+    image_width = db.Column(db.Integer)  # Upright width of that image; derivatives are never wider
     category = db.Column(db.String(100))
     stock = db.Column(db.Integer, default=10)
 
+    # Incremented in SQL by every UPDATE (ORM or Core); cache keys for product markup use it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version') + 1)
+    # Set on insert and on every UPDATE; lets in-memory indexes fetch only changed rows
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Rating aggregates, maintained alongside each Review insert
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_avg = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_count_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relationships
     reviews = db.relationship('Review', backref='product', cascade="all, delete-orphan")
     wishlist_items = db.relationship('WishlistItem', backref='product', cascade="all, delete-orphan")
     order_items = db.relationship('OrderItem', backref='product', cascade="all, delete-orphan")
 
+    # Catalog filter and keyset sort indexes (id is the pagination tiebreaker)
+    __table_args__ = (
+        db.Index('uq_product_sku', 'sku', unique=True),
+        db.Index('ix_product_category', 'category'),
+        db.Index('ix_product_name_id', 'name', 'id'),
+        db.Index('ix_product_price_id', 'price', 'id'),
+        db.Index('ix_product_rating_avg_id', 'rating_avg', 'id'),
+        db.Index('ix_product_updated_at', 'updated_at'),
+    )
+
+    @property
+    def rating_histogram(self):
+        """(stars, count) pairs from 5 stars down to 1."""
+        return [(stars, getattr(self, f"rating_count_{stars}")) for stars in range(5, 0, -1)]
+
+    @classmethod
+    def rating_increment(cls, rating):
+        """
+        Column updates that fold one new rating into the aggregates.
+        Evaluated in SQL, so concurrent reviews never lose an update.
+        """
+        bucket = f"rating_count_{rating}"
+        return {
+            "rating_count": cls.rating_count + 1,
+            "rating_sum": cls.rating_sum + rating,
+            "rating_avg": (cls.rating_sum + rating) * 1.0 / (cls.rating_count + 1),
+            bucket: getattr(cls, bucket) + 1,
+        }
+
 
 class CartItem(db.Model):
     """
@@ -62,6 +111,11 @@ class CartItem(db.Model):
     # Direct product reference for easier access
     product = db.relationship('Product')
 
+    # One row per product per cart; also serves lookups by user_id alone
+    __table_args__ = (
+        db.Index('uq_cart_item_user_product', 'user_id', 'product_id', unique=True),
+    )
+
 
 class Order(db.Model):
     """
@@ -76,16 +130,39 @@ class Order(db.Model):
     # One-to-many: Order -> OrderItems
     items = db.relationship('OrderItem', backref='order', cascade="all, delete-orphan")
 
+    # Order history: a user's orders, newest first
+    __table_args__ = (
+        db.Index('ix_order_user_timestamp', 'user_id', 'timestamp'),
+    )
+
 
 class OrderItem(db.Model):
     """
     Represents a single product within an order.
+    Keeps the unit price, product name and image as they were when the order
+    was placed, so order history never reads the live product table.
     """
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     quantity = db.Column(db.Integer)
 
+    # Snapshot of the product at purchase time, so history survives price/name edits
+    unit_price = db.Column(db.Float)
+    product_name = db.Column(db.String(120))
+    image_url = db.Column(db.String(300))
+    image_key = db.Column(db.String(24))  # Only set if the derivatives matched image_url at the time
+    image_width = db.Column(db.Integer)
+
+    @property
+    def image_source(self):
+        # Lets product_image_urls() treat the snapshot like a product
+        return self.image_url
+
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id'),
+    )
+
 
 class WishlistItem(db.Model):
     """
@@ -95,6 +172,10 @@ class WishlistItem(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
 
+    __table_args__ = (
+        db.Index('uq_wishlist_item_user_product', 'user_id', 'product_id', unique=True),
+    )
+
 
 class Review(db.Model):
     """
@@ -107,3 +188,111 @@ class Review(db.Model):
     rating = db.Column(db.Integer)  # e.g. 1–5 stars
     comment = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # A product's reviews, newest first
+    __table_args__ = (
+        db.Index('ix_review_product_timestamp', 'product_id', 'timestamp'),
+    )
+
+
+class Job(db.Model):
+    """
+    A unit of background work in the persistent job queue.
+    `key` is an idempotency key: a given piece of work is only ever queued once.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    key = db.Column(db.String(200), unique=True, nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+
+class StockHold(db.Model):
+    """
+    Stock set aside for a checkout in progress.
+    Available stock is Product.stock minus the unexpired holds. A checkout's
+    holds are also the record of what the buyer was charged for: fulfillment
+    turns exactly these lines into the order and the stock decrement.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    checkout_key = db.Column(db.String(64), nullable=False)
+    # The Stripe Checkout Session paying for these holds, once it has been created
+    checkout_session_id = db.Column(db.String(100))
+    quantity = db.Column(db.Integer, nullable=False)
+    # The line as sent to Stripe, so later cart or catalog edits can't change the order
+    unit_price = db.Column(db.Float)
+    product_name = db.Column(db.String(120))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Covers the "active holds for this product" sum
+        db.Index('ix_stock_hold_product_expires', 'product_id', 'expires_at'),
+        db.Index('ix_stock_hold_checkout_key', 'checkout_key'),
+        db.Index('ix_stock_hold_user_id', 'user_id'),
+        db.Index('ix_stock_hold_expires_at', 'expires_at'),
+    )
+
+
+class ProductRecommendation(db.Model):
+    """
+    One precomputed "customers also bought" neighbour of a product, written
+    by `flask recommendations build`. The primary key serves the page lookup.
+    """
+    product_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    recommended_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+
+class SalesDaily(db.Model):
+    """
+    Store-wide sales per UTC day, maintained incrementally by fulfillment
+    (see app/analytics.py) so reports never scan the order tables.
+    """
+    day = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SalesDailyProduct(db.Model):
+    """Sales of one product per UTC day; `orders` counts orders containing it."""
+    day = db.Column(db.Date, primary_key=True)
+    # No foreign key: history outlives deleted products
+    product_id = db.Column(db.Integer, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SalesDailyCategory(db.Model):
+    """Sales per product category per UTC day ('' for uncategorized products)."""
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(100), primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CatalogVersion(db.Model):
+    """
+    Single-row counter bumped on every product or review write.
+    Catalog caches compare against it to know when they are stale.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
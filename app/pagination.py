@@ -0,0 +1,117 @@
+"""
+pagination.py
+
+Keyset (cursor) pagination helpers.
+Pages are addressed by the sort value and id of the row on the edge of the
+previous page instead of an OFFSET, so every page costs the same single
+index range scan no matter how deep the user goes.
+"""
+
+import base64
+import json
+from datetime import datetime
+from dataclasses import dataclass, field
+
+from sqlalchemy import tuple_
+from sqlalchemy.engine import Row
+
+
+@dataclass
+class KeysetPage:
+    """One page of results plus opaque cursors for its neighbours."""
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(value, row_id):
+    """Pack a (sort value, id) pair into a URL-safe token."""
+    # Datetimes travel as ISO strings with a type tag so they round-trip
+    payload = [value.isoformat(), row_id, "dt"] if isinstance(value, datetime) else [value, row_id]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Unpack a cursor token; returns None for missing or tampered tokens."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        value, row_id = payload[:2]
+        if not isinstance(row_id, int) or isinstance(value, (list, dict)):
+            return None
+        if payload[2:] == ["dt"]:
+            value = datetime.fromisoformat(value)
+        return value, row_id
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def paginate_keyset(query, id_column, per_page, sort_column=None, descending=False,
+                    after=None, before=None, row_value=None):
+    """
+    Fetch one page of `query` ordered by (sort_column, id_column).
+
+    `after` / `before` are cursor tokens from a previous page. `row_value`
+    extracts the sort value from a result row when the sort column is not a
+    plain attribute of the entity (e.g. a search rank from a joined subquery).
+    """
+    sort_column = sort_column if sort_column is not None else id_column
+    single_key = sort_column is id_column
+    before_cursor = decode_cursor(before)
+    backwards = before_cursor is not None
+    cursor = before_cursor if backwards else decode_cursor(after)
+
+    if cursor is not None:
+        value, row_id = cursor
+        if single_key:
+            edge, bound = id_column, row_id
+        else:
+            edge, bound = tuple_(sort_column, id_column), tuple_(value, row_id)
+        # Walking forward in a descending order means looking for smaller keys
+        if descending != backwards:
+            query = query.filter(edge < bound)
+        else:
+            query = query.filter(edge > bound)
+
+    scan_descending = descending != backwards
+    ordering = [id_column.desc() if scan_descending else id_column.asc()]
+    if not single_key:
+        ordering.insert(0, sort_column.desc() if scan_descending else sort_column.asc())
+
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage()
+
+    def cursor_for(row):
+        if single_key:
+            return encode_cursor(None, getattr(_entity(row), id_column.key))
+        value = row_value(row) if row_value else getattr(_entity(row), sort_column.key)
+        return encode_cursor(value, getattr(_entity(row), id_column.key))
+
+    page = KeysetPage(items=[_entity(row) for row in rows])
+    if has_more or backwards:
+        page.next_cursor = cursor_for(rows[-1])
+    if cursor is not None and (has_more or not backwards):
+        page.prev_cursor = cursor_for(rows[0])
+    return page
+
+
+def _entity(row):
+    """Return the mapped object from either an entity row or an (entity, extra...) row."""
+    return row[0] if isinstance(row, Row) else row
@@ -0,0 +1,128 @@
+"""
+passwords.py
+
+Password hashing off the request workers.
+The KDF runs in a bounded process pool so a burst of logins or sign-ups
+cannot starve other requests of CPU. When too many hashes are already
+queued, callers get PasswordHasherBusy promptly instead of piling up.
+The algorithm and cost come from Config.PASSWORD_HASH_METHOD, and stored
+hashes made with older parameters are upgraded on the next successful login.
+"""
+
+import atexit
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash took too long."""
+
+
+# -------------------------------
+# Work done in the pool processes
+# -------------------------------
+
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(stored_hash, password, method, salt_length, current_prefix):
+    """Check a password; if it matches an outdated hash, also return a fresh one."""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if stored_hash.split("$", 1)[0] != current_prefix:
+        return True, _hash(password, method, salt_length)
+    return True, None
+
+
+@functools.lru_cache(maxsize=None)
+def hash_prefix(method):
+    """The parameter prefix werkzeug writes for `method`, with its defaults filled in."""
+    # 'scrypt' is stored as 'scrypt:32768:8:1', so derive it rather than parse it
+    return generate_password_hash("", method=method, salt_length=1).split("$", 1)[0]
+
+
+# -------------------------------
+# Pool management
+# -------------------------------
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+
+
+def _get_pool(config):
+    global _pool, _pool_pid, _slots
+    with _lock:
+        # A forked web worker must not reuse its parent's pool
+        if _pool is None or _pool_pid != os.getpid():
+            workers = config["PASSWORD_HASH_WORKERS"]
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(workers + config["PASSWORD_HASH_MAX_QUEUE"])
+        return _pool, _slots
+
+
+def _run(fn, *args):
+    config = current_app.config
+    if not config["PASSWORD_HASH_WORKERS"]:
+        # Hash inline (tests, one-off scripts)
+        return fn(*args)
+
+    pool, slots = _get_pool(config)
+    if not slots.acquire(timeout=config["PASSWORD_HASH_QUEUE_TIMEOUT"]):
+        raise PasswordHasherBusy("Too many password hashes in progress")
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # A timed-out hash keeps its pool process busy, so it keeps its slot until it really ends
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=config["PASSWORD_HASH_TIMEOUT"])
+    except FutureTimeoutError:
+        raise PasswordHasherBusy("Password hashing timed out") from None
+
+
+def shutdown():
+    """Stop the pool processes (called automatically at exit)."""
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+atexit.register(shutdown)
+
+
+# -------------------------------
+# Public API
+# -------------------------------
+
+def hash_password(password):
+    """Hash a new password with the configured method."""
+    config = current_app.config
+    return _run(_hash, password, config["PASSWORD_HASH_METHOD"], config["PASSWORD_SALT_LENGTH"])
+
+
+def verify_password(stored_hash, password):
+    """
+    Check `password` against `stored_hash`.
+    Returns (matches, new_hash); new_hash is set when the password matched but
+    the stored hash uses outdated parameters and should be replaced.
+    """
+    config = current_app.config
+    method = config["PASSWORD_HASH_METHOD"]
+    return _run(_verify, stored_hash, password, method,
+                config["PASSWORD_SALT_LENGTH"], hash_prefix(method))
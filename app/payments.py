@@ -0,0 +1,275 @@
+"""
+payments.py
+
+The Stripe gateway used by checkout.
+Each process has one StripeClient on a shared keep-alive requests.Session,
+so checkouts reuse open TLS connections. Connect and read timeouts are
+tight, and each attempt's are cut down to fit what is left of the call
+budget, so a slow Stripe holds a worker for at most the budget rather than
+for as long as Stripe takes. Network errors, timeouts, 429s and 5xx responses
+are retried a bounded number of times with full-jitter backoff and the same
+idempotency key. Consecutive failed attempts open a circuit breaker. While
+it is open, calls fail at once with PaymentUnavailableError, and after
+STRIPE_BREAKER_RESET seconds one trial call decides whether it closes.
+Every attempt's latency and outcome go into rolling per-operation stats
+(`gateway.stats.snapshot()`).
+"""
+
+import contextlib
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+import stripe
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth another attempt: idempotency-key conflicts, rate limits, server errors
+RETRY_STATUSES = {409, 429}
+
+# Latency samples kept per operation
+STATS_WINDOW = 1000
+
+
+class PaymentUnavailableError(Exception):
+    """Raised when Stripe is failing or the circuit is open; safe to show to the buyer."""
+
+    def __init__(self, message="Payments are temporarily unavailable. Please try again in a few minutes."):
+        super().__init__(message)
+
+
+# -------------------------------
+# Circuit breaker
+# -------------------------------
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker shared by every thread in the process.
+    closed: calls go through. open: calls are refused until `reset_seconds`
+    have passed. half_open: one trial call is let through; its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._trial_started is not None else "open"
+
+    def allow(self):
+        """Whether a call may go out now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = self._clock()
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            # One trial at a time; a trial that never reported back is given up on
+            if self._trial_started is not None and now - self._trial_started < self.reset_seconds:
+                return False
+            self._trial_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning("Stripe circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or (self._opened_at is None
+                                                   and self._failures >= self.failure_threshold):
+                logger.warning("Stripe circuit opened after %d consecutive failure(s)", self._failures)
+                self._opened_at = self._clock()
+                self._trial_started = None
+
+
+# -------------------------------
+# Call metrics
+# -------------------------------
+
+class CallStats:
+    """Per-operation counters and a rolling window of attempt latencies."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: {"calls": 0, "attempts": 0, "failures": 0, "retries": 0, "rejected": 0})
+
+    def record_attempt(self, operation, seconds, ok):
+        with self._lock:
+            self._latencies[operation].append(seconds)
+            counts = self._counts[operation]
+            counts["attempts"] += 1
+            counts["failures"] += not ok
+
+    def count(self, operation, name):
+        with self._lock:
+            self._counts[operation][name] += 1
+
+    def snapshot(self):
+        """{operation: counters plus p50/p95/p99/max attempt latency in ms}."""
+        with self._lock:
+            report = {}
+            for operation, counts in self._counts.items():
+                ordered = sorted(self._latencies[operation])
+                report[operation] = dict(counts, **{
+                    f"p{pct}_ms": round(ordered[min(len(ordered) - 1, len(ordered) * pct // 100)] * 1000, 3)
+                    if ordered else 0.0
+                    for pct in (50, 95, 99)
+                }, max_ms=round(ordered[-1] * 1000, 3) if ordered else 0.0)
+            return report
+
+
+# -------------------------------
+# Gateway
+# -------------------------------
+
+class BudgetedSession(requests.Session):
+    """
+    requests.Session that scales each request's (connect, read) timeout down
+    so the two together fit in what is left of the calling thread's deadline.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def deadline(self, at):
+        """Bound the requests this thread makes inside the block by time.monotonic() `at`."""
+        self._local.deadline = at
+        try:
+            yield
+        finally:
+            self._local.deadline = None
+
+    def request(self, method, url, **kwargs):
+        deadline = getattr(self._local, "deadline", None)
+        timeout = kwargs.get("timeout")
+        if deadline is not None and isinstance(timeout, tuple):
+            fits = max(deadline - time.monotonic(), 0.001) / sum(timeout)
+            if fits < 1:
+                kwargs["timeout"] = tuple(part * fits for part in timeout)
+        return super().request(method, url, **kwargs)
+
+
+def _should_retry(exc):
+    """Whether a failed attempt may succeed if repeated (and says nothing about the request itself)."""
+    should_retry = (exc.headers or {}).get("stripe-should-retry")
+    if should_retry is not None:
+        return should_retry == "true"
+    if isinstance(exc, stripe.APIConnectionError):
+        return exc.should_retry
+    return exc.http_status in RETRY_STATUSES or (exc.http_status or 0) >= 500
+
+
+class StripeGateway:
+    """Stripe calls with connection reuse, timeouts, retries, a circuit breaker and metrics."""
+
+    def __init__(self, config):
+        session = self.session = BudgetedSession()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["STRIPE_POOL_SIZE"], max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.client = stripe.StripeClient(
+            config["STRIPE_SECRET_KEY"],
+            base_addresses={"api": config["STRIPE_API_BASE"]},
+            # Retries happen here, where the breaker and metrics can see them
+            max_network_retries=0,
+            http_client=stripe.RequestsClient(
+                timeout=(config["STRIPE_CONNECT_TIMEOUT"], config["STRIPE_READ_TIMEOUT"]), session=session,
+            ),
+        )
+        self.max_retries = config["STRIPE_MAX_RETRIES"]
+        self.retry_backoff = config["STRIPE_RETRY_BACKOFF"]
+        self.call_budget = config["STRIPE_CALL_BUDGET"]
+        self.breaker = CircuitBreaker(config["STRIPE_BREAKER_FAILURES"], config["STRIPE_BREAKER_RESET"])
+        self.stats = CallStats()
+
+    def call(self, operation, request):
+        """
+        Run `request()` (one Stripe API call) under the retry policy and the
+        breaker. Raises PaymentUnavailableError when Stripe is failing, or the
+        StripeError for requests Stripe rejected (bad parameters, auth, ...).
+        """
+        self.stats.count(operation, "calls")
+        if not self.breaker.allow():
+            self.stats.count(operation, "rejected")
+            raise PaymentUnavailableError()
+
+        deadline = time.monotonic() + self.call_budget
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with self.session.deadline(deadline):
+                    result = request()
+            except stripe.StripeError as exc:
+                self.stats.record_attempt(operation, time.perf_counter() - started, ok=False)
+                if not _should_retry(exc):
+                    # Stripe answered, so it is up; the request itself was refused
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                # Full jitter keeps retries from many workers from arriving in step
+                delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline \
+                        or not self.breaker.allow():
+                    logger.warning("Stripe %s failed after %d attempt(s): %s", operation, attempt, exc)
+                    raise PaymentUnavailableError() from exc
+                self.stats.count(operation, "retries")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Not a Stripe outcome; don't leave a half-open trial waiting for one
+                self.breaker.record_failure()
+                raise
+            self.stats.record_attempt(operation, time.perf_counter() - started, ok=True)
+            self.breaker.record_success()
+            return result
+
+    def create_checkout_session(self, params, idempotency_key):
+        """Create a Checkout Session; retries reuse `idempotency_key`, so at most one is created."""
+        return self.call("checkout.sessions.create", lambda: self.client.v1.checkout.sessions.create(
+            params=params, options={"idempotency_key": idempotency_key},
+        ))
+
+    def expire_checkout_session(self, session_id):
+        """Expire an open Checkout Session so it can no longer be paid; Stripe refuses once it is paid."""
+        return self.call("checkout.sessions.expire",
+                         lambda: self.client.v1.checkout.sessions.expire(session_id))
+
+
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The app's StripeGateway, created on first use (the secret key may be unset in development)."""
+    gateway = current_app.extensions.get("stripe_gateway")
+    if gateway is None:
+        with _gateway_lock:
+            gateway = current_app.extensions.get("stripe_gateway")
+            if gateway is None:
+                gateway = current_app.extensions["stripe_gateway"] = StripeGateway(current_app.config)
+    return gateway
@@ -0,0 +1,273 @@
+"""
+recommendations.py
+
+"Customers also bought" recommendations.
+`flask recommendations build` turns order history into a sparse
+product-by-product co-purchase matrix with NumPy/SciPy (only this batch
+job needs them). It scores each pair by the cosine similarity of the two
+products' order sets and stores the top-k neighbours per product in
+product_recommendation. The matrix and the last order id it covers are
+kept in RECOMMENDATIONS_STATE_PATH, along with the lower ids that had no
+committed order yet: an order can commit after one with a higher id, so
+later runs pick those up too. Later runs read only new orders and re-rank
+only the products those orders contain; other products keep their lists
+until the next `--full` rebuild. The product page reads its neighbours with
+one primary-key lookup.
+"""
+
+import itertools
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select
+
+from . import db
+from .catalog import bump_catalog_version
+from .models import Order, OrderItem, Product, ProductRecommendation
+
+# Orders with more distinct products than this are skipped: bulk purchases
+# say little about what goes together and add basket_size² pairs each
+MAX_BASKET_SIZE = 50
+
+# Order lines read per query while building
+CHUNK_SIZE = 200_000
+
+# Seconds an order id missing below the high-water mark is looked for again.
+# A late commit shows up within seconds; a rolled-back order never does. Each
+# missing id is checked by at least one later build however long this is.
+PENDING_ORDER_TIMEOUT = 3600
+
+
+def recommended_products(product_id):
+    """A product's stored neighbours, best first."""
+    return Product.query \
+        .join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id) \
+        .filter(ProductRecommendation.product_id == product_id) \
+        .order_by(ProductRecommendation.rank).all()
+
+
+# -------------------------------
+# Matrix state between runs
+# -------------------------------
+
+def load_state(path):
+    """
+    The (matrix, last_order_id, pending) saved by the previous run, or None.
+    `pending` maps order ids at or below last_order_id that had no committed
+    order to when they were first found missing.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    try:
+        with np.load(path) as state:
+            matrix = sparse.csr_array((state["data"], state["indices"], state["indptr"]),
+                                      shape=tuple(state["shape"]))
+            pending = {}
+            if "pending_ids" in state:
+                pending = dict(zip(state["pending_ids"].tolist(), state["pending_since"].tolist()))
+            return matrix, int(state["last_order_id"]), pending
+    except FileNotFoundError:
+        return None
+
+
+def save_state(path, matrix, last_order_id, pending):
+    import numpy as np
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+             shape=np.array(matrix.shape), last_order_id=np.array(last_order_id),
+             pending_ids=np.array(list(pending), dtype=np.int64),
+             pending_since=np.array(list(pending.values()), dtype=np.float64))
+    os.replace(tmp_path, path)
+
+
+# -------------------------------
+# Building
+# -------------------------------
+
+def order_line_chunks(after_id, up_to_id):
+    """Yield (order_ids, product_ids) arrays for whole orders in (after_id, up_to_id]."""
+    import numpy as np
+
+    last_id = after_id
+    while last_id < up_to_id:
+        # Core rows, flattened straight into an array: no ORM or per-row numpy conversion
+        rows = db.session.connection().execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .where(OrderItem.order_id > last_id, OrderItem.order_id <= up_to_id,
+                   OrderItem.product_id.isnot(None))
+            .order_by(OrderItem.order_id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        lines = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64,
+                            count=2 * len(rows)).reshape(-1, 2)
+        if len(rows) == CHUNK_SIZE:
+            # The last order may continue in the next chunk; leave it for that one
+            complete = lines[:, 0] != lines[-1, 0]
+            if complete.any():
+                lines = lines[complete]
+        last_id = int(lines[-1, 0])
+        yield lines[:, 0], lines[:, 1]
+
+
+def order_lines(order_ids):
+    """Yield (order_ids, product_ids) arrays for those of `order_ids` committed by now."""
+    import numpy as np
+
+    for start in range(0, len(order_ids), 500):
+        rows = db.session.connection().execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .where(OrderItem.order_id.in_(order_ids[start:start + 500]), OrderItem.product_id.isnot(None))
+        ).all()
+        if rows:
+            lines = np.array(rows, dtype=np.int64)
+            yield lines[:, 0], lines[:, 1]
+
+
+def cooccurrence(order_ids, product_ids, size):
+    """
+    Co-purchase counts for a chunk of order lines as a (size x size) sparse
+    matrix: entry (a, b) is the number of orders containing both a and b, and
+    the diagonal is each product's order count. Also returns the products seen.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    # One row per order, one column per product; a product repeated in an order counts once
+    baskets = sparse.csr_array((np.ones(len(product_ids), dtype=np.int32), (order_index, product_ids)),
+                               shape=(len(orders), size))
+    baskets.sum_duplicates()
+    baskets.data[:] = 1
+    baskets = baskets[baskets.sum(axis=1) <= MAX_BASKET_SIZE]
+    return (baskets.T @ baskets).tocoo(), np.unique(baskets.indices)
+
+
+def top_neighbours(matrix, products, k, min_support):
+    """
+    Rank every product in `products` against its co-purchased products by
+    cosine similarity, counts[a,b] / sqrt(orders[a] * orders[b]), keeping pairs
+    seen in at least `min_support` orders. Returns (product, rank, neighbour,
+    score) arrays holding at most k rows per product.
+    """
+    import numpy as np
+
+    counts = matrix.diagonal().astype(np.float64)
+    rows = matrix[products].tocoo()
+    product, neighbour, together = products[rows.row], rows.col, rows.data
+    keep = (neighbour != product) & (together >= min_support)
+    product, neighbour, together = product[keep], neighbour[keep], together[keep]
+    score = together / np.sqrt(counts[product] * counts[neighbour])
+
+    # Group by product, best score first; neighbour id breaks ties deterministically
+    order = np.lexsort((neighbour, -score, product))
+    product, neighbour, score = product[order], neighbour[order], score[order]
+    starts = np.flatnonzero(np.r_[True, product[1:] != product[:-1]])
+    rank = np.arange(len(product)) - np.repeat(starts, np.diff(np.r_[starts, len(product)]))
+    top = rank < k
+    return product[top], rank[top], neighbour[top], score[top]
+
+
+def store(products, ranked, full, batch_size=5000):
+    """Replace the stored lists of `products` (all lists when `full`) and commit."""
+    if full:
+        db.session.execute(delete(ProductRecommendation))
+    else:
+        ids = [int(product_id) for product_id in products]
+        for start in range(0, len(ids), 500):
+            db.session.execute(delete(ProductRecommendation)
+                               .where(ProductRecommendation.product_id.in_(ids[start:start + 500])))
+
+    rows = [
+        {"product_id": int(product_id), "rank": int(rank), "recommended_id": int(neighbour),
+         "score": round(float(score), 6)}
+        for product_id, rank, neighbour, score in zip(*ranked)
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(ProductRecommendation), rows[start:start + batch_size])
+    # Cached product pages embed the list
+    bump_catalog_version(db.session)
+    db.session.commit()
+    return len(rows)
+
+
+def build(full=False, log=click.echo):
+    """Fold new orders into the co-purchase matrix and refresh the affected lists."""
+    import numpy as np
+    from scipy import sparse
+
+    config = current_app.config
+    path = config["RECOMMENDATIONS_STATE_PATH"]
+    state = None if full else load_state(path)
+    full = state is None
+    matrix, last_order_id, pending = state or (sparse.csr_array((0, 0), dtype=np.int32), 0, {})
+
+    high_water = max(db.session.scalar(select(func.max(Order.id))) or 0, last_order_id)
+    if high_water == last_order_id and not pending:
+        log("No new orders since the last build.")
+        return
+
+    started = time.perf_counter()
+    existing = matrix.tocoo()
+    parts = [(existing.row, existing.col, existing.data)]
+    touched = []
+    size = matrix.shape[0]
+    lines_read = 0
+    read = [np.array([], dtype=np.int64)]
+    for order_ids, product_ids in itertools.chain(order_lines(sorted(pending)),
+                                                  order_line_chunks(last_order_id, high_water)):
+        size = max(size, int(product_ids.max()) + 1)
+        delta, seen = cooccurrence(order_ids, product_ids, size)
+        parts.append((delta.row, delta.col, delta.data))
+        touched.append(seen)
+        read.append(order_ids)
+        lines_read += len(product_ids)
+        log(f"{lines_read} order line(s) read...")
+
+    # Ids with no lines read are in flight or rolled back; the next builds look for them again.
+    # Only ids actually read are counted, so an order committing mid-build is read exactly once.
+    read = np.concatenate(read)
+    now = time.time()
+    unread = np.union1d(np.setdiff1d(np.arange(last_order_id + 1, high_water + 1), read),
+                        np.setdiff1d(np.array(list(pending), dtype=np.int64), read))
+    pending = {order_id: pending.get(order_id, now) for order_id in unread.tolist()
+               if now - pending.get(order_id, now) < PENDING_ORDER_TIMEOUT}
+
+    # Duplicate (row, col) entries are summed when the COO parts are combined
+    rows, cols, data = (np.concatenate(arrays) for arrays in zip(*parts))
+    matrix = sparse.coo_array((data.astype(np.int32), (rows, cols)), shape=(size, size)).tocsr()
+
+    if full:
+        products = np.flatnonzero(matrix.diagonal())
+    else:
+        products = np.unique(np.concatenate(touched)) if touched else np.array([], dtype=np.int64)
+    # The state is the source of truth for counts, so it is saved before the lists
+    save_state(path, matrix, high_water, pending)
+    if not full and not len(products):
+        log("No new orders since the last build.")
+        return
+    ranked = top_neighbours(matrix, products, config["RECOMMENDATIONS_TOP_K"],
+                            config["RECOMMENDATIONS_MIN_SUPPORT"])
+    written = store(products, ranked, full)
+    log(f"{'Rebuilt' if full else 'Updated'} {len(products)} product(s) from {lines_read} new order line(s): "
+        f"{written} recommendation(s) written in {time.perf_counter() - started:.1f} s.")
+
+
+# -------------------------------
+# CLI: flask recommendations ...
+# -------------------------------
+
+recommendations_cli = AppGroup("recommendations", help='Build "customers also bought" recommendations.')
+
+
+@recommendations_cli.command("build")
+@click.option("--full", is_flag=True, help="Ignore the saved matrix and rebuild from all orders.")
+def build_command(full):
+    """Update recommendations from orders placed since the last build."""
+    build(full)
@@ -0,0 +1,228 @@
+"""
+reservations.py
+
+Short-lived stock holds taken when a Stripe Checkout session is created.
+A hold sets units aside for one checkout until it expires (STOCK_HOLD_TTL),
+so buyers are told about missing stock before they pay instead of after.
+The Stripe session expires together with its holds. Stripe only accepts
+session lifetimes between 30 minutes and 24 hours, so STOCK_HOLD_TTL is
+checked against those limits at startup.
+Available stock is Product.stock minus the unexpired holds. Each hold is
+taken with a conditional INSERT ... SELECT, so the stock check and the
+reservation are a single statement. The holds also snapshot each line's
+price and name: fulfillment turns exactly a checkout's holds into the order
+and the stock decrement. Expired holds stop counting straight away, but the
+sweeper that `flask jobs work` runs keeps the rows for STOCK_HOLD_RETENTION
+seconds, so a payment whose webhook arrives late can still be fulfilled.
+"""
+
+import contextlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, literal, select, update
+
+from . import db
+from .models import Product, StockHold
+
+logger = logging.getLogger(__name__)
+
+# Stripe Checkout sessions must expire between 30 minutes and 24 hours after creation
+SESSION_MIN_LIFETIME = 30 * 60
+SESSION_MAX_LIFETIME = 24 * 3600
+# Headroom for the time between taking the holds and Stripe receiving the session
+SESSION_EXPIRY_MARGIN = 5 * 60
+
+
+class OutOfStockError(Exception):
+    """Raised when a cart line can no longer be covered by available stock."""
+
+    def __init__(self, product_name):
+        super().__init__(f"Not enough stock for {product_name}.")
+        self.product_name = product_name
+
+
+def check_hold_ttl(config):
+    """Refuse to start with a STOCK_HOLD_TTL that Stripe can't use as a session lifetime."""
+    ttl = config["STOCK_HOLD_TTL"]
+    if not SESSION_MIN_LIFETIME <= ttl <= SESSION_MAX_LIFETIME:
+        raise RuntimeError(f"STOCK_HOLD_TTL must be between {SESSION_MIN_LIFETIME} and "
+                           f"{SESSION_MAX_LIFETIME} seconds (Stripe's session limits), not {ttl}.")
+
+
+def hold_ttl(config):
+    """
+    Seconds to hold a checkout's stock. Its session expires with the holds,
+    so this stays above Stripe's minimum by the time the session is created.
+    """
+    return max(config["STOCK_HOLD_TTL"], SESSION_MIN_LIFETIME + SESSION_EXPIRY_MARGIN)
+
+
+def held_quantity(product_id, now, exclude_key=None):
+    """Scalar subquery: units of `product_id` (a value or column) in unexpired holds."""
+    query = select(func.coalesce(func.sum(StockHold.quantity), 0)) \
+        .where(StockHold.product_id == product_id, StockHold.expires_at > now)
+    if exclude_key is not None:
+        query = query.where(StockHold.checkout_key != exclude_key)
+    return query.scalar_subquery()
+
+
+def available_stock(now=None):
+    """Column expression: Product.stock minus what checkouts in progress hold."""
+    return Product.stock - held_quantity(Product.id, now or datetime.utcnow())
+
+
+# Threads in this process take turns at the SQLite write lock instead of
+# backing off in its busy handler, which keeps flash-sale latency bounded
+_sqlite_writer = threading.Lock()
+
+
+def reserve(user_id, checkout_key, lines, ttl):
+    """
+    Hold stock for every (product_id, quantity, name, unit_price) line under
+    `checkout_key`; the holds keep the name and price the buyer is charged.
+    The user's earlier holds are left alone: their session may still be paid.
+    Commits and returns the expiry time, or raises OutOfStockError after
+    rolling back if any line can't be covered.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    # Product id order keeps row locks consistent across concurrent checkouts
+    lines = sorted(lines)
+    sqlite = db.session.get_bind().dialect.name == "sqlite"
+
+    with _sqlite_writer if sqlite else contextlib.nullcontext():
+        try:
+            if not sqlite:
+                # SQLite already serialises writers. Elsewhere, lock the product rows
+                # for this short transaction so each hold sees the ones before it.
+                db.session.execute(
+                    select(Product.id).where(Product.id.in_([line[0] for line in lines]))
+                    .order_by(Product.id).with_for_update()
+                )
+            for product_id, quantity, name, unit_price in lines:
+                result = db.session.execute(
+                    insert(StockHold).from_select(
+                        ["product_id", "user_id", "checkout_key", "quantity", "unit_price", "product_name",
+                         "expires_at", "created_at"],
+                        select(Product.id, literal(user_id), literal(checkout_key), literal(quantity),
+                               literal(unit_price), literal(name), literal(expires_at), literal(now))
+                        .where(Product.id == product_id, available_stock(now) >= quantity)
+                    )
+                )
+                if result.rowcount != 1:
+                    raise OutOfStockError(name)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return expires_at
+
+
+def attach_session(checkout_key, checkout_session_id):
+    """Record which Stripe session pays for a checkout's holds."""
+    db.session.execute(
+        update(StockHold).where(StockHold.checkout_key == checkout_key)
+        .values(checkout_session_id=checkout_session_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def open_checkouts(user_id):
+    """(checkout_key, checkout_session_id) of the user's checkouts that still hold stock."""
+    return db.session.execute(
+        select(StockHold.checkout_key, StockHold.checkout_session_id).distinct()
+        .where(StockHold.user_id == user_id, StockHold.expires_at > datetime.utcnow(),
+               StockHold.checkout_session_id.is_not(None))
+    ).all()
+
+
+def release(checkout_key, commit=True):
+    """Drop a checkout's holds (payment abandoned, failed or fulfilled)."""
+    db.session.execute(
+        delete(StockHold).where(StockHold.checkout_key == checkout_key)
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        db.session.commit()
+
+
+# -------------------------------
+# Sweeper
+# -------------------------------
+
+def sweep_expired_holds(batch_size=1000):
+    """Delete holds that expired over STOCK_HOLD_RETENTION seconds ago; returns how many."""
+    removed = 0
+    while True:
+        cutoff = datetime.utcnow() - timedelta(seconds=current_app.config["STOCK_HOLD_RETENTION"])
+        expired = select(StockHold.id).where(StockHold.expires_at <= cutoff).limit(batch_size)
+        result = db.session.execute(
+            delete(StockHold).where(StockHold.id.in_(expired))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        removed += result.rowcount
+        if result.rowcount < batch_size:
+            return removed
+
+
+def sweep(app, stop_event, interval):
+    """Sweeper loop: clear expired holds every `interval` seconds until stop_event is set."""
+    while not stop_event.wait(interval):
+        with app.app_context():
+            try:
+                removed = sweep_expired_holds()
+                if removed:
+                    logger.info("Removed %s expired stock hold(s)", removed)
+            except Exception:
+                logger.exception("Stock hold sweeper error")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def start_sweeper(app, stop_event):
+    """Start the sweeper as a daemon thread; returns the thread."""
+    thread = threading.Thread(
+        target=sweep, args=(app, stop_event, app.config["STOCK_HOLD_SWEEP_INTERVAL"]),
+        name="stock-hold-sweeper", daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+# -------------------------------
+# CLI: flask holds ...
+# -------------------------------
+
+holds_cli = AppGroup("holds", help="Inspect and clean up checkout stock holds.")
+
+
+@holds_cli.command("sweep")
+def sweep_command():
+    """Delete holds past their retention once (`flask jobs work` also does this periodically)."""
+    click.echo(f"Removed {sweep_expired_holds()} expired hold(s).")
+
+
+@holds_cli.command("status")
+def status_command():
+    """Show the products with the most stock currently held."""
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        select(Product.id, Product.name, Product.stock, func.sum(StockHold.quantity).label("held"))
+        .join(StockHold, StockHold.product_id == Product.id)
+        .where(StockHold.expires_at > now)
+        .group_by(Product.id, Product.name, Product.stock)
+        .order_by(func.sum(StockHold.quantity).desc())
+        .limit(20)
+    ).all()
+    if not rows:
+        click.echo("No active holds.")
+    for row in rows:
+        click.echo(f"{row.id:>8} {row.name[:40]:<40} stock {row.stock:>6} held {row.held:>6}")
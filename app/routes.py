@@ -6,77 +6,204 @@ Handles user authentication, product display, cart operations, wishlist,
 checkout flow, review system, order history, admin controls, and profile updates.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, g
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, request, g,
+    current_app, session, jsonify, send_from_directory
+)
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from . import db, login_manager
-from .models import User, Product, CartItem, Order, OrderItem, WishlistItem, Review
+from .models import User, Product, CartItem, Order, WishlistItem, Review, Job
+from .search import apply_search, tokenize
+from .pagination import paginate_keyset
+from .facets import get_category_facets
+from .http_cache import cache_anonymous_page
+from .database import use_replica, stick_to_primary
+from .jobs import enqueue
+from .identity import load_identity
+from .assets import IMMUTABLE_MAX_AGE
+from .passwords import PasswordHasherBusy, hash_password, verify_password
+from .cart import CartError, apply_cart_operations, get_cart, parse_operations
+from .reservations import OutOfStockError, attach_session, hold_ttl, open_checkouts, release, reserve
+from .analytics import dashboard
+from .autocomplete import suggest, warm_index
+from .payments import PaymentUnavailableError, get_gateway
+from .recommendations import recommended_products
+from . import fulfillment  # noqa: F401  registers the fulfill_order job handler
 from .forms import (
     RegisterForm, LoginForm, ProductForm,
     CheckoutForm, QuantityForm, ProfileForm,
     ReviewForm
 )
+import secrets
+from datetime import timezone
 import stripe
-from config import Config
-from sqlalchemy import or_
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+from sqlalchemy import func, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
 
 main_bp = Blueprint('main_bp', __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # A cached snapshot; the full row is only loaded if a view touches it
+    return load_identity(int(user_id))
+
+# Endpoints that only redirect (or serve files) and never render the navbar
+NAVBARLESS_ENDPOINTS = {
+    "static",
+    "assets",
+    "main_bp.add_to_cart",
+    "main_bp.update_cart",
+    "main_bp.remove_from_cart",
+    "main_bp.cart_api",
+    "main_bp.search_suggest",
+    "main_bp.checkout",
+    "main_bp.checkout_status",
+    "main_bp.stripe_webhook",
+    "main_bp.add_to_wishlist",
+    "main_bp.remove_from_wishlist",
+    "main_bp.logout",
+    "main_bp.media",
+}
+
+
+def refresh_cart_count():
+    """Recount the current user's cart with one SUM and cache it in the session."""
+    count = db.session.query(func.coalesce(func.sum(CartItem.quantity), 0)) \
+        .filter(CartItem.user_id == current_user.id).scalar()
+    session["cart_count"] = [current_user.id, count]
+    return count
+
+
+def adjust_cart_count(delta=None, value=None):
+    """Update the cached badge count after a cart write, without hitting the database."""
+    cached = session.get("cart_count")
+    if not cached or cached[0] != current_user.id:
+        return
+    count = value if value is not None else max(cached[1] + delta, 0)
+    session["cart_count"] = [current_user.id, count]
+
 
 @main_bp.before_app_request
 def load_cart_count():
-    if current_user.is_authenticated:
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        g.cart_count = sum(item.quantity for item in cart_items)
+    g.cart_count = 0
+    if request.endpoint in NAVBARLESS_ENDPOINTS or not current_user.is_authenticated:
+        return
+
+    cached = session.get("cart_count")
+    if cached and cached[0] == current_user.id:
+        g.cart_count = cached[1]
     else:
-        g.cart_count = 0
+        g.cart_count = refresh_cart_count()
+
+
+@main_bp.before_app_request
+def warm_search_suggestions():
+    # Build the autocomplete index in the background while the first requests are served
+    warm_index()
 
 # -------------------------------
 # Homepage & Product Browsing
 # -------------------------------
 
+# Keyset sort modes: (column, descending); Product.id is always the tiebreaker
+SORT_OPTIONS = {
+    "name_asc": (Product.name, False),
+    "name_desc": (Product.name, True),
+    "price_asc": (Product.price, False),
+    "price_desc": (Product.price, True),
+    "rating_desc": (Product.rating_avg, True),
+}
+
+
+def catalog_args():
+    """
+    The listing's query arguments, normalized once: index() renders from
+    these and the page cache keys on them, so equal keys mean equal pages.
+    """
+    sort = request.args.get("sort", "").strip()
+    return {
+        # Search is case-insensitive and ignores punctuation
+        "search": " ".join(tokenize(request.args.get("search", ""))),
+        "category": request.args.get("category", "").strip(),
+        "sort": sort if sort in SORT_OPTIONS else "",
+        "after": request.args.get("after", ""),
+        "before": request.args.get("before", ""),
+    }
+
+
 @main_bp.route("/")
+@use_replica
+@cache_anonymous_page(catalog_args)
 def index():
-    search_query = request.args.get("search", "")
-    selected_category = request.args.get("category", "")
-    sort_option = request.args.get("sort", "")
+    args = catalog_args()
+    search_query = args["search"]
+    selected_category = args["category"]
+    sort_option = args["sort"]
 
     products = Product.query
+    search_rank = None
 
     if search_query:
-        products = products.filter(
-            or_(
-                Product.name.ilike(f"%{search_query}%"),
-                Product.description.ilike(f"%{search_query}%")
-            )
-        )
+        products, search_rank = apply_search(products, search_query)
 
     if selected_category:
-        products = products.filter(Product.category.ilike(f"%{selected_category}%"))
-
-    if sort_option == "name_asc":
-        products = products.order_by(Product.name.asc())
-    elif sort_option == "name_desc":
-        products = products.order_by(Product.name.desc())
-    elif sort_option == "price_asc":
-        products = products.order_by(Product.price.asc())
-    elif sort_option == "price_desc":
-        products = products.order_by(Product.price.desc())
-
-    products = products.all()
-    categories = [c[0] for c in db.session.query(Product.category).distinct() if c[0]]
-
-    return render_template("index.html", products=products, categories=categories,
+        products = products.filter(Product.category == selected_category)
+
+    sort_column, descending = SORT_OPTIONS.get(sort_option, (None, False))
+    row_value = None
+    if sort_column is None and search_rank is not None:
+        # No explicit sort: best full-text matches first
+        sort_column = search_rank
+        products = products.add_columns(search_rank)
+        row_value = lambda row: row[1]
+
+    page = paginate_keyset(
+        products, Product.id, current_app.config["PRODUCTS_PER_PAGE"],
+        sort_column=sort_column, descending=descending,
+        after=args["after"] or None, before=args["before"] or None,
+        row_value=row_value,
+    )
+    categories = get_category_facets()
+
+    return render_template("index.html", products=page.items, page=page, categories=categories,
                            search_query=search_query, selected_category=selected_category,
                            sort_option=sort_option)
+
+
+@main_bp.route("/api/search/suggest")
+def search_suggest():
+    """
+    Search-as-you-type suggestions (see app/autocomplete.py): the most
+    popular products and categories matching what has been typed so far.
+    """
+    query = request.args.get("q", "")[:100]
+    products, categories = suggest(query)
+    response = jsonify(
+        query=query,
+        products=[{"id": product_id, "name": name,
+                   "url": url_for("main_bp.product_detail", product_id=product_id)}
+                  for product_id, name in products],
+        categories=[{"name": name, "url": url_for("main_bp.index", category=name)} for name in categories],
+    )
+    # The same for every visitor; a short TTL bounds staleness after catalog edits
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
 # -------------------------------
 # Product Detail & Reviews
 # -------------------------------
 
+def review_page_args():
+    """The product page's query arguments: the review page cursors."""
+    return {"after": request.args.get("after", ""), "before": request.args.get("before", "")}
+
+
 @main_bp.route("/product/<int:product_id>", methods=["GET", "POST"])
+@use_replica
+@cache_anonymous_page(review_page_args, shows_stock=True)
 def product_detail(product_id):
     """
     Show details of a single product and handle review submissions.
@@ -85,18 +212,44 @@ def product_detail(product_id):
     review_form = ReviewForm()
 
     if current_user.is_authenticated and review_form.validate_on_submit():
+        rating = int(review_form.rating.data)
         new_review = Review(
             user_id=current_user.id,
             product_id=product.id,
-            rating=review_form.rating.data,
+            rating=rating,
             comment=review_form.content.data
         )
         db.session.add(new_review)
+        # Fold the rating into the product aggregates in the same transaction
+        db.session.execute(
+            update(Product).where(Product.id == product.id).values(**Product.rating_increment(rating))
+        )
         db.session.commit()
         flash("Review submitted!")
         return redirect(url_for("main_bp.product_detail", product_id=product.id))
 
-    return render_template("product.html", product=product, review_form=review_form)
+    # Newest reviews first, authors joined into the same query
+    reviews = Review.query.filter_by(product_id=product.id).options(joinedload(Review.user))
+    cursors = review_page_args()
+    review_page = paginate_keyset(
+        reviews, Review.id, current_app.config["REVIEWS_PER_PAGE"],
+        sort_column=Review.timestamp, descending=True,
+        after=cursors["after"] or None, before=cursors["before"] or None,
+    )
+
+    return render_template("product.html", product=product, review_form=review_form,
+                           reviews=review_page.items, review_page=review_page,
+                           recommendations=recommended_products(product.id))
+
+
+@main_bp.route("/media/<path:filename>")
+def media(filename):
+    # Derivative names are content hashes, so a URL's bytes never change
+    response = send_from_directory(current_app.config["IMAGE_STORAGE_DIR"], filename,
+                                   max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
 # -------------------------------
 # Cart Management
 # -------------------------------
@@ -122,6 +275,7 @@ def add_to_cart(product_id):
         db.session.add(cart_item)
 
     db.session.commit()
+    adjust_cart_count(1)
     flash(f"Added {product.name} to cart.")
     return redirect(url_for('main_bp.product_detail', product_id=product.id))
 
@@ -129,8 +283,12 @@ def add_to_cart(product_id):
 @main_bp.route("/cart", methods=["GET", "POST"])
 @login_required
 def cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = CartItem.query.options(joinedload(CartItem.product)) \
+        .filter_by(user_id=current_user.id).all()
     total = sum(item.product.price * item.quantity for item in cart_items)
+    # The cart page has the exact count at hand, so resync the badge for free
+    session["cart_count"] = [current_user.id, sum(item.quantity for item in cart_items)]
+    g.cart_count = session["cart_count"][1]
     form = CheckoutForm()
     quantity_forms = {item.id: QuantityForm(obj=item) for item in cart_items}
 
@@ -153,8 +311,10 @@ def update_cart(item_id):
         if quantity > item.product.stock:
             flash("Not enough stock available.")
         else:
+            delta = quantity - item.quantity
             item.quantity = quantity
             db.session.commit()
+            adjust_cart_count(delta)
             flash("Quantity updated.")
 
     return redirect(url_for("main_bp.cart"))
@@ -168,10 +328,35 @@ def remove_from_cart(item_id):
         flash("Unauthorized.")
         return redirect(url_for("main_bp.cart"))
 
+    removed = item.quantity
     db.session.delete(item)
     db.session.commit()
+    adjust_cart_count(-removed)
     flash("Item removed.")
     return redirect(url_for("main_bp.cart"))
+
+
+@main_bp.route("/api/cart", methods=["POST"])
+@login_required
+def cart_api():
+    """
+    Apply a batch of cart operations (see app/cart.py) in one transaction and
+    return the new cart as JSON. Errors come back with the current cart so the
+    client can resync.
+    """
+    try:
+        validate_csrf(request.headers.get("X-CSRFToken"))
+    except ValidationError:
+        return jsonify(error="Missing or invalid CSRF token."), 400
+
+    try:
+        state = apply_cart_operations(current_user.id, parse_operations(request.get_json(silent=True)))
+    except CartError as exc:
+        return jsonify(error=str(exc), product_id=exc.product_id, cart=get_cart(current_user.id)), exc.status
+
+    # The response carries the exact count, so the badge needs no recount
+    session["cart_count"] = [current_user.id, state["count"]]
+    return jsonify(state)
 # -------------------------------
 # Checkout & Stripe Integration
 # -------------------------------
@@ -182,18 +367,30 @@ def checkout():
     form = CheckoutForm()
 
     if form.validate_on_submit():
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+        cart_items = CartItem.query.options(joinedload(CartItem.product)) \
+        .filter_by(user_id=current_user.id).all()
 
         if not cart_items:
             flash("Your cart is empty.")
             return redirect(url_for("main_bp.cart"))
 
-        for item in cart_items:
-            if item.quantity > item.product.stock:
-                flash(f"Not enough stock for {item.product.name}.")
-                return redirect(url_for("main_bp.cart"))
+        _expire_earlier_checkouts(current_user.id)
 
-        stripe.api_key = Config.STRIPE_SECRET_KEY
+        # Set the stock aside before sending the buyer to pay for it
+        hold_key = secrets.token_hex(16)
+        try:
+            expires_at = reserve(current_user.id, hold_key,
+                                 [(item.product_id, item.quantity, item.product.name, item.product.price)
+                                  for item in cart_items],
+                                 hold_ttl(current_app.config))
+        except OutOfStockError as exc:
+            flash(str(exc))
+            return redirect(url_for("main_bp.cart"))
+        except OperationalError:
+            # The database stayed locked past its busy timeout (SQLite under load)
+            release(hold_key)
+            flash("We're handling a lot of checkouts right now. Please try again in a moment.")
+            return redirect(url_for("main_bp.cart"))
 
         line_items = [{
             'price_data': {
@@ -205,18 +402,32 @@ def checkout():
         } for item in cart_items]
 
         try:
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=line_items,
-                mode='payment',
-                success_url=url_for('main_bp.checkout_success', _external=True),
-                cancel_url=url_for('main_bp.cart', _external=True),
-            )
-            return redirect(session.url, code=303)
+            checkout_session = get_gateway().create_checkout_session({
+                'payment_method_types': ['card'],
+                'line_items': line_items,
+                'mode': 'payment',
+                'client_reference_id': str(current_user.id),
+                # Stripe fills in the placeholder; the success page polls with it
+                'success_url': url_for('main_bp.checkout_success', _external=True)
+                + "?session_id={CHECKOUT_SESSION_ID}",
+                'cancel_url': url_for('main_bp.cart', _external=True),
+                # The session can't be paid after the holds run out (hold_ttl() keeps this within Stripe's limits)
+                'expires_at': int(expires_at.replace(tzinfo=timezone.utc).timestamp()),
+                'metadata': {"hold_key": hold_key},
+            }, idempotency_key=f"checkout-{hold_key}")
+        except PaymentUnavailableError as exc:
+            release(hold_key)
+            flash(str(exc))
+            return redirect(url_for("main_bp.cart"))
         except Exception:
+            release(hold_key)
             flash("Payment failed. Please try again.")
             return redirect(url_for("main_bp.cart"))
 
+        # The session exists now, so its holds must stay whatever happens next
+        attach_session(hold_key, checkout_session.id)
+        return redirect(checkout_session.url, code=303)
+
     flash("Invalid checkout form.")
     return redirect(url_for("main_bp.cart"))
 
@@ -224,32 +435,103 @@ def checkout():
 @main_bp.route("/checkout/success")
 @login_required
 def checkout_success():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    total_amount = sum(item.product.price * item.quantity for item in cart_items)
+    """
+    Landing page after Stripe Checkout. The order itself is created by the
+    job queue once the webhook confirms payment; this page only polls for it.
+    """
+    session_id = request.args.get("session_id", "")
+    if not session_id:
+        return redirect(url_for("main_bp.orders"))
+    return render_template("checkout.html", session_id=session_id)
 
-    order = Order(user_id=current_user.id, total_amount=total_amount)
-    db.session.add(order)
-    db.session.commit()
 
-    for item in cart_items:
-        order_item = OrderItem(order_id=order.id, product_id=item.product.id, quantity=item.quantity)
-        item.product.stock -= item.quantity
-        db.session.add(order_item)
+@main_bp.route("/checkout/status")
+@login_required
+def checkout_status():
+    """Report fulfillment progress for a Stripe Checkout session as JSON."""
+    job = Job.query.filter_by(key=f"checkout:{request.args.get('session_id', '')}").first()
+    if job is None or job.payload.get("user_id") != current_user.id:
+        # Stripe has not called the webhook yet
+        return jsonify(status="waiting")
+
+    if job.status == "done":
+        adjust_cart_count(value=0)
+        # The order was written by a worker; make sure the history page can see it
+        stick_to_primary()
+        return jsonify(status="done", order_id=(job.result or {}).get("order_id"),
+                       redirect=url_for("main_bp.orders"))
+    if job.status == "failed":
+        return jsonify(status="failed",
+                       message="We could not complete your order. Our team has been notified.")
+    return jsonify(status="processing")
+
+
+def _hold_key(checkout_session):
+    """The stock hold key checkout() put in the session metadata, if any."""
+    metadata = checkout_session["metadata"] if "metadata" in checkout_session else None
+    return metadata["hold_key"] if metadata and "hold_key" in metadata else None
+
+
+def _expire_earlier_checkouts(user_id):
+    """
+    Free the stock of the user's earlier, unpaid checkouts by expiring their
+    Stripe sessions. A session Stripe won't expire may have been paid, so its
+    holds are kept for fulfillment and lapse with the session otherwise.
+    """
+    for hold_key, session_id in open_checkouts(user_id):
+        try:
+            get_gateway().expire_checkout_session(session_id)
+        except (PaymentUnavailableError, stripe.StripeError):
+            continue
+        release(hold_key)
 
-    CartItem.query.filter_by(user_id=current_user.id).delete()
-    db.session.commit()
 
-    flash("Payment successful! Thank you for your purchase.")
-    return redirect(url_for("main_bp.index"))
+@main_bp.route("/stripe/webhook", methods=["POST"])
+def stripe_webhook():
+    """
+    Stripe webhook receiver. Verifies the signature and queues fulfillment
+    for paid checkout sessions; the work itself runs in `flask jobs work`.
+    """
+    try:
+        event = stripe.Webhook.construct_event(
+            request.get_data(), request.headers.get("Stripe-Signature", ""),
+            current_app.config["STRIPE_WEBHOOK_SECRET"],
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return jsonify(error="invalid payload"), 400
+
+    if event["type"] == "checkout.session.completed":
+        checkout_session = event["data"]["object"]
+        if checkout_session["payment_status"] == "paid" and checkout_session["client_reference_id"]:
+            # The session id doubles as the idempotency key: Stripe retries are no-ops
+            enqueue("fulfill_order", f"checkout:{checkout_session['id']}", {
+                "user_id": int(checkout_session["client_reference_id"]),
+                "checkout_session_id": checkout_session["id"],
+                "hold_key": _hold_key(checkout_session),
+            })
+    elif event["type"] == "checkout.session.expired":
+        # Abandoned checkout: give the stock back now rather than when the holds lapse
+        hold_key = _hold_key(event["data"]["object"])
+        if hold_key:
+            release(hold_key)
+
+    return jsonify(received=True)
 # -------------------------------
 # Order History
 # -------------------------------
 
 @main_bp.route("/orders")
 @login_required
+@use_replica
 def orders():
-    user_orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.timestamp.desc()).all()
-    return render_template("orders.html", orders=user_orders)
+    # Items are batch-loaded and carry their own product snapshot: two queries per page
+    user_orders = Order.query.filter_by(user_id=current_user.id).options(selectinload(Order.items))
+    page = paginate_keyset(
+        user_orders, Order.id, current_app.config["ORDERS_PER_PAGE"],
+        sort_column=Order.timestamp, descending=True,
+        after=request.args.get("after"), before=request.args.get("before"),
+    )
+    return render_template("orders.html", orders=page.items, page=page)
 
 
 # -------------------------------
@@ -259,12 +541,13 @@ def orders():
 @main_bp.route("/profile", methods=["GET", "POST"])
 @login_required
 def profile():
-    form = ProfileForm(obj=current_user)
+    user = current_user.record
+    form = ProfileForm(obj=user)
 
     if form.validate_on_submit():
-        current_user.address = form.address.data
-        current_user.preferences = form.preferences.data
-        db.session.commit()
+        user.address = form.address.data
+        user.preferences = form.preferences.data
+        db.session.commit()  # also drops the user's cached identity
         flash("Profile updated successfully.")
         return redirect(url_for("main_bp.profile"))
 
@@ -275,8 +558,10 @@ def profile():
 
 @main_bp.route("/wishlist")
 @login_required
+@use_replica
 def wishlist():
-    wishlist = WishlistItem.query.filter_by(user_id=current_user.id).all()
+    wishlist = WishlistItem.query.options(joinedload(WishlistItem.product)) \
+        .filter_by(user_id=current_user.id).all()
     return render_template("wishlist.html", wishlist=wishlist)
 
 
@@ -307,6 +592,29 @@ def remove_from_wishlist(product_id):
         flash("Item not found in wishlist.")
     return redirect(request.referrer or url_for("main_bp.index"))
 # -------------------------------
+# Admin Analytics
+# -------------------------------
+
+# Date ranges (in days) the dashboard offers
+ANALYTICS_RANGES = (7, 30, 90, 365)
+
+
+@main_bp.route("/admin/analytics")
+@login_required
+@use_replica
+def admin_analytics():
+    """Sales dashboard. Reads only the rollup tables, never Order/OrderItem."""
+    if not current_user.is_admin:
+        flash("Unauthorized.")
+        return redirect(url_for("main_bp.index"))
+
+    days = request.args.get("days", 30, type=int)
+    if days not in ANALYTICS_RANGES:
+        days = 30
+    return render_template("admin_analytics.html", report=dashboard(days),
+                           days=days, ranges=ANALYTICS_RANGES)
+
+# -------------------------------
 # User Authentication
 # -------------------------------
 
@@ -315,7 +623,16 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and check_password_hash(user.password, form.password.data):
+        try:
+            matches, new_hash = verify_password(user.password, form.password.data) if user else (False, None)
+        except PasswordHasherBusy:
+            flash("We're handling a lot of sign-ins right now. Please try again in a moment.")
+            return render_template("login.html", form=form), 503
+        if matches:
+            if new_hash:
+                # Stored hash used older parameters; upgrade it now that we know the password
+                user.password = new_hash
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             flash("Logged in successfully.")
             return redirect(url_for("main_bp.index"))
@@ -340,7 +657,11 @@ def register():
             flash("Email already registered.")
             return redirect(url_for("main_bp.register"))
 
-        hashed_password = generate_password_hash(form.password.data)
+        try:
+            hashed_password = hash_password(form.password.data)
+        except PasswordHasherBusy:
+            flash("We're handling a lot of sign-ups right now. Please try again in a moment.")
+            return render_template("register.html", form=form), 503
         user = User(email=form.email.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
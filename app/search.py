@@ -0,0 +1,168 @@
+"""
+search.py
+
+Full-text product search for the catalog.
+Uses an FTS5 virtual table on SQLite and a GIN-indexed tsvector expression on
+PostgreSQL, with relevance ranking and prefix matching on every search term.
+The index is kept in sync by the database itself (triggers on SQLite, an
+expression index on PostgreSQL), so Product writes need no extra bookkeeping.
+"""
+
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Float, Integer, bindparam, func, literal_column, select, text
+
+from . import db
+from .models import Product
+
+# Name of the FTS5 table / GIN index backing the search
+FTS_TABLE = "product_fts"
+PG_INDEX = "ix_product_search"
+
+# Expression indexed on PostgreSQL; queries must use the same expression
+PG_VECTOR_SQL = (
+    "to_tsvector('english', coalesce({table}name, '') || ' ' || "
+    "coalesce({table}description, ''))"
+)
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON product USING GIN ({PG_VECTOR_SQL.format(table='')})",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def tokenize(query):
+    """Split a raw search string into safe search terms."""
+    return _TOKEN_RE.findall(query.lower())
+
+
+def ranked_matches(query):
+    """
+    Return a subquery of (product_id, rank) rows matching the search string,
+    or None when the query has no searchable terms.
+    Lower rank means a better match on every backend.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return None
+
+    dialect = _dialect()
+
+    if dialect == "sqlite":
+        # Every term must match; a trailing * turns each term into a prefix match
+        match = " ".join(f'"{term}"*' for term in terms)
+        return (
+            text(
+                f"SELECT rowid AS product_id, bm25({FTS_TABLE}) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+            )
+            .bindparams(match=match)
+            .columns(product_id=Integer, rank=Float)
+            .subquery("search_matches")
+        )
+
+    if dialect == "postgresql":
+        vector = literal_column(PG_VECTOR_SQL.format(table="product."))
+        tsquery = func.to_tsquery(
+            literal_column("'english'"),
+            bindparam("tsquery", " & ".join(f"{term}:*" for term in terms)),
+        )
+        # ts_rank grows with relevance, so negate it to keep "lower is better"
+        return (
+            select(Product.id.label("product_id"), (-func.ts_rank(vector, tsquery)).label("rank"))
+            .where(vector.op("@@")(tsquery))
+            .subquery("search_matches")
+        )
+
+    return None
+
+
+def apply_search(products, query):
+    """
+    Restrict a Product query to full-text matches for `query`.
+    Returns the filtered query and the rank column (None if no ranking applies).
+    Falls back to a LIKE scan on databases without a full-text backend.
+    """
+    matches = ranked_matches(query)
+    if matches is not None:
+        products = products.join(matches, Product.id == matches.c.product_id)
+        return products, matches.c.rank
+
+    for term in tokenize(query):
+        products = products.filter(
+            Product.name.ilike(f"%{term}%") | Product.description.ilike(f"%{term}%")
+        )
+    return products, None
+
+
+def create_search_index():
+    """Create the full-text index objects for the current database if missing."""
+    dialect = _dialect()
+    statements = {"sqlite": SQLITE_DDL, "postgresql": POSTGRES_DDL}.get(dialect, [])
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+    return dialect
+
+
+def rebuild_search_index():
+    """Repopulate the full-text index from the product table."""
+    dialect = create_search_index()
+    if dialect == "sqlite":
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        db.session.execute(text(f"REINDEX INDEX {PG_INDEX}"))
+    db.session.commit()
+    return dialect
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keep Alembic autogenerate from trying to drop the FTS5 shadow tables."""
+    if type_ == "table" and name.startswith(FTS_TABLE):
+        return False
+    return True
+
+
+# -------------------------------
+# CLI: flask search rebuild
+# -------------------------------
+
+search_cli = AppGroup("search", help="Manage the product full-text search index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Create (if needed) and fully rebuild the product search index."""
+    dialect = rebuild_search_index()
+    count = db.session.query(Product.id).count()
+    click.echo(f"Rebuilt {dialect} search index for {count} products.")
@@ -21,3 +21,371 @@ function handleCheckoutSubmit(form) {
         }, 500); // Lock again after small delay
     }
 }
+
+/**
+ * Polls the order fulfillment status after Stripe Checkout and redirects
+ * to the order history once the order has been created.
+ * @param {HTMLElement} container - Element carrying a data-status-url attribute.
+ */
+function pollCheckoutStatus(container) {
+    if (!container) {
+        return;
+    }
+
+    const message = document.getElementById("checkout-status-message");
+    const spinner = container.querySelector(".spinner-border");
+    let delay = 1000;
+
+    const poll = () => {
+        fetch(container.dataset.statusUrl, { headers: { "Accept": "application/json" } })
+            .then((response) => response.json())
+            .then((data) => {
+                if (data.status === "done") {
+                    message.textContent = "Order confirmed! Redirecting to your orders...";
+                    window.location.href = data.redirect;
+                    return;
+                }
+                if (data.status === "failed") {
+                    spinner.remove();
+                    message.textContent = data.message;
+                    return;
+                }
+                // Back off gently while waiting for the webhook and worker
+                delay = Math.min(delay * 1.5, 5000);
+                setTimeout(poll, delay);
+            })
+            .catch(() => setTimeout(poll, 5000));
+    };
+
+    poll();
+}
+
+/**
+ * Sends cart changes to the JSON cart API in batches.
+ * Changes made within `delay` ms of each other go out as one request, and
+ * repeated edits to the same product collapse into a single operation, so a
+ * burst of clicks costs one round trip and one commit.
+ * @param {Object} options - { onUpdate(cart), onError(message, cart), delay }.
+ * @returns {{queue: Function, flush: Function}|null} Null when logged out.
+ */
+function createCartClient({ onUpdate, onError, delay = 400 }) {
+    const apiUrl = document.querySelector('meta[name="cart-api"]');
+    const csrfToken = document.querySelector('meta[name="csrf-token"]');
+    if (!apiUrl || !csrfToken) {
+        return null;
+    }
+
+    let pending = new Map();  // product id -> operation
+    let timer = null;
+    let inFlight = null;
+
+    const send = () => {
+        timer = null;
+        if (inFlight) {
+            // One request at a time keeps the server's view in click order
+            inFlight.then(send);
+            return;
+        }
+        if (pending.size === 0) {
+            return;
+        }
+        const operations = Array.from(pending.values());
+        pending = new Map();
+
+        inFlight = fetch(apiUrl.content, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "X-CSRFToken": csrfToken.content,
+            },
+            body: JSON.stringify({ operations }),
+        })
+            .then((response) => response.json().then((data) => {
+                if (response.ok) {
+                    onUpdate(data);
+                } else {
+                    onError(data.error || "Could not update your cart.", data.cart);
+                }
+            }))
+            .catch(() => onError("Could not reach the server. Please try again."))
+            .finally(() => { inFlight = null; });
+    };
+
+    const flush = () => {
+        clearTimeout(timer);
+        send();
+    };
+
+    const queue = (op, productId, quantity = 1) => {
+        const previous = pending.get(productId);
+        if (op === "add" && previous) {
+            // Fold into the queued operation: add+add and set+add raise its quantity,
+            // and remove+add means "exactly this many"
+            if (previous.op === "remove") {
+                op = "set";
+            } else {
+                quantity += previous.quantity;
+                op = previous.op;
+            }
+        }
+        pending.set(productId, { op, product_id: productId, quantity });
+        clearTimeout(timer);
+        timer = setTimeout(send, delay);
+    };
+
+    return { queue, flush };
+}
+
+/**
+ * Updates the navbar cart badge.
+ * @param {number} count - Total quantity in the cart.
+ */
+function setCartCount(count) {
+    const badge = document.getElementById("cart-count");
+    if (badge) {
+        badge.textContent = count;
+        badge.classList.toggle("d-none", count <= 0);
+    }
+}
+
+/**
+ * Turns "Add to Cart" links into batched API calls (the links still work without JS).
+ * @param {NodeList} buttons - Elements carrying a data-cart-add product id.
+ */
+function initAddToCartButtons(buttons) {
+    const status = document.getElementById("cart-status");
+    const client = createCartClient({
+        onUpdate: (cart) => {
+            setCartCount(cart.count);
+            if (status) {
+                status.textContent = "Added to cart.";
+            }
+        },
+        onError: (message, cart) => {
+            if (cart) {
+                setCartCount(cart.count);
+            }
+            if (status) {
+                status.textContent = message;
+            }
+        },
+    });
+    if (!client) {
+        return;
+    }
+
+    buttons.forEach((button) => {
+        button.addEventListener("click", (event) => {
+            event.preventDefault();
+            client.queue("add", Number(button.dataset.cartAdd));
+        });
+    });
+}
+
+/**
+ * Makes the cart table edit quantities and remove lines in place.
+ * Quantity typing is debounced into one request; removals are sent at once.
+ * @param {HTMLTableElement} table - The cart table, or null when the cart is empty.
+ */
+function initCartPage(table) {
+    if (!table) {
+        return;
+    }
+
+    const status = document.getElementById("cart-status");
+    const money = (value) => `$${value.toFixed(2)}`;
+
+    const render = (cart) => {
+        const lines = new Map(cart.items.map((line) => [line.product_id, line]));
+        if (lines.size === 0) {
+            // Let the server render the empty-cart state
+            window.location.reload();
+            return;
+        }
+        table.querySelectorAll("tr[data-product-id]").forEach((row) => {
+            const line = lines.get(Number(row.dataset.productId));
+            if (!line) {
+                row.remove();
+                return;
+            }
+            const input = row.querySelector("[data-cart-quantity]");
+            if (document.activeElement !== input) {
+                input.value = line.quantity;
+            }
+            input.max = line.stock || 1;
+            row.querySelector("[data-cart-subtotal]").textContent = money(line.subtotal);
+        });
+        document.getElementById("cart-total").textContent = money(cart.total);
+        setCartCount(cart.count);
+    };
+
+    const client = createCartClient({
+        onUpdate: (cart) => {
+            status.textContent = "";
+            render(cart);
+        },
+        onError: (message, cart) => {
+            status.textContent = message;
+            if (cart) {
+                render(cart);
+            }
+        },
+    });
+    if (!client) {
+        return;
+    }
+
+    table.querySelectorAll("tr[data-product-id]").forEach((row) => {
+        const productId = Number(row.dataset.productId);
+        const input = row.querySelector("[data-cart-quantity]");
+        const form = input.closest("form");
+
+        input.addEventListener("input", () => {
+            const quantity = parseInt(input.value, 10);
+            if (quantity >= 1) {
+                client.queue("set", productId, quantity);
+            }
+        });
+        form.addEventListener("submit", (event) => {
+            event.preventDefault();
+            client.flush();
+        });
+        row.querySelector("[data-cart-remove]").addEventListener("click", (event) => {
+            // The inline confirm() has already cancelled the click if the user said no
+            if (event.defaultPrevented) {
+                return;
+            }
+            event.preventDefault();
+            client.queue("remove", productId);
+            client.flush();
+        });
+    });
+}
+
+/**
+ * Shows product and category suggestions under the search box as the user types.
+ * Keystrokes are debounced into one request, answers to superseded requests are
+ * dropped, and results are remembered per query so backspacing costs nothing.
+ * Arrow keys move through the list, Enter opens the highlighted entry and
+ * Escape closes it; without a highlight the form submits as usual.
+ * @param {HTMLInputElement} input - Search input carrying a data-suggest-url attribute.
+ * @param {number} delay - Milliseconds of typing pause before asking the server.
+ */
+function initSearchSuggest(input, delay = 150) {
+    if (!input) {
+        return;
+    }
+
+    const list = document.createElement("div");
+    list.id = "search-suggestions";
+    list.className = "list-group position-absolute shadow-sm d-none";
+    list.style.zIndex = 1000;
+    list.style.left = "calc(var(--bs-gutter-x) * .5)";
+    list.style.right = "calc(var(--bs-gutter-x) * .5)";
+    list.setAttribute("role", "listbox");
+    input.after(list);
+    input.setAttribute("role", "combobox");
+    input.setAttribute("aria-autocomplete", "list");
+    input.setAttribute("aria-controls", list.id);
+    input.setAttribute("aria-expanded", "false");
+
+    const results = new Map();  // query -> response
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    const items = () => Array.from(list.querySelectorAll("a"));
+
+    const hide = () => {
+        list.classList.add("d-none");
+        input.setAttribute("aria-expanded", "false");
+        active = -1;
+    };
+
+    const highlight = (index) => {
+        const entries = items();
+        active = entries.length ? (index + entries.length) % entries.length : -1;
+        entries.forEach((entry, position) => {
+            entry.classList.toggle("active", position === active);
+            entry.setAttribute("aria-selected", position === active ? "true" : "false");
+        });
+    };
+
+    const render = (data) => {
+        list.replaceChildren();
+        data.categories.forEach((category) => {
+            const entry = document.createElement("a");
+            entry.href = category.url;
+            entry.className = "list-group-item list-group-item-action small text-muted";
+            entry.textContent = `Category: ${category.name}`;
+            list.append(entry);
+        });
+        data.products.forEach((product) => {
+            const entry = document.createElement("a");
+            entry.href = product.url;
+            entry.className = "list-group-item list-group-item-action";
+            entry.textContent = product.name;
+            list.append(entry);
+        });
+        items().forEach((entry) => entry.setAttribute("role", "option"));
+        active = -1;
+        const empty = list.childElementCount === 0;
+        list.classList.toggle("d-none", empty);
+        input.setAttribute("aria-expanded", empty ? "false" : "true");
+    };
+
+    const lookup = () => {
+        const query = input.value.trim();
+        if (!query) {
+            hide();
+            return;
+        }
+        if (results.has(query)) {
+            render(results.get(query));
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`, {
+            headers: { "Accept": "application/json" },
+            signal: controller.signal,
+        })
+            .then((response) => (response.ok ? response.json() : null))
+            .then((data) => {
+                if (!data) {
+                    return;
+                }
+                results.set(query, data);
+                // Typing may have moved on while this was in flight
+                if (input.value.trim() === query) {
+                    render(data);
+                }
+            })
+            .catch(() => {});  // Aborted or offline: the plain search still works
+    };
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        timer = setTimeout(lookup, delay);
+    });
+    input.addEventListener("keydown", (event) => {
+        if (list.classList.contains("d-none")) {
+            return;
+        }
+        if (event.key === "ArrowDown" || event.key === "ArrowUp") {
+            event.preventDefault();
+            highlight(active + (event.key === "ArrowDown" ? 1 : -1));
+        } else if (event.key === "Enter" && active >= 0) {
+            event.preventDefault();
+            window.location.href = items()[active].href;
+        } else if (event.key === "Escape") {
+            hide();
+        }
+    });
+    // Keep focus in the input while a suggestion is clicked, then close on blur
+    list.addEventListener("mousedown", (event) => event.preventDefault());
+    input.addEventListener("blur", hide);
+}
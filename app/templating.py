@@ -0,0 +1,105 @@
+"""
+templating.py
+
+Jinja performance settings.
+Compiled templates are kept in a persistent bytecode cache so new workers
+skip compiling templates again, and the `{% cache key, ttl %}` tag stores rendered
+fragments in a per-process LRU bounded by entries and bytes:
+
+    {% cache ("product-card", product.id, product.version), 600 %}
+        ...
+    {% endcache %}
+
+Keys should include whatever the fragment depends on (e.g. Product.version,
+which every product UPDATE increments). The ttl is optional and defaults
+to FRAGMENT_CACHE_TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments with per-entry expiry."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            html, expires_at = entry
+            if expires_at < time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return html
+
+    def put(self, key, html, ttl, max_entries, max_bytes):
+        if len(html) > max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (html, time.monotonic() + ttl)
+            self._size += len(html)
+            while self._entries and (len(self._entries) > max_entries or self._size > max_bytes):
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds `{% cache key[, ttl] %}...{% endcache %}` backed by fragment_cache."""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if("comma") else nodes.Const(None)
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", [key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        config = current_app.config
+        # Debug mode edits templates live, so never serve stale fragments there
+        if not config["FRAGMENT_CACHE_ENABLED"] or current_app.debug:
+            return caller()
+
+        html = fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            fragment_cache.put(key, html, config["FRAGMENT_CACHE_TTL"] if ttl is None else ttl,
+                               config["FRAGMENT_CACHE_MAX_ENTRIES"], config["FRAGMENT_CACHE_MAX_BYTES"])
+        return Markup(html)
+
+
+def init_templating(app):
+    """Attach the bytecode cache and the fragment cache tag to the app's Jinja env."""
+    cache_dir = app.config["JINJA_BYTECODE_CACHE_DIR"]
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,8 @@
+"""
+benchmarks
+
+Reproducible load tests for the ShopNow app.
+`python -m benchmarks seed` fills a database with seeded synthetic data,
+`python -m benchmarks run` drives the real routes with concurrent clients,
+and `python -m benchmarks compare` diffs two saved result files.
+"""
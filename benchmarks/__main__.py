@@ -0,0 +1,241 @@
+"""
+__main__.py
+
+Command-line entry point: python -m benchmarks {seed,run,compare,contention,payments}.
+
+Examples:
+    python -m benchmarks seed --products 100000 --reviews 1000000
+    python -m benchmarks run --concurrency 16 --output results/wal.json
+    python -m benchmarks run --env SQLITE_WAL=0 --output results/rollback.json
+    python -m benchmarks compare results/rollback.json results/wal.json
+    python -m benchmarks run --scenario catalog_home --background login --output results/storm.json
+    python -m benchmarks contention --buyers 500 --stock 50
+    python -m benchmarks payments --calls 500 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+
+def _parse_env(pairs):
+    env = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--env expects KEY=VALUE, got '{pair}'")
+        env[key] = value
+    return env
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _create_app(env):
+    # Config is read at import time, so overrides must land before the app is imported
+    os.environ.update(env)
+    from app import create_app
+    return create_app()
+
+
+def seed_command(args):
+    from .datagen import generate
+
+    app = _create_app(_parse_env(args.env))
+    with app.app_context():
+        counts = generate(users=args.users, products=args.products, reviews=args.reviews,
+                          orders=args.orders, cart_items=args.cart_items,
+                          wishlist_items=args.wishlist_items, seed=args.seed)
+    print(json.dumps(counts, indent=2))
+
+
+def run_command(args):
+    from .runner import run_scenarios
+    from .scenarios import SCENARIOS, SCENARIOS_BY_NAME
+
+    env = _parse_env(args.env)
+    app = _create_app(env)
+    if args.scenario:
+        unknown = set(args.scenario) - set(SCENARIOS_BY_NAME)
+        if unknown:
+            raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        scenarios = [SCENARIOS_BY_NAME[name] for name in args.scenario]
+    else:
+        scenarios = SCENARIOS
+
+    background = None
+    if args.background:
+        if args.background not in SCENARIOS_BY_NAME:
+            raise SystemExit(f"Unknown background scenario: {args.background}")
+        background = SCENARIOS_BY_NAME[args.background]
+
+    results = run_scenarios(app, scenarios, args.requests, args.concurrency,
+                            mode=args.mode, seed=args.seed, background=background,
+                            background_concurrency=args.background_concurrency)
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "seed": args.seed,
+            "background": args.background,
+            "background_concurrency": args.background_concurrency if args.background else 0,
+            "database": app.config["SQLALCHEMY_DATABASE_URI"].split("://", 1)[0],
+            "env": env,
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def compare_command(args):
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)["scenarios"]
+    with open(args.candidate) as fh:
+        candidate = json.load(fh)["scenarios"]
+
+    regressions = 0
+    print(f"{'scenario':<22} {'p50 ms':>18} {'p95 ms':>18} {'rps':>18} {'q/req':>12}")
+    for name in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[name], candidate[name]
+        cells = []
+        for key, higher_is_better in (("p50_ms", False), ("p95_ms", False), ("throughput_rps", True)):
+            change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+            worse = -change if higher_is_better else change
+            flag = "!" if worse > args.threshold else " "
+            regressions += flag == "!"
+            cells.append(f"{new[key]:>9.2f} ({change:+6.1%}){flag}")
+        queries = f"{old['queries_per_request']:.1f}->{new['queries_per_request']:.1f}"
+        if new["queries_per_request"] > old["queries_per_request"]:
+            queries += "!"
+            regressions += 1
+        print(f"{name:<22} {' '.join(cells)} {queries:>12}")
+
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}.")
+        sys.exit(1)
+
+
+def contention_command(args):
+    from .contention import run_contention
+
+    app = _create_app(_parse_env(args.env))
+    report = run_contention(app, args.buyers, args.stock, quantity=args.quantity,
+                            concurrency=args.concurrency, product_id=args.product)
+    print(f"{report['buyers']} buyers, stock {report['stock']}: {report['granted']} granted, "
+          f"{report['refused']} refused, {report['errors']} errors, {report['units_held']} units held"
+          f"{' (OVERSOLD)' if report['oversold'] else ''}")
+    print(f"hold latency p50 {report['p50_ms']:.2f} ms  p95 {report['p95_ms']:.2f} ms  "
+          f"p99 {report['p99_ms']:.2f} ms  max {report['max_ms']:.2f} ms")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    if report["oversold"] or report["errors"]:
+        sys.exit(1)
+
+
+def payments_command(args):
+    from .payments import run_payments
+
+    app = _create_app(_parse_env(args.env))
+    report = run_payments(app, args.calls, args.concurrency, latency_ms=args.latency_ms,
+                          error_rate=args.error_rate, drop_rate=args.drop_rate)
+    for name in ("healthy", "flaky", "outage", "trial", "recovery"):
+        phase = report[name]
+        print(f"{name:<9} ok {phase['ok']:>4}  unavailable {phase['unavailable']:>4}  "
+              f"upstream {phase['upstream_requests']:>4}  connections {phase['connections_opened']:>3}  "
+              f"sessions {phase['sessions_created']:>4}  p50 {phase['p50_ms']:8.2f} ms  "
+              f"p99 {phase['p99_ms']:8.2f} ms  max {phase['max_ms']:8.2f} ms  breaker {phase['breaker']}")
+    for check, passed in report["checks"].items():
+        print(f"{'ok  ' if passed else 'FAIL'} {check}")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    if not all(report["checks"].values()):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed = commands.add_parser("seed", help="Populate the database with synthetic data.")
+    seed.add_argument("--users", type=int, default=1000)
+    seed.add_argument("--products", type=int, default=10000)
+    seed.add_argument("--reviews", type=int, default=50000)
+    seed.add_argument("--orders", type=int, default=20000)
+    seed.add_argument("--cart-items", type=int, default=2000)
+    seed.add_argument("--wishlist-items", type=int, default=5000)
+    seed.add_argument("--seed", type=int, default=42)
+    seed.add_argument("--env", action="append", metavar="KEY=VALUE", help="Config override.")
+    seed.set_defaults(func=seed_command)
+
+    run = commands.add_parser("run", help="Drive the routes and report latency.")
+    run.add_argument("--mode", choices=["client", "server"], default="client")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--requests", type=int, default=500, help="Requests per scenario.")
+    run.add_argument("--scenario", action="append", help="Only run the named scenario(s).")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--background", metavar="SCENARIO",
+                     help="Keep this scenario running in the background while measuring, e.g. login.")
+    run.add_argument("--background-concurrency", type=int, default=8)
+    run.add_argument("--env", action="append", metavar="KEY=VALUE",
+                     help="Config override, e.g. SQLITE_WAL=0 or DATABASE_REPLICA_URL=...")
+    run.add_argument("--output", help="Write results as JSON to this path.")
+    run.set_defaults(func=run_command)
+
+    compare = commands.add_parser("compare", help="Diff two result files and flag regressions.")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="Relative slowdown that counts as a regression (default 0.10).")
+    compare.set_defaults(func=compare_command)
+
+    contention = commands.add_parser("contention",
+                                      help="Race many buyers for one product's stock holds.")
+    contention.add_argument("--buyers", type=int, default=300)
+    contention.add_argument("--stock", type=int, default=50)
+    contention.add_argument("--quantity", type=int, default=1, help="Units each buyer wants.")
+    contention.add_argument("--concurrency", type=int, default=64)
+    contention.add_argument("--product", type=int, help="Product id (default: the first product).")
+    contention.add_argument("--env", action="append", metavar="KEY=VALUE", help="Config override.")
+    contention.add_argument("--output", help="Write results as JSON to this path.")
+    contention.set_defaults(func=contention_command)
+
+    payments = commands.add_parser("payments",
+                                    help="Exercise the Stripe gateway against a local fake Stripe API.")
+    payments.add_argument("--calls", type=int, default=300, help="Checkout sessions per phase.")
+    payments.add_argument("--concurrency", type=int, default=8)
+    payments.add_argument("--latency-ms", type=float, default=50, help="Fake Stripe response time.")
+    payments.add_argument("--error-rate", type=float, default=0.2, help="Share of 500s in the flaky phase.")
+    payments.add_argument("--drop-rate", type=float, default=0.1,
+                          help="Share of lost responses in the flaky phase.")
+    payments.add_argument("--env", action="append", metavar="KEY=VALUE", help="Config override.")
+    payments.add_argument("--output", help="Write results as JSON to this path.")
+    payments.set_defaults(func=payments_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+contention.py
+
+Flash-sale contention benchmark for checkout stock holds.
+Many buyers try to hold the same product at once, as checkout() does
+before creating the Stripe session. The run reports hold latency and
+checks that the units granted never exceed the stock. Holds are released
+and the product's stock is restored afterwards.
+"""
+
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Product, StockHold, User
+from app.reservations import OutOfStockError, release, reserve
+
+from .runner import summarize
+
+
+def run_contention(app, buyers, stock, quantity=1, concurrency=64, product_id=None):
+    """Have `buyers` users race to hold `quantity` units of one product; returns a report."""
+    with app.app_context():
+        user_ids = db.session.scalars(select(User.id).order_by(User.id).limit(buyers)).all()
+        if len(user_ids) < buyers:
+            raise SystemExit(f"Need {buyers} users, the database has {len(user_ids)}; seed more.")
+        product = db.session.get(Product, product_id) if product_id else \
+            db.session.scalars(select(Product).order_by(Product.id).limit(1)).first()
+        if product is None:
+            raise SystemExit("No product to run against; seed the database first.")
+        product_id, name, price, original_stock = product.id, product.name, product.price, product.stock
+        product.stock = stock
+        db.session.commit()
+
+    ttl = app.config["STOCK_HOLD_TTL"]
+    keys, latencies, lock = [], [], threading.Lock()
+    outcomes = {"granted": 0, "refused": 0, "errors": 0}
+
+    def buy(user_id):
+        key = secrets.token_hex(16)
+        with app.app_context():
+            started = time.perf_counter()
+            try:
+                reserve(user_id, key, [(product_id, quantity, name, price)], ttl)
+                outcome = "granted"
+            except OutOfStockError:
+                outcome = "refused"
+            except Exception:
+                outcome = "errors"
+            finally:
+                db.session.remove()
+            elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            outcomes[outcome] += 1
+            if outcome == "granted":
+                keys.append(key)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(buy, user_ids))
+    wall_seconds = time.perf_counter() - started
+
+    with app.app_context():
+        held = db.session.scalar(
+            select(func.coalesce(func.sum(StockHold.quantity), 0)).where(StockHold.product_id == product_id)
+        )
+        for key in keys:
+            release(key, commit=False)
+        db.session.get(Product, product_id).stock = original_stock
+        db.session.commit()
+
+    report = summarize(latencies, [], outcomes["errors"], wall_seconds)
+    report.update({
+        "buyers": buyers,
+        "stock": stock,
+        "quantity": quantity,
+        "granted": outcomes["granted"],
+        "refused": outcomes["refused"],
+        "units_held": held,
+        "oversold": held > stock,
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    })
+    return report
@@ -0,0 +1,191 @@
+"""
+datagen.py
+
+Seeded synthetic data generator.
+Populates users, products, reviews, orders/order items, cart items and
+wishlist items at a configurable scale using chunked bulk inserts, so a
+catalog of 100k products and 1M reviews loads in minutes. The same seed
+always produces the same data.
+"""
+
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, text, update
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.catalog import bump_catalog_version
+from app.models import CartItem, Order, OrderItem, Product, Review, User, WishlistItem
+
+BENCH_PASSWORD = "benchmark"
+BENCH_EMAIL = "bench{n}@example.com"
+
+CATEGORIES = [
+    "hoodies", "t-shirts", "jackets", "sneakers", "hats", "bags",
+    "jeans", "socks", "watches", "sunglasses", "scarves", "belts",
+]
+ADJECTIVES = [
+    "classic", "essential", "vintage", "urban", "organic", "premium", "slim",
+    "oversized", "lightweight", "waterproof", "recycled", "limited", "everyday",
+]
+COLORS = ["black", "white", "navy", "olive", "sand", "red", "grey", "blue", "green"]
+WORDS = [
+    "cotton", "comfortable", "durable", "soft", "stretch", "breathable", "warm",
+    "stylish", "relaxed", "fit", "wash", "care", "fabric", "quality", "design",
+    "pocket", "zip", "lined", "layer", "season", "travel", "street", "weekend",
+]
+
+CHUNK_SIZE = 5000
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(model, rows):
+    count = 0
+    for batch in _chunks(rows):
+        db.session.execute(insert(model), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def generate(users=1000, products=10000, reviews=50000, orders=20000,
+             cart_items=2000, wishlist_items=5000, seed=42, log=print):
+    """Insert a synthetic data set and return a dict of row counts."""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    counts = {}
+
+    # One hash shared by every benchmark user keeps seeding fast
+    password = generate_password_hash(BENCH_PASSWORD)
+    first_user = _next_id(User)
+    counts["users"] = _bulk_insert(User, (
+        {"id": first_user + n, "email": BENCH_EMAIL.format(n=first_user + n), "password": password,
+         "is_admin": False, "address": f"{rng.randint(1, 999)} Bench Street"}
+        for n in range(users)
+    ))
+    user_ids = range(first_user, first_user + users)
+    log(f"users: {counts['users']}")
+
+    first_product = _next_id(Product)
+    counts["products"] = _bulk_insert(Product, (
+        {"id": first_product + n,
+         "name": f"{rng.choice(ADJECTIVES).title()} {rng.choice(COLORS).title()} "
+                 f"{rng.choice(CATEGORIES).rstrip('s').title()} {n}",
+         "description": _sentence(rng, rng.randint(8, 30)),
+         "price": round(rng.uniform(5, 300), 2),
+         "image_url": None,
+         "category": rng.choice(CATEGORIES),
+         "stock": rng.randint(0, 500)}
+        for n in range(products)
+    ))
+    product_ids = range(first_product, first_product + products)
+    prices = {}
+    names = {}
+    for row in db.session.query(Product.id, Product.price, Product.name).filter(Product.id >= first_product):
+        prices[row.id], names[row.id] = row.price, row.name
+    log(f"products: {counts['products']}")
+
+    now = datetime.utcnow()
+    ratings = defaultdict(lambda: [0] * 6)
+
+    def review_rows():
+        for _ in range(reviews):
+            product_id = rng.choice(product_ids)
+            rating = rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 5])[0]
+            ratings[product_id][rating] += 1
+            yield {"user_id": rng.choice(user_ids), "product_id": product_id, "rating": rating,
+                   "comment": _sentence(rng, rng.randint(4, 20)),
+                   "timestamp": now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))}
+
+    counts["reviews"] = _bulk_insert(Review, review_rows())
+    _store_rating_aggregates(ratings)
+    log(f"reviews: {counts['reviews']}")
+
+    # Orders and their items are generated and inserted one chunk at a time
+    first_order = _next_id(Order)
+    counts["orders"] = counts["order_items"] = 0
+    for chunk_start in range(0, orders, CHUNK_SIZE):
+        order_rows, item_rows = [], []
+        for n in range(chunk_start, min(chunk_start + CHUNK_SIZE, orders)):
+            order_id = first_order + n
+            total = 0.0
+            for product_id in rng.sample(product_ids, k=min(rng.randint(1, 5), products)):
+                quantity = rng.randint(1, 3)
+                total += prices[product_id] * quantity
+                item_rows.append({"order_id": order_id, "product_id": product_id, "quantity": quantity,
+                                  "unit_price": prices[product_id], "product_name": names[product_id]})
+            order_rows.append({"id": order_id, "user_id": rng.choice(user_ids), "total_amount": round(total, 2),
+                               "timestamp": now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))})
+        counts["orders"] += _bulk_insert(Order, order_rows)
+        counts["order_items"] += _bulk_insert(OrderItem, item_rows)
+    log(f"orders: {counts['orders']} ({counts['order_items']} items)")
+
+    # Cart and wishlist rows are unique per (user, product)
+    def unique_pairs(count):
+        seen = set()
+        while len(seen) < min(count, users * products):
+            seen.add((rng.choice(user_ids), rng.choice(product_ids)))
+        return seen
+
+    counts["cart_items"] = _bulk_insert(CartItem, (
+        {"user_id": user_id, "product_id": product_id, "quantity": rng.randint(1, 3)}
+        for user_id, product_id in unique_pairs(cart_items)
+    ))
+    counts["wishlist_items"] = _bulk_insert(WishlistItem, (
+        {"user_id": user_id, "product_id": product_id}
+        for user_id, product_id in unique_pairs(wishlist_items)
+    ))
+    log(f"cart items: {counts['cart_items']}, wishlist items: {counts['wishlist_items']}")
+
+    _sync_sequences()
+    bump_catalog_version(db.session)
+    db.session.commit()
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def _store_rating_aggregates(ratings):
+    """Write the per-product rating aggregates collected while generating reviews."""
+    rows = []
+    for product_id, buckets in ratings.items():
+        count = sum(buckets)
+        total = sum(stars * n for stars, n in enumerate(buckets))
+        row = {"id": product_id, "rating_count": count, "rating_sum": total, "rating_avg": total / count}
+        row.update({f"rating_count_{stars}": buckets[stars] for stars in range(1, 6)})
+        rows.append(row)
+    for batch in _chunks(rows):
+        db.session.execute(update(Product), batch)
+        db.session.commit()
+
+
+def _sync_sequences():
+    """Explicit ids bypass PostgreSQL sequences; move them past the inserted rows."""
+    if db.session.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("user", "product", "order"):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+        ))
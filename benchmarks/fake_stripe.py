@@ -0,0 +1,178 @@
+"""
+fake_stripe.py
+
+A local stand-in for the Stripe API, for exercising app/payments.py without
+the network. It serves POST /v1/checkout/sessions (and .../expire for open
+sessions) over keep-alive HTTP/1.1 and, like Stripe, replays the stored response when an idempotency key is
+repeated. It can be told to add latency, to answer a share of requests
+with 500s, to drop a share of connections after creating the session (a
+lost response), or to stop answering altogether. Requests, TCP connections
+and sessions created are counted so runs can check reuse and idempotency.
+It is also a fake event source: `webhook()` signs a checkout.session event
+for a session it created, the way Stripe calls /stripe/webhook.
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeStripe:
+    """A threaded fake Stripe API on 127.0.0.1; use as a context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, seed=1):
+        self.latency = 0.0  # Seconds added to every response
+        self.error_rate = 0.0  # Share of requests answered with a 500
+        self.drop_rate = 0.0  # Share of sessions created whose response is lost
+        self.hang = False  # Accept requests but never answer them
+        self.requests = 0
+        self.connections = 0
+        self.sessions_created = 0
+        self._responses = {}  # Idempotency key -> response body
+        self.sessions = {}  # Session id -> the session as created
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        # A short poll interval makes shutdown quick
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        name="fake-stripe", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def webhook(self, event_type, session_id, secret, **changes):
+        """
+        (payload, headers) of a signed `event_type` event for a session this
+        server created, with `changes` applied to it, e.g. payment_status="paid".
+        The changes are kept, so a paid session can no longer be expired.
+        """
+        with self._lock:
+            self.sessions[session_id].update(changes)
+            data_object = dict(self.sessions[session_id])
+        payload = json.dumps({
+            "id": f"evt_{secrets.token_hex(12)}",
+            "object": "event",
+            "type": event_type,
+            "data": {"object": data_object},
+        })
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return payload, {"Stripe-Signature": f"t={timestamp},v1={signature}",
+                         "Content-Type": "application/json"}
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._rng.random() < rate
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; Nagle would hold the body for the client's ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Request-Id", f"req_{secrets.token_hex(8)}")
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _expire(self, session_id):
+                with fake._lock:
+                    session = fake.sessions.get(session_id)
+                    expirable = session is not None and session["status"] == "open"
+                    if expirable:
+                        session["status"] = "expired"
+                        session = dict(session)
+                if not expirable:
+                    self._send(400, {"error": {"type": "invalid_request_error",
+                                               "message": "Only open sessions can be expired."}})
+                    return
+                self._send(200, session)
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+                with fake._lock:
+                    fake.requests += 1
+                if fake.hang:
+                    # Hold the request until the client gives up or the server stops
+                    fake._stopped.wait(60)
+                    self.close_connection = True
+                    return
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self.path.startswith("/v1/checkout/sessions/") and self.path.endswith("/expire"):
+                    self._expire(self.path.split("/")[4])
+                    return
+                if self.path != "/v1/checkout/sessions":
+                    self._send(404, {"error": {"type": "invalid_request_error", "message": "Unknown path"}})
+                    return
+
+                key = self.headers.get("Idempotency-Key")
+                with fake._lock:
+                    replay = fake._responses.get(key) if key else None
+                if replay is not None:
+                    self._send(200, replay, [("Idempotent-Replayed", "true")])
+                    return
+                if fake._roll(fake.error_rate):
+                    self._send(500, {"error": {"type": "api_error", "message": "Fake server error"}})
+                    return
+
+                session_id = f"cs_test_{secrets.token_hex(12)}"
+                body = {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+                    "client_reference_id": form.get("client_reference_id", [None])[0],
+                    "status": "open",
+                    "payment_status": "unpaid",
+                    "expires_at": int(form.get("expires_at", [0])[0]) or None,
+                    "metadata": {name[len("metadata["):-1]: values[0] for name, values in form.items()
+                                 if name.startswith("metadata[")},
+                }
+                with fake._lock:
+                    fake.sessions_created += 1
+                    fake.sessions[session_id] = body
+                    if key:
+                        fake._responses[key] = body
+                if fake._roll(fake.drop_rate):
+                    # Created, but the response never arrives: only the idempotency key saves a retry
+                    self.close_connection = True
+                    return
+                self._send(200, body)
+
+        return Handler
@@ -0,0 +1,112 @@
+"""
+payments.py
+
+Stripe gateway benchmark against the local fake Stripe API (fake_stripe.py).
+Concurrent checkouts create sessions through app/payments.py in four
+phases: healthy, flaky (500s and lost responses), outage (no answers at
+all) and recovery, which starts with the breaker's single trial call. Each phase reports call latency and checks what the
+gateway promises: connections are reused, retries never create a second
+session, calls during an outage end within the call budget and then fail
+fast with the circuit open, and the circuit closes once Stripe is back.
+"""
+
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.payments import PaymentUnavailableError, StripeGateway
+
+from .fake_stripe import FakeStripe
+from .runner import summarize
+
+# Settings for the run: short enough that the outage phase takes seconds, not minutes
+GATEWAY_SETTINGS = {
+    "STRIPE_CONNECT_TIMEOUT": 0.5,
+    "STRIPE_READ_TIMEOUT": 0.5,
+    "STRIPE_RETRY_BACKOFF": 0.05,
+    "STRIPE_CALL_BUDGET": 2.0,
+    "STRIPE_BREAKER_RESET": 1.0,
+    # The flaky phase fails over a quarter of attempts; five in a row across threads is common there
+    "STRIPE_BREAKER_FAILURES": 10,
+}
+
+
+def _run_phase(gateway, calls, concurrency):
+    latencies, outcomes = [], {"ok": 0, "unavailable": 0, "errors": 0}
+
+    def checkout(n):
+        started = time.perf_counter()
+        try:
+            gateway.create_checkout_session(
+                {"mode": "payment", "client_reference_id": str(n),
+                 "success_url": "http://localhost/success", "cancel_url": "http://localhost/cart"},
+                idempotency_key=f"checkout-{secrets.token_hex(16)}",
+            )
+            outcome = "ok"
+        except PaymentUnavailableError:
+            outcome = "unavailable"
+        except Exception:
+            outcome = "errors"
+        return time.perf_counter() - started, outcome
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, outcome in pool.map(checkout, range(calls)):
+            latencies.append(elapsed)
+            outcomes[outcome] += 1
+    report = summarize(latencies, [], outcomes["errors"], time.perf_counter() - started)
+    report.update(ok=outcomes["ok"], unavailable=outcomes["unavailable"],
+                  max_ms=round(max(latencies) * 1000, 3) if latencies else 0.0)
+    return report
+
+
+def run_payments(app, calls=300, concurrency=8, latency_ms=50, error_rate=0.2, drop_rate=0.1):
+    """Drive the gateway through each phase; returns {phase: report} plus "checks"."""
+    config = dict(app.config, **GATEWAY_SETTINGS)
+    config["STRIPE_SECRET_KEY"] = config["STRIPE_SECRET_KEY"] or "sk_test_fake"
+    phases, checks = {}, {}
+
+    with FakeStripe() as fake:
+        config["STRIPE_API_BASE"] = fake.url
+        gateway = StripeGateway(config)
+        fake.latency = latency_ms / 1000
+
+        def phase(name, phase_calls, workers=concurrency):
+            before = (fake.requests, fake.connections, fake.sessions_created)
+            report = _run_phase(gateway, phase_calls, workers)
+            report.update(upstream_requests=fake.requests - before[0],
+                          connections_opened=fake.connections - before[1],
+                          sessions_created=fake.sessions_created - before[2],
+                          breaker=gateway.breaker.state)
+            phases[name] = report
+            return report
+
+        healthy = phase("healthy", calls)
+        checks["healthy: every call succeeds"] = healthy["ok"] == calls
+        checks["healthy: connections are reused"] = healthy["connections_opened"] <= concurrency
+
+        fake.error_rate, fake.drop_rate = error_rate, drop_rate
+        flaky = phase("flaky", calls)
+        # Every call has its own idempotency key, so retries must never push this past one per call
+        checks["flaky: no duplicate sessions"] = flaky["sessions_created"] <= calls
+        checks["flaky: retries recover most calls"] = flaky["ok"] >= calls * 0.9
+
+        fake.error_rate = fake.drop_rate = 0.0
+        fake.hang = True
+        outage = phase("outage", calls)
+        checks["outage: calls end within the call budget"] = \
+            outage["max_ms"] <= config["STRIPE_CALL_BUDGET"] * 1000 + 250
+        checks["outage: the circuit opens and sheds load"] = \
+            outage["upstream_requests"] < calls and outage["breaker"] != "closed"
+
+        fake.hang = False
+        time.sleep(config["STRIPE_BREAKER_RESET"])
+        # Half-open lets a single trial call through; the rest wait for its outcome
+        trial = phase("trial", 1, workers=1)
+        recovery = phase("recovery", calls)
+        checks["recovery: the trial call closes the circuit"] = trial["ok"] == 1 and trial["breaker"] == "closed"
+        checks["recovery: every call succeeds"] = recovery["ok"] == calls
+
+    phases["gateway_stats"] = gateway.stats.snapshot()
+    phases["checks"] = checks
+    return phases
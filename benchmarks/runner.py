@@ -0,0 +1,227 @@
+"""
+runner.py
+
+Drives benchmark scenarios against the app with concurrent clients.
+In "client" mode each worker thread uses its own Flask test client; in
+"server" mode the app is served by a local threaded WSGI server and the
+workers talk HTTP to it. Every scenario reports throughput, p50/p95/p99
+latency and SQL queries per request.
+"""
+
+import http.client
+import random
+import statistics
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+from .datagen import BENCH_PASSWORD
+from .scenarios import Context
+
+QUERY_HEADER = "X-Bench-Queries"
+
+
+def instrument(app):
+    """Count SQL statements per request and report them in a response header."""
+    local = threading.local()
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        local.count = getattr(local, "count", 0) + 1
+
+    @app.before_request
+    def reset_count():
+        local.count = 0
+
+    @app.after_request
+    def report_count(response):
+        response.headers[QUERY_HEADER] = str(getattr(local, "count", 0))
+        return response
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that skips the per-request access log line."""
+
+    def log_request(self, code="-", size="-"):
+        pass
+
+
+class TestClientSession:
+    """One simulated visitor backed by the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, int(response.headers.get(QUERY_HEADER, 0))
+
+
+class HTTPSession:
+    """One simulated visitor talking HTTP to the local server, with cookies."""
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            self.cookies.update({key: morsel.value for key, morsel in cookie.items()})
+        return response.status, int(response.headers.get(QUERY_HEADER, 0))
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, query_counts, errors, wall_seconds):
+    """Aggregate raw samples into the numbers stored in the results file."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3) if ordered else 0.0,
+        "queries_per_request": round(statistics.fmean(query_counts), 2) if query_counts else 0.0,
+    }
+
+
+def _send(client, scenario, rng, ctx):
+    path = scenario.make_path(rng, ctx)
+    data = scenario.make_data(rng, ctx) if scenario.make_data else None
+    return client.request(scenario.method, path, data=data)
+
+
+def _log_in(sessions, emails):
+    for n, client in enumerate(sessions):
+        client.request("POST", "/login", data={"email": emails[n % len(emails)], "password": BENCH_PASSWORD})
+
+
+def run_scenarios(app, scenarios, requests_per_scenario, concurrency, mode="client", seed=1,
+                  background=None, background_concurrency=0, log=print):
+    """
+    Run each scenario with `concurrency` workers and return a dict of summaries.
+    If `background` is given, `background_concurrency` extra workers drive that
+    scenario non-stop while each measured scenario runs (e.g. a login storm).
+    """
+    app.config["WTF_CSRF_ENABLED"] = False
+    instrument(app)
+
+    with app.app_context():
+        ctx = Context(seed=seed)
+    emails = ctx.emails
+
+    server = None
+    if mode == "server":
+        server = make_server("127.0.0.1", 0, app, threaded=True,
+                             request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def new_session():
+        if server is not None:
+            return HTTPSession("127.0.0.1", server.server_port)
+        return TestClientSession(app)
+
+    def needs_users(scenario):
+        return scenario.login or scenario.make_data is not None
+
+    if background is not None and needs_users(background) and not emails:
+        raise SystemExit("The background scenario needs benchmark users; run `python -m benchmarks seed`.")
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            if needs_users(scenario) and not emails:
+                log(f"skipping {scenario.name}: no benchmark users (run `python -m benchmarks seed`)")
+                continue
+
+            sessions = [new_session() for _ in range(concurrency)]
+            if scenario.login:
+                _log_in(sessions, emails)
+
+            stop = threading.Event()
+            background_threads = []
+            if background is not None:
+                background_sessions = [new_session() for _ in range(background_concurrency)]
+                if background.login:
+                    _log_in(background_sessions, emails)
+
+                def background_worker(client, worker_seed):
+                    rng = random.Random(worker_seed)
+                    while not stop.is_set():
+                        _send(client, background, rng, ctx)
+
+                background_threads = [
+                    threading.Thread(target=background_worker, args=(client, seed * 1000 + 500 + n), daemon=True)
+                    for n, client in enumerate(background_sessions)
+                ]
+                for thread in background_threads:
+                    thread.start()
+
+            latencies, query_counts = [], []
+            errors = [0]
+            lock = threading.Lock()
+            remaining = [requests_per_scenario]
+
+            def worker(client, worker_seed):
+                rng = random.Random(worker_seed)
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    started = time.perf_counter()
+                    status, queries = _send(client, scenario, rng, ctx)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        query_counts.append(queries)
+                        if status not in scenario.expect:
+                            errors[0] += 1
+
+            threads = [threading.Thread(target=worker, args=(client, seed * 1000 + n))
+                       for n, client in enumerate(sessions)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+            stop.set()
+            for thread in background_threads:
+                thread.join()
+
+            results[scenario.name] = summarize(latencies, query_counts, errors[0], wall)
+            summary = results[scenario.name]
+            log(f"{scenario.name:<22} {summary['throughput_rps']:>9.1f} rps  "
+                f"p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms  "
+                f"p99 {summary['p99_ms']:>8.2f} ms  {summary['queries_per_request']:>6.1f} q/req"
+                + (f"  {summary['errors']} errors" if summary["errors"] else ""))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    return results
@@ -0,0 +1,70 @@
+"""
+scenarios.py
+
+The request mixes the benchmark runner drives against the real routes.
+Each scenario builds a URL from a shared context of ids and terms sampled
+from the benchmark database, so runs against the same seed are comparable.
+"""
+
+import random
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Product, User
+
+from .datagen import BENCH_PASSWORD
+
+Scenario = namedtuple("Scenario", ["name", "login", "method", "make_path", "expect", "make_data"],
+                      defaults=(None,))
+
+SEARCH_TERMS = ["hood", "cotton", "classic black", "jack", "premium", "urban sneaker", "soft"]
+# What a shopper has typed so far when the search box asks for suggestions
+SUGGEST_PREFIXES = ["h", "ho", "hood", "cot", "classic b", "ja", "prem", "urban sn", "so"]
+SORTS = ["name_asc", "name_desc", "price_asc", "price_desc", "rating_desc"]
+
+
+class Context:
+    """Ids and terms sampled once from the database before a run."""
+
+    def __init__(self, sample_size=1000, seed=7):
+        rng = random.Random(seed)
+        # Sampled here rather than with ORDER BY random(), so the seed fixes the sample
+        all_ids = db.session.scalars(select(Product.id).order_by(Product.id)).all()
+        self.product_ids = rng.sample(all_ids, min(sample_size, len(all_ids)))
+        self.categories = db.session.scalars(
+            select(Product.category).where(Product.category.isnot(None)).distinct().order_by(Product.category)
+        ).all()
+        self.emails = [row.email for row in db.session.query(User.email)
+                       .filter(User.email.like("bench%@example.com")).order_by(User.id).limit(sample_size)]
+        if not self.product_ids:
+            raise SystemExit("The benchmark database has no products; run `python -m benchmarks seed` first.")
+
+
+SCENARIOS = [
+    Scenario("catalog_home", False, "GET", lambda rng, ctx: "/", (200, 304)),
+    Scenario("catalog_sorted", False, "GET",
+             lambda rng, ctx: f"/?sort={rng.choice(SORTS)}", (200, 304)),
+    Scenario("catalog_category", False, "GET",
+             lambda rng, ctx: f"/?category={rng.choice(ctx.categories)}&sort={rng.choice(SORTS)}", (200, 304)),
+    Scenario("catalog_search", False, "GET",
+             lambda rng, ctx: f"/?search={rng.choice(SEARCH_TERMS).replace(' ', '+')}", (200, 304)),
+    Scenario("search_suggest", False, "GET",
+             lambda rng, ctx: f"/api/search/suggest?q={rng.choice(SUGGEST_PREFIXES).replace(' ', '+')}", (200,)),
+    Scenario("product_detail", False, "GET",
+             lambda rng, ctx: f"/product/{rng.choice(ctx.product_ids)}", (200, 304)),
+    Scenario("catalog_home_user", True, "GET", lambda rng, ctx: "/", (200,)),
+    Scenario("product_detail_user", True, "GET",
+             lambda rng, ctx: f"/product/{rng.choice(ctx.product_ids)}", (200,)),
+    Scenario("cart", True, "GET", lambda rng, ctx: "/cart", (200,)),
+    Scenario("orders", True, "GET", lambda rng, ctx: "/orders", (200,)),
+    Scenario("wishlist", True, "GET", lambda rng, ctx: "/wishlist", (200,)),
+    Scenario("add_to_cart", True, "GET",
+             lambda rng, ctx: f"/add_to_cart/{rng.choice(ctx.product_ids)}", (302,)),
+    # A login storm; 503 is the hashing pool's back-pressure answer
+    Scenario("login", False, "POST", lambda rng, ctx: "/login", (302, 503),
+             lambda rng, ctx: {"email": rng.choice(ctx.emails), "password": BENCH_PASSWORD}),
+]
+
+SCENARIOS_BY_NAME = {scenario.name: scenario for scenario in SCENARIOS}
@@ -35,6 +35,138 @@ class Config:
     # Disable modification tracking to save system resources
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool settings for server databases (PostgreSQL)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+    # SQLite tuning, applied to every new connection (see app/database.py)
+    SQLITE_WAL = os.getenv('SQLITE_WAL', '1') == '1'
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    # Optional read replica for read-only GET views; writes always use the primary
+    replica_url = os.getenv("DATABASE_REPLICA_URL", "")
+    if replica_url.startswith("postgres://"):
+        replica_url = replica_url.replace("postgres://", "postgresql://", 1)
+    SQLALCHEMY_BINDS = {'replica': replica_url} if replica_url else {}
+
+    # Seconds a user's reads stay on the primary after they write (read-your-writes)
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
     # Stripe API credentials
     STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
+    STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+
+    # Stripe gateway (see app/payments.py); the API base can point at a local fake
+    STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+    # Seconds allowed to connect, and to wait for each response
+    STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 2))
+    STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 5))
+    # Retries after network errors, 429s and 5xx. All attempts together end within
+    # the call budget (seconds): the last one gets only the time that is left
+    STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', 2))
+    STRIPE_RETRY_BACKOFF = float(os.getenv('STRIPE_RETRY_BACKOFF', 0.25))
+    STRIPE_CALL_BUDGET = float(os.getenv('STRIPE_CALL_BUDGET', 8))
+    # Consecutive failed attempts that open the circuit, and seconds before a trial call
+    STRIPE_BREAKER_FAILURES = int(os.getenv('STRIPE_BREAKER_FAILURES', 5))
+    STRIPE_BREAKER_RESET = float(os.getenv('STRIPE_BREAKER_RESET', 30))
+    # Keep-alive connections to Stripe per process
+    STRIPE_POOL_SIZE = int(os.getenv('STRIPE_POOL_SIZE', 10))
+
+    # Background job queue (see app/jobs.py)
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 4))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 300))
+
+    # Stock holds taken at checkout (see app/reservations.py). The Stripe session
+    # expires with its holds, so this must be between 30 minutes and 24 hours.
+    STOCK_HOLD_TTL = int(os.getenv('STOCK_HOLD_TTL', 1800))
+    STOCK_HOLD_SWEEP_INTERVAL = float(os.getenv('STOCK_HOLD_SWEEP_INTERVAL', 60))
+    # Seconds expired holds are kept: they are the order record for a late webhook
+    # (Stripe retries deliveries for up to three days)
+    STOCK_HOLD_RETENTION = int(os.getenv('STOCK_HOLD_RETENTION', 3 * 24 * 3600))
+
+    # Products shown per catalog page (keyset paginated)
+    PRODUCTS_PER_PAGE = int(os.getenv('PRODUCTS_PER_PAGE', 24))
+
+    # Orders shown per page in the order history
+    ORDERS_PER_PAGE = int(os.getenv('ORDERS_PER_PAGE', 10))
+
+    # Reviews shown per page on a product page
+    REVIEWS_PER_PAGE = int(os.getenv('REVIEWS_PER_PAGE', 10))
+
+    # Seconds a worker trusts its copy of the catalog version before re-reading it
+    CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', 2))
+
+    # Seconds cached pages and facets may show stock that sales have changed since
+    # (sales don't bump the catalog version)
+    STOCK_DISPLAY_TTL = float(os.getenv('STOCK_DISPLAY_TTL', 60))
+
+    # Rendered-page cache for anonymous catalog visitors
+    PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    PAGE_CACHE_MAX_ENTRIES = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 2000))
+
+    # Password hashing: werkzeug method string (e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'); hashes made with other parameters are upgraded at login
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+
+    # Processes that run the password KDF (0 hashes inline in the request worker);
+    # half the cores by default so a login burst leaves CPU for everything else
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    # Hashes allowed to wait for a free process before logins get a "busy" answer
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 16))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 0.5))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Resized product image derivatives (see app/images.py)
+    IMAGE_STORAGE_DIR = os.getenv('IMAGE_STORAGE_DIR', os.path.join(basedir, 'instance', 'media'))
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', os.cpu_count() or 1))
+    IMAGE_FETCH_TIMEOUT = float(os.getenv('IMAGE_FETCH_TIMEOUT', 15))
+    IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+    # Directory local (non-http) image_url paths are read from; unset rejects them
+    IMAGE_SOURCE_DIR = os.getenv('IMAGE_SOURCE_DIR') or None
+
+    # "Customers also bought" (see app/recommendations.py)
+    RECOMMENDATIONS_STATE_PATH = os.getenv('RECOMMENDATIONS_STATE_PATH',
+                                           os.path.join(basedir, 'instance', 'recommendations.npz'))
+    RECOMMENDATIONS_TOP_K = int(os.getenv('RECOMMENDATIONS_TOP_K', 8))
+    # Pairs bought together in fewer orders than this are treated as noise
+    RECOMMENDATIONS_MIN_SUPPORT = int(os.getenv('RECOMMENDATIONS_MIN_SUPPORT', 2))
+
+    # Search-as-you-type suggestions (see app/autocomplete.py)
+    AUTOCOMPLETE_MAX_PRODUCTS = int(os.getenv('AUTOCOMPLETE_MAX_PRODUCTS', 8))
+    AUTOCOMPLETE_MAX_CATEGORIES = int(os.getenv('AUTOCOMPLETE_MAX_CATEGORIES', 3))
+
+    # Compiled-template cache shared by worker processes ('' disables it)
+    JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR', os.path.join(basedir, 'instance', 'jinja_cache'))
+
+    # {% cache %} fragment cache (see app/templating.py)
+    FRAGMENT_CACHE_ENABLED = os.getenv('FRAGMENT_CACHE_ENABLED', '1') == '1'
+    FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 600))
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+    FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+    # Cached user identity for the login user_loader (see app/identity.py)
+    IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', 30))
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+
+    # Per-request SQL/template instrumentation (see app/instrumentation.py)
+    SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', '0') == '1'
+    SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 500))
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
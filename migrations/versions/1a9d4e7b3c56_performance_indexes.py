@@ -0,0 +1,57 @@
+"""performance indexes
+
+Revision ID: 1a9d4e7b3c56
+Revises: f0c6b2e84a19
+Create Date: 2026-10-18 15:02:48.530764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a9d4e7b3c56'
+down_revision = 'f0c6b2e84a19'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('uq_cart_item_user_product', 'cart_item', ['user_id', 'product_id'], True),
+    ('uq_wishlist_item_user_product', 'wishlist_item', ['user_id', 'product_id'], True),
+    ('ix_order_user_timestamp', 'order', ['user_id', 'timestamp'], False),
+    ('ix_order_item_order_id', 'order_item', ['order_id'], False),
+    ('ix_review_product_timestamp', 'review', ['product_id', 'timestamp'], False),
+    ('ix_product_category', 'product', ['category'], False),
+    ('ix_product_name_id', 'product', ['name', 'id'], False),
+    ('ix_product_price_id', 'product', ['price', 'id'], False),
+    ('ix_product_rating_avg_id', 'product', ['rating_avg', 'id'], False),
+]
+
+
+def upgrade():
+    # Merge duplicate cart rows and drop duplicate wishlist rows so the
+    # unique indexes can be built
+    op.execute(
+        "UPDATE cart_item SET quantity = ("
+        "SELECT SUM(dup.quantity) FROM cart_item dup "
+        "WHERE dup.user_id = cart_item.user_id AND dup.product_id = cart_item.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "DELETE FROM cart_item WHERE id NOT IN "
+        "(SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id)"
+    )
+    op.execute(
+        "DELETE FROM wishlist_item WHERE id NOT IN "
+        "(SELECT MIN(id) FROM wishlist_item GROUP BY user_id, product_id)"
+    )
+
+    # Plain CREATE INDEX (no batch mode) so SQLite keeps the product FTS triggers
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
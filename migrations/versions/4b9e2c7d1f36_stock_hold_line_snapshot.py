@@ -0,0 +1,28 @@
+"""stock hold line snapshot
+
+Revision ID: 4b9e2c7d1f36
+Revises: 6d2b8f4e1a57
+Create Date: 2026-10-19 10:05:48.917342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9e2c7d1f36'
+down_revision = '6d2b8f4e1a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('product_name', sa.String(length=120), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.drop_column('product_name')
+        batch_op.drop_column('unit_price')
@@ -0,0 +1,28 @@
+"""product sku
+
+Revision ID: 5c8e1f3a9d27
+Revises: 1a9d4e7b3c56
+Create Date: 2026-10-18 19:40:12.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1f3a9d27'
+down_revision = '1a9d4e7b3c56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN (no batch mode) keeps the SQLite FTS triggers on product
+    op.add_column('product', sa.Column('sku', sa.String(length=64), nullable=True))
+    op.create_index('uq_product_sku', 'product', ['sku'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_product_sku', table_name='product')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('sku')
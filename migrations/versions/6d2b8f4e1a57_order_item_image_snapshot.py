@@ -0,0 +1,36 @@
+"""order item image snapshot
+
+Revision ID: 6d2b8f4e1a57
+Revises: a4f7d2e9c613
+Create Date: 2026-10-19 09:12:31.604218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2b8f4e1a57'
+down_revision = 'a4f7d2e9c613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_url', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('image_key', sa.String(length=24), nullable=True))
+
+    # Backfill existing rows from the current catalog
+    op.execute(
+        "UPDATE order_item SET "
+        "image_url = (SELECT product.image_url FROM product WHERE product.id = order_item.product_id), "
+        "image_key = (SELECT product.image_key FROM product WHERE product.id = order_item.product_id "
+        "AND product.image_source = product.image_url)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('image_key')
+        batch_op.drop_column('image_url')
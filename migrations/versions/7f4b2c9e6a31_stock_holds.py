@@ -0,0 +1,46 @@
+"""stock holds
+
+Revision ID: 7f4b2c9e6a31
+Revises: e3a7c5b9d214
+Create Date: 2026-10-18 21:12:44.306129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f4b2c9e6a31'
+down_revision = 'e3a7c5b9d214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_hold',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('checkout_key', sa.String(length=64), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_hold_product_expires', ['product_id', 'expires_at'], unique=False)
+        batch_op.create_index('ix_stock_hold_checkout_key', ['checkout_key'], unique=False)
+        batch_op.create_index('ix_stock_hold_user_id', ['user_id'], unique=False)
+        batch_op.create_index('ix_stock_hold_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_hold_expires_at')
+        batch_op.drop_index('ix_stock_hold_user_id')
+        batch_op.drop_index('ix_stock_hold_checkout_key')
+        batch_op.drop_index('ix_stock_hold_product_expires')
+
+    op.drop_table('stock_hold')
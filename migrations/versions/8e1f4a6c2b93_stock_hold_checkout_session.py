@@ -0,0 +1,26 @@
+"""stock hold checkout session
+
+Revision ID: 8e1f4a6c2b93
+Revises: 4b9e2c7d1f36
+Create Date: 2026-10-19 14:22:10.531208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e1f4a6c2b93'
+down_revision = '4b9e2c7d1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('checkout_session_id', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('stock_hold', schema=None) as batch_op:
+        batch_op.drop_column('checkout_session_id')
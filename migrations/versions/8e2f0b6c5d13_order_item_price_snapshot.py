@@ -0,0 +1,35 @@
+"""order item price snapshot
+
+Revision ID: 8e2f0b6c5d13
+Revises: 3c1d7a9e4b21
+Create Date: 2026-10-18 10:41:07.215530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f0b6c5d13'
+down_revision = '3c1d7a9e4b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('product_name', sa.String(length=120), nullable=True))
+
+    # Backfill existing rows from the current catalog
+    op.execute(
+        "UPDATE order_item SET "
+        "unit_price = (SELECT product.price FROM product WHERE product.id = order_item.product_id), "
+        "product_name = (SELECT product.name FROM product WHERE product.id = order_item.product_id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('product_name')
+        batch_op.drop_column('unit_price')
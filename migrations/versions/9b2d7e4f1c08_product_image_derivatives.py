@@ -0,0 +1,28 @@
+"""product image derivatives
+
+Revision ID: 9b2d7e4f1c08
+Revises: 5c8e1f3a9d27
+Create Date: 2026-10-18 20:05:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2d7e4f1c08'
+down_revision = '5c8e1f3a9d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN (no batch mode) keeps the SQLite FTS triggers on product
+    op.add_column('product', sa.Column('image_key', sa.String(length=24), nullable=True))
+    op.add_column('product', sa.Column('image_source', sa.String(length=300), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('image_source')
+        batch_op.drop_column('image_key')
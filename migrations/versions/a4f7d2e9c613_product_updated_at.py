@@ -0,0 +1,28 @@
+"""product updated_at
+
+Revision ID: a4f7d2e9c613
+Revises: c81f5a2d9e47
+Create Date: 2026-10-18 23:12:40.381227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f7d2e9c613'
+down_revision = 'c81f5a2d9e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN (no batch mode) keeps the SQLite FTS triggers on product
+    op.add_column('product', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_product_updated_at', 'product', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_updated_at', table_name='product')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
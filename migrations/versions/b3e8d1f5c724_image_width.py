@@ -0,0 +1,33 @@
+"""image width
+
+Revision ID: b3e8d1f5c724
+Revises: 8e1f4a6c2b93
+Create Date: 2026-10-20 10:41:57.208316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8d1f5c724'
+down_revision = '8e1f4a6c2b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in by the next `flask images process`
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_width', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_width', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('image_width')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('image_width')
@@ -0,0 +1,47 @@
+"""product rating aggregates
+
+Revision ID: b47e91d2a6f8
+Revises: 8e2f0b6c5d13
+Create Date: 2026-10-18 11:26:52.840317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b47e91d2a6f8'
+down_revision = '8e2f0b6c5d13'
+branch_labels = None
+depends_on = None
+
+
+COUNT_COLUMNS = ['rating_count', 'rating_sum'] + [f'rating_count_{stars}' for stars in range(1, 6)]
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        for name in COUNT_COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_avg', sa.Float(), nullable=False, server_default='0'))
+
+    # Backfill the aggregates from existing reviews
+    buckets = ", ".join(
+        f"rating_count_{stars} = (SELECT COUNT(*) FROM review "
+        f"WHERE review.product_id = product.id AND review.rating = {stars})"
+        for stars in range(1, 6)
+    )
+    op.execute(
+        "UPDATE product SET "
+        "rating_count = (SELECT COUNT(*) FROM review WHERE review.product_id = product.id), "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM review WHERE review.product_id = product.id), "
+        "rating_avg = (SELECT COALESCE(AVG(rating), 0) FROM review WHERE review.product_id = product.id), "
+        + buckets
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('rating_avg')
+        for name in reversed(COUNT_COLUMNS):
+            batch_op.drop_column(name)
@@ -0,0 +1,30 @@
+"""product recommendations
+
+Revision ID: c81f5a2d9e47
+Revises: 2e6a9d4c7b85
+Create Date: 2026-10-18 22:41:55.207319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5a2d9e47'
+down_revision = '2e6a9d4c7b85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_recommendation',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.Column('recommended_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('product_recommendation')
@@ -0,0 +1,26 @@
+"""product version
+
+Revision ID: e3a7c5b9d214
+Revises: 9b2d7e4f1c08
+Create Date: 2026-10-18 20:31:09.551840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c5b9d214'
+down_revision = '9b2d7e4f1c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN (no batch mode) keeps the SQLite FTS triggers on product
+    op.add_column('product', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,130 @@
+"""
+conftest.py
+
+Shared pytest fixtures. Every test gets a fresh app on its own copy of a
+SQLite database migrated once per session, so tests can write freely.
+Set TEST_POSTGRES_URL to a scratch PostgreSQL database to also run the
+tests marked for it.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Config is read when it is imported, so these must be set before the app is
+_scratch = tempfile.mkdtemp(prefix="shopnow-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_scratch, 'unused.db')}",
+    "PASSWORD_HASH_WORKERS": "0",
+    "JINJA_BYTECODE_CACHE_DIR": "",
+    "CATALOG_VERSION_TTL": "0",
+    "STRIPE_SECRET_KEY": "sk_test_fake",
+    "STRIPE_WEBHOOK_SECRET": "whsec_test",
+    "IMAGE_STORAGE_DIR": os.path.join(_scratch, "media"),
+    "RECOMMENDATIONS_STATE_PATH": os.path.join(_scratch, "recommendations.npz"),
+})
+
+from flask_migrate import upgrade  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import catalog, create_app, db, facets  # noqa: E402
+from app.http_cache import page_cache  # noqa: E402
+from app.identity import identity_cache  # noqa: E402
+from app.models import CartItem, Product, User  # noqa: E402
+from app.templating import fragment_cache  # noqa: E402
+from benchmarks.fake_stripe import FakeStripe  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def build_app(monkeypatch, database_url):
+    """A TESTING app bound to `database_url`, with the process-wide caches emptied."""
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", database_url)
+    monkeypatch.setattr(Config, "SQLALCHEMY_ENGINE_OPTIONS", {})
+    # Caches are per process and keyed by catalog version, which restarts in every database
+    page_cache.clear()
+    fragment_cache.clear()
+    identity_cache.clear()
+    catalog._expire_local_state()
+    monkeypatch.setattr(facets, "_facets_version", None)
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture(scope="session")
+def migrated_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("template") / "shop.db"
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        app = build_app(monkeypatch, f"sqlite:///{path}")
+        with app.app_context():
+            upgrade()
+            db.engine.dispose()
+    return path
+
+
+@pytest.fixture
+def app(migrated_db, tmp_path, monkeypatch):
+    path = tmp_path / "shop.db"
+    shutil.copy(migrated_db, path)
+    app = build_app(monkeypatch, f"sqlite:///{path}")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    def make(email, password="password123"):
+        with app.app_context():
+            user = User(email=email, password=generate_password_hash(password))
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def make_product(app):
+    def make(name="Hoodie", price=25.0, stock=10, category="hoodies", **fields):
+        with app.app_context():
+            product = Product(name=name, price=price, stock=stock, category=category, **fields)
+            db.session.add(product)
+            db.session.commit()
+            return product.id
+    return make
+
+
+@pytest.fixture
+def add_to_cart(app):
+    def add(user_id, product_id, quantity=1):
+        with app.app_context():
+            db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+            db.session.commit()
+    return add
+
+
+@pytest.fixture
+def login(client):
+    """Log the test client in as a user id, without going through the password form."""
+    def log_in(user_id):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+    return log_in
+
+
+@pytest.fixture
+def fake_stripe(app):
+    """A local fake Stripe API, wired up as the app's payment gateway endpoint."""
+    with FakeStripe() as fake:
+        app.config["STRIPE_API_BASE"] = fake.url
+        yield fake
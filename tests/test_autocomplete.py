@@ -0,0 +1,44 @@
+"""
+test_autocomplete.py
+
+The per-worker prefix index is refreshed on catalog edits, not on sales.
+"""
+
+import pytest
+
+from app import autocomplete, db
+from app.fulfillment import fulfill_checkout
+from app.models import Product
+from app.reservations import reserve
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    for name in ("_index", "_updater", "_failed_at"):
+        monkeypatch.setattr(autocomplete, name, None)
+
+
+def _suggested_names(app, query):
+    with app.app_context():
+        return [name for _, name in autocomplete.suggest(query)[0]]
+
+
+def test_only_catalog_edits_refresh_the_index(app, make_user, make_product):
+    product_id = make_product("Blue hoodie", stock=5)
+    user_id = make_user("buyer@example.com")
+    autocomplete._update(app)
+    built = autocomplete._index
+    assert _suggested_names(app, "hoo") == ["Blue hoodie"]
+
+    with app.app_context():
+        reserve(user_id, "checkout-1", [(product_id, 2, "Blue hoodie", 25.0)], 1800)
+        fulfill_checkout(user_id, "checkout-1")
+        assert autocomplete.current_index() is built
+    assert autocomplete._updater is None
+
+    with app.app_context():
+        db.session.get(Product, product_id).name = "Green hoodie"
+        db.session.commit()
+        autocomplete.current_index()
+    autocomplete._updater.join(5)
+    assert _suggested_names(app, "hoo") == ["Green hoodie"]
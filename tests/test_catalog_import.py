@@ -0,0 +1,79 @@
+"""
+test_catalog_import.py
+
+`flask catalog import`: row validation, and the dry run must predict what
+the real run writes.
+"""
+
+from sqlalchemy import func, select
+
+from app import db
+from app.catalog_io import RowValidator
+from app.forms import ProductForm
+from app.models import Product
+
+ROWS = [
+    ("SKU-1", "Hoodie", "30.00"),
+    ("SKU-2", "Tee", "10.00"),
+    ("SKU-1", "Hoodie v2", "32.00"),  # Repeated in the same batch
+    ("SKU-3", "Cap", "12.00"),
+    ("SKU-2", "Tee v2", "11.00"),  # Repeated in a later batch
+    ("OLD-1", "Existing scarf", "15.00"),
+]
+
+
+def _write_csv(path):
+    lines = ["sku,name,description,price,image_url,category,stock"]
+    lines += [f"{sku},{name},,{price},,accessories,5" for sku, name, price in ROWS]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_dry_run_counts_each_sku_once(app, make_product, tmp_path):
+    make_product("Scarf", sku="OLD-1")
+    path = _write_csv(tmp_path / "products.csv")
+    runner = app.test_cli_runner()
+
+    dry_run = runner.invoke(args=["catalog", "import", path, "--dry-run", "--batch-size", "4"])
+    assert dry_run.exit_code == 0, dry_run.output
+    assert "6 valid rows (3 new, 1 existing SKUs, 2 repeating an earlier row)" in dry_run.output
+
+    result = runner.invoke(args=["catalog", "import", path, "--batch-size", "4"])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert db.session.scalar(select(func.count(Product.id))) == 1 + 3
+        assert db.session.scalar(select(Product.name).where(Product.sku == "SKU-2")) == "Tee v2"
+
+
+def test_import_rules_differ_from_the_admin_form_only_where_imports_need_it(app):
+    row = {"sku": "SKU-9", "name": "Sticker", "price": "0", "stock": "0"}
+    with app.test_request_context():
+        values, error = RowValidator()(row)
+        assert error is None
+        assert (values["price"], values["stock"], values["image_url"]) == (0, 0, None)
+        assert RowValidator()(dict(row, sku=""))[1] == "sku: This field is required."
+
+        # The admin form keeps its own rules
+        form = ProductForm(formdata=None, meta={"csrf": False})
+        form.process(data={"name": "Sticker", "price": 0, "stock": 0, "image_url": ""})
+        assert not form.validate()
+        assert not hasattr(form, "sku")
+
+
+def test_unparseable_jsonl_lines_are_counted_as_invalid_rows(app, tmp_path):
+    path = tmp_path / "products.jsonl"
+    path.write_text(
+        '{"sku": "SKU-1", "name": "Hoodie", "price": 30, "stock": 5}\n'
+        '{"sku": "SKU-2", "name": \n'
+        '["SKU-3", "Cap"]\n'
+        '{"sku": "SKU-4", "name": "Tee", "price": 10, "stock": 5}\n'
+    )
+
+    result = app.test_cli_runner().invoke(args=["catalog", "import", str(path)])
+
+    assert result.exit_code == 1
+    assert "line 2: invalid JSON" in result.output
+    assert "line 3: expected a JSON object, got list" in result.output
+    assert "Imported 2 rows, 2 invalid" in result.output
+    with app.app_context():
+        assert db.session.scalars(select(Product.sku).order_by(Product.sku)).all() == ["SKU-1", "SKU-4"]
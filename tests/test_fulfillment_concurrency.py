@@ -0,0 +1,152 @@
+"""
+test_fulfillment_concurrency.py
+
+Many buyers checking out one low-stock product at the same time, through
+the production path: reserve() at checkout, then fulfill_checkout() once
+paid. Exactly as many orders go through as the stock covers, the rest are
+refused without writing anything, and stock never goes negative.
+"""
+
+import os
+import threading
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import func, select, text, update
+
+from app import db
+from app.fulfillment import fulfill_checkout
+from app.models import CartItem, Order, OrderItem, Product, StockHold, User
+from app.reservations import OutOfStockError, reserve
+
+from conftest import build_app
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def shop(request, app, monkeypatch):
+    """The SQLite test app, or one on TEST_POSTGRES_URL (a PostgreSQL stand-in for production)."""
+    if request.param == "sqlite":
+        yield app
+        return
+
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    pg_app = build_app(monkeypatch, url)
+    with pg_app.app_context():
+        upgrade()
+    yield pg_app
+    with pg_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.session.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def _race(app, buyers):
+    """Run buy(user_id) for every buyer from its own thread, all released at once."""
+    start = threading.Barrier(len(buyers))
+    outcomes, lock = [], threading.Lock()
+
+    def run(user_id, buy):
+        with app.app_context():
+            start.wait()
+            try:
+                outcome = buy(user_id)
+            except OutOfStockError:
+                outcome = "out_of_stock"
+            except Exception as exc:  # Anything else (e.g. "database is locked") fails the test
+                outcome = repr(exc)
+            finally:
+                db.session.remove()
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=run, args=(user_id, buy)) for user_id, buy in buyers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def _checkout_and_pay(product_id, quantity):
+    """A buyer's whole path: hold the stock at checkout, then fulfill once paid."""
+    def buy(user_id):
+        key = f"checkout-{user_id}"
+        reserve(user_id, key, [(product_id, quantity, "Limited sneaker", 120.0)], 1800)
+        return "ordered" if fulfill_checkout(user_id, key) else "empty"
+    return buy
+
+
+def _pay(key):
+    def buy(user_id):
+        return "ordered" if fulfill_checkout(user_id, key) else "empty"
+    return buy
+
+
+def _seed(app, buyers, stock, quantity):
+    with app.app_context():
+        product = Product(name="Limited sneaker", price=120.0, stock=stock, category="shoes")
+        users = [User(email=f"buyer{n}@example.com", password="x") for n in range(buyers)]
+        db.session.add_all([product, *users])
+        db.session.flush()
+        db.session.add_all([CartItem(user_id=user.id, product_id=product.id, quantity=quantity)
+                            for user in users])
+        db.session.commit()
+        return product.id, [user.id for user in users]
+
+
+@pytest.mark.parametrize("buyers,stock,quantity", [(40, 5, 1), (30, 10, 3)])
+def test_concurrent_checkouts_never_oversell(shop, buyers, stock, quantity):
+    product_id, user_ids = _seed(shop, buyers, stock, quantity)
+
+    outcomes = _race(shop, [(user_id, _checkout_and_pay(product_id, quantity)) for user_id in user_ids])
+
+    winners = stock // quantity
+    assert sorted(set(outcomes)) == ["ordered", "out_of_stock"]
+    assert outcomes.count("ordered") == winners
+    with shop.app_context():
+        assert db.session.get(Product, product_id).stock == stock - winners * quantity >= 0
+        assert db.session.scalar(select(func.count(Order.id))) == winners
+        assert db.session.scalar(select(func.sum(OrderItem.quantity))) == winners * quantity
+        assert db.session.scalar(select(func.count(StockHold.id))) == 0
+        # Winners' carts were emptied with their orders; the others were left untouched
+        assert db.session.scalar(select(func.count(CartItem.id))) == buyers - winners
+
+
+def test_paid_holds_racing_a_stock_cut_never_go_negative(shop):
+    """Holds taken, then stock cut below them (e.g. a recount): fulfillment is the last line of defence."""
+    product_id, user_ids = _seed(shop, buyers=10, stock=10, quantity=1)
+    with shop.app_context():
+        for user_id in user_ids:
+            reserve(user_id, f"checkout-{user_id}", [(product_id, 1, "Limited sneaker", 120.0)], 1800)
+        db.session.execute(update(Product).values(stock=4))
+        db.session.commit()
+
+    outcomes = _race(shop, [(user_id, _pay(f"checkout-{user_id}")) for user_id in user_ids])
+
+    ordered = outcomes.count("ordered")
+    assert ordered + outcomes.count("out_of_stock") == 10
+    with shop.app_context():
+        assert db.session.get(Product, product_id).stock == 4 - ordered >= 0
+        assert db.session.scalar(select(func.count(Order.id))) == ordered
+
+
+def test_failed_line_rolls_back_the_whole_order(app, make_user, make_product):
+    user_id = make_user("two-lines@example.com")
+    plenty = make_product("Socks", stock=50)
+    scarce = make_product("Cap", stock=2)
+
+    with app.app_context():
+        reserve(user_id, "checkout-1", [(plenty, 2, "Socks", 5.0), (scarce, 2, "Cap", 12.0)], 1800)
+        db.session.execute(update(Product).where(Product.id == scarce).values(stock=1))
+        db.session.commit()
+
+        with pytest.raises(OutOfStockError):
+            fulfill_checkout(user_id, "checkout-1")
+        assert db.session.get(Product, plenty).stock == 50
+        assert db.session.scalar(select(func.count(Order.id))) == 0
+        # The holds stay, so the paid checkout is still on record
+        assert db.session.scalar(select(func.count(StockHold.id))) == 2
@@ -0,0 +1,68 @@
+"""
+test_images.py
+
+Image derivatives: srcsets must advertise the widths actually rendered,
+and local image paths must stay inside IMAGE_SOURCE_DIR.
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+from PIL import ExifTags, Image
+
+from app.images import derivative_path, product_image_urls, render_derivatives
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    path = tmp_path / "sources"
+    path.mkdir()
+    return path
+
+
+def _render(source, source_dir, storage_dir, known_key=None):
+    return render_derivatives(1, source, str(source_dir) if source_dir else None, str(storage_dir),
+                              known_key, 5, 10 * 1024 * 1024)
+
+
+def test_narrow_source_lists_each_rendered_width_once(app, source_dir, tmp_path):
+    Image.new("RGB", (300, 150), "navy").save(source_dir / "tee.png")
+    storage_dir = tmp_path / "media"
+
+    _, key, width, generated, error = _render("tee.png", source_dir, storage_dir)
+    assert (width, generated, error) == (300, True, None)
+    for variant, expected in {"thumb": 200, "card": 300, "detail": 300}.items():
+        with Image.open(storage_dir / derivative_path(key, variant, "jpg")) as image:
+            assert image.width == expected
+
+    product = SimpleNamespace(image_key=key, image_url="tee.png", image_source="tee.png", image_width=width)
+    with app.test_request_context():
+        urls = product_image_urls(product)
+    assert urls["jpeg_srcset"] == f"{urls['thumb']} 200w, {urls['card']} 300w"
+    assert urls["webp_srcset"].count("w,") == 1
+
+
+def test_unchanged_image_reports_its_upright_width(source_dir, tmp_path):
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6  # Stored sideways, shown a quarter turn
+    Image.new("RGB", (300, 150), "navy").save(source_dir / "cap.jpg", exif=exif)
+    storage_dir = tmp_path / "media"
+
+    _, key, width, generated, _ = _render("cap.jpg", source_dir, storage_dir)
+    assert (width, generated) == (150, True)
+    assert _render("cap.jpg", source_dir, storage_dir, known_key=key)[2:4] == (150, False)
+
+
+@pytest.mark.parametrize("source", ["../outside.png", "/etc/hostname", "nested/../../outside.png"])
+def test_paths_outside_the_source_dir_are_rejected(source_dir, tmp_path, source):
+    Image.new("RGB", (10, 10)).save(tmp_path / "outside.png")
+    error = _render(source, source_dir, tmp_path / "media")[4]
+    assert error == "ValueError: image path is outside IMAGE_SOURCE_DIR"
+    assert not os.path.exists(tmp_path / "media")
+
+
+def test_local_paths_are_rejected_without_a_source_dir(tmp_path):
+    Image.new("RGB", (10, 10)).save(tmp_path / "tee.png")
+    error = _render(str(tmp_path / "tee.png"), None, tmp_path / "media")[4]
+    assert error == "ValueError: local image paths are disabled (set IMAGE_SOURCE_DIR)"
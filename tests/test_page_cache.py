@@ -0,0 +1,116 @@
+"""
+test_page_cache.py
+
+The anonymous page cache must never serve one URL's page for another:
+raw variants of a catalog URL either share a cache key and render the
+same page, or get keys of their own. Sales must not flush it.
+"""
+
+import itertools
+import re
+
+import pytest
+
+from app import db
+from app.catalog import current_catalog_version
+from app.fulfillment import fulfill_checkout
+from app.http_cache import cache_key, page_cache
+from app.models import Product
+from app.reservations import reserve
+from app.routes import catalog_args
+
+VARIANTS = [
+    "/",
+    "/?category=hoodies",
+    "/?category=hoodies%20",
+    "/?category=%20hoodies",
+    "/?category=Hoodies",
+    "/?sort=price_asc",
+    "/?sort=%20price_asc",
+    "/?sort=bogus",
+    "/?sort=",
+    "/?search=hoodie",
+    "/?search=HOODIE",
+    "/?search=%20hoodie!",
+    "/?search=hoodie&category=hoodies%20&sort=price_desc%20",
+]
+
+
+@pytest.fixture
+def catalog(make_product):
+    make_product("Blue hoodie", price=30.0, category="hoodies")
+    make_product("Grey hoodie", price=20.0, category="hoodies")
+    make_product("Red hoodie", price=25.0, category="hoodies")
+    make_product("Plain tee", price=10.0, category="tees")
+
+
+def _product_names(body):
+    return re.findall(r'class="card-title[^"]*">\s*([^<]+?)\s*<', body.decode())
+
+
+def _render_uncached(client, url):
+    page_cache.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.data
+
+
+def test_equal_keys_render_equal_pages(app, client, catalog):
+    pages, keys = {}, {}
+    for url in VARIANTS:
+        pages[url] = _render_uncached(client, url)
+        with app.test_request_context(url):
+            keys[url] = cache_key(catalog_args)
+
+    for first, second in itertools.combinations(VARIANTS, 2):
+        if keys[first] == keys[second]:
+            assert pages[first] == pages[second], f"{first} and {second} share a key but differ"
+
+
+def test_whitespace_variant_cannot_poison_the_cache(client, catalog):
+    page_cache.clear()
+    poisoned = client.get("/?category=hoodies%20")
+    clean = client.get("/?category=hoodies")
+
+    assert clean.data == poisoned.data
+    assert _product_names(clean.data) == ["Blue hoodie", "Grey hoodie", "Red hoodie"]
+
+
+def test_sort_variant_cannot_poison_the_cache(client, catalog):
+    page_cache.clear()
+    client.get("/?sort=%20price_asc")
+    response = client.get("/?sort=price_asc")
+
+    assert _product_names(response.data) == ["Plain tee", "Grey hoodie", "Red hoodie", "Blue hoodie"]
+
+
+def test_unknown_sort_shares_the_default_page(app, client, catalog):
+    with app.test_request_context("/?sort=bogus"):
+        bogus = cache_key(catalog_args)
+    with app.test_request_context("/"):
+        default = cache_key(catalog_args)
+
+    assert bogus == default
+    assert _render_uncached(client, "/?sort=bogus") == _render_uncached(client, "/")
+
+
+def test_a_sale_keeps_catalog_caches_and_refreshes_stock_after_the_ttl(app, client, make_user, make_product):
+    product_id = make_product("Hoodie", price=25.0, stock=5)
+    user_id = make_user("buyer@example.com")
+    page_cache.clear()
+    index_etag = client.get("/").headers["ETag"]
+    assert b"<strong>Stock:</strong> 5" in client.get(f"/product/{product_id}").data
+    with app.app_context():
+        version = current_catalog_version()
+
+        reserve(user_id, "checkout-1", [(product_id, 2, "Hoodie", 25.0)], 1800)
+        fulfill_checkout(user_id, "checkout-1")
+
+        assert current_catalog_version() == version
+        assert db.session.get(Product, product_id).version == 1
+
+    assert client.get("/", headers={"If-None-Match": index_etag}).status_code == 304
+    # Within STOCK_DISPLAY_TTL the product page may show the old stock; after it, the new one
+    assert b"<strong>Stock:</strong> 5" in client.get(f"/product/{product_id}").data
+    app.config["STOCK_DISPLAY_TTL"] = 0
+    assert b"<strong>Stock:</strong> 3" in client.get(f"/product/{product_id}").data
@@ -0,0 +1,42 @@
+"""
+test_passwords.py
+
+The hashing pool's back-pressure: a slot is held for as long as its pool
+process is busy, including after the caller gave up waiting.
+"""
+
+import time
+
+import pytest
+
+from app import passwords
+from app.passwords import PasswordHasherBusy
+
+
+@pytest.fixture
+def pool_app(app, monkeypatch):
+    """One pool process and no queue, so a single hash in flight fills the pool."""
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_QUEUE=0,
+                      PASSWORD_HASH_QUEUE_TIMEOUT=0.05)
+    for name in ("_pool", "_pool_pid", "_slots"):
+        monkeypatch.setattr(passwords, name, None)
+    yield app
+    passwords.shutdown()
+
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(pool_app):
+    with pool_app.app_context():
+        # Warm the pool up so process start-up doesn't count against the timeouts below
+        assert passwords._run(time.sleep, 0) is None
+
+        pool_app.config["PASSWORD_HASH_TIMEOUT"] = 0.1
+        with pytest.raises(PasswordHasherBusy, match="timed out"):
+            passwords._run(time.sleep, 1.0)
+        # The pool process is still sleeping, so there is no room for another hash
+        with pytest.raises(PasswordHasherBusy, match="Too many"):
+            passwords._run(time.sleep, 0)
+
+        pool_app.config["PASSWORD_HASH_QUEUE_TIMEOUT"] = 5
+        started = time.perf_counter()
+        assert passwords._run(time.sleep, 0) is None
+        assert time.perf_counter() - started < 2
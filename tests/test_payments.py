@@ -0,0 +1,154 @@
+"""
+test_payments.py
+
+The Stripe gateway (app/payments.py) against the local fake Stripe API:
+connection reuse, idempotent retries, the call budget and the circuit breaker.
+Also how checkout answers when payments or the database are unavailable.
+"""
+
+import secrets
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app import db, routes
+from app.models import StockHold
+from app.payments import PaymentUnavailableError, StripeGateway
+from app.reservations import reserve
+
+
+@pytest.fixture
+def gateway_for(app, fake_stripe):
+    """A StripeGateway on the fake API, with quick timeouts and any settings overridden."""
+    def build(**settings):
+        config = dict(app.config, STRIPE_CONNECT_TIMEOUT=0.2, STRIPE_READ_TIMEOUT=0.3,
+                      STRIPE_RETRY_BACKOFF=0.01, STRIPE_CALL_BUDGET=1.0, STRIPE_BREAKER_RESET=0.2)
+        config.update(settings)
+        return StripeGateway(config)
+    return build
+
+
+def _create(gateway):
+    return gateway.create_checkout_session(
+        {"mode": "payment", "success_url": "http://localhost/ok", "cancel_url": "http://localhost/cart"},
+        idempotency_key=f"checkout-{secrets.token_hex(16)}",
+    )
+
+
+def test_calls_reuse_one_connection(gateway_for, fake_stripe):
+    gateway = gateway_for()
+    ids = {_create(gateway).id for _ in range(20)}
+
+    assert len(ids) == fake_stripe.sessions_created == 20
+    assert fake_stripe.connections == 1
+
+
+def test_retries_never_create_a_second_session(gateway_for, fake_stripe):
+    gateway = gateway_for(STRIPE_MAX_RETRIES=8, STRIPE_BREAKER_FAILURES=1000, STRIPE_CALL_BUDGET=5.0)
+    fake_stripe.error_rate = fake_stripe.drop_rate = 0.3
+
+    created = [_create(gateway).id for _ in range(30)]
+
+    assert gateway.stats.snapshot()["checkout.sessions.create"]["retries"] > 0
+    # Each idempotency key made at most one session, and every call got its own
+    assert len(set(created)) == 30
+    assert fake_stripe.sessions_created == 30
+
+
+def test_hanging_stripe_is_bounded_by_the_call_budget(gateway_for, fake_stripe):
+    gateway = gateway_for(STRIPE_MAX_RETRIES=10, STRIPE_BREAKER_FAILURES=1000)
+    fake_stripe.hang = True
+
+    started = time.monotonic()
+    with pytest.raises(PaymentUnavailableError):
+        _create(gateway)
+
+    assert time.monotonic() - started <= gateway.call_budget + 0.1
+    assert gateway.stats.snapshot()["checkout.sessions.create"]["attempts"] >= 2
+
+
+def test_budget_shorter_than_one_attempt_still_bounds_it(gateway_for, fake_stripe):
+    gateway = gateway_for(STRIPE_CALL_BUDGET=0.25)
+    fake_stripe.hang = True
+
+    started = time.monotonic()
+    with pytest.raises(PaymentUnavailableError):
+        _create(gateway)
+
+    assert time.monotonic() - started <= gateway.call_budget + 0.1
+
+
+def test_breaker_opens_and_then_fails_fast(gateway_for, fake_stripe):
+    gateway = gateway_for(STRIPE_MAX_RETRIES=5, STRIPE_BREAKER_FAILURES=3, STRIPE_BREAKER_RESET=60)
+    fake_stripe.error_rate = 1.0
+
+    with pytest.raises(PaymentUnavailableError):
+        _create(gateway)
+    assert gateway.breaker.state == "open"
+    assert fake_stripe.requests == 3
+
+    with pytest.raises(PaymentUnavailableError):
+        _create(gateway)
+    assert fake_stripe.requests == 3
+    assert gateway.stats.snapshot()["checkout.sessions.create"]["rejected"] == 1
+
+
+def test_trial_call_closes_the_breaker(gateway_for, fake_stripe):
+    gateway = gateway_for(STRIPE_MAX_RETRIES=0, STRIPE_BREAKER_FAILURES=1)
+    fake_stripe.error_rate = 1.0
+    with pytest.raises(PaymentUnavailableError):
+        _create(gateway)
+    assert gateway.breaker.state == "open"
+
+    fake_stripe.error_rate = 0.0
+    time.sleep(gateway.breaker.reset_seconds)
+
+    assert _create(gateway).id in fake_stripe.sessions
+    assert gateway.breaker.state == "closed"
+
+
+def test_checkout_tells_the_buyer_payments_are_unavailable(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    app.config.update(STRIPE_MAX_RETRIES=0, STRIPE_BREAKER_FAILURES=1, STRIPE_CALL_BUDGET=1.0,
+                      STRIPE_CONNECT_TIMEOUT=0.2, STRIPE_READ_TIMEOUT=0.3)
+    user_id = make_user("buyer@example.com")
+    add_to_cart(user_id, make_product("Hoodie", stock=5), 2)
+    login(user_id)
+    fake_stripe.error_rate = 1.0
+
+    for _ in range(2):
+        response = client.post("/checkout", follow_redirects=True)
+        assert b"Payments are temporarily unavailable" in response.data
+
+    # The second checkout was refused by the open breaker without calling Stripe
+    assert fake_stripe.requests == 1
+    with app.app_context():
+        assert db.session.scalar(select(func.count(StockHold.id))) == 0
+
+
+def test_checkout_asks_to_retry_when_the_database_is_locked(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login, monkeypatch):
+    user_id = make_user("buyer@example.com")
+    hoodie, cap = make_product("Hoodie", stock=5), make_product("Cap", stock=5)
+    add_to_cart(user_id, hoodie, 1)
+    add_to_cart(user_id, cap, 1)
+    login(user_id)
+
+    def locked_after_first_line(user_id, checkout_key, lines, ttl):
+        reserve(user_id, checkout_key, lines[:1], ttl)
+        raise OperationalError("INSERT INTO stock_hold ...", {}, sqlite3.OperationalError("database is locked"))
+
+    monkeypatch.setattr(routes, "reserve", locked_after_first_line)
+    response = client.post("/checkout", follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Please try again in a moment" in response.data
+    with app.app_context():
+        assert db.session.scalar(select(func.count(StockHold.id))) == 0
+
+    monkeypatch.setattr(routes, "reserve", reserve)
+    response = client.post("/checkout")
+    assert response.status_code == 303
+    assert len(fake_stripe.sessions) == 1
@@ -0,0 +1,51 @@
+"""
+test_query_budgets.py
+
+Query budgets for the hot pages, so a lazy load sneaking into a template
+(an N+1) fails a test instead of showing up in production latency.
+"""
+
+import pytest
+
+from app import db
+from app.fulfillment import fulfill_checkout
+from app.http_cache import page_cache
+from app.instrumentation import assert_max_queries
+from app.reservations import reserve
+
+
+@pytest.fixture
+def catalog(make_product):
+    for n in range(30):
+        make_product(f"Product {n}", price=10.0 + n, category=("hoodies", "tees", "caps")[n % 3])
+
+
+# Tests run with CATALOG_VERSION_TTL=0, so the catalog version is read on every lookup
+# (the page cache and the facets each ask); in production it is read once per TTL.
+
+def test_catalog_page_budget_anonymous(client, catalog):
+    page_cache.clear()
+    response = assert_max_queries(client, "/?category=hoodies&sort=price_asc", 4)
+    assert response.status_code == 200
+
+
+def test_catalog_page_budget_logged_in(client, catalog, make_user, login):
+    login(make_user("shopper@example.com"))
+    response = assert_max_queries(client, "/", 5)
+    assert response.status_code == 200
+
+
+def test_order_history_budget(app, client, make_user, make_product, login):
+    user_id = make_user("regular@example.com")
+    products = [make_product(f"Item {n}", stock=1000) for n in range(5)]
+    for n in range(12):
+        with app.app_context():
+            reserve(user_id, f"checkout-{n}", [(product_id, 2, "Item", 25.0) for product_id in products], 1800)
+            fulfill_checkout(user_id, f"checkout-{n}")
+            db.session.remove()
+    login(user_id)
+
+    # A full page of ten orders of five items each
+    response = assert_max_queries(client, "/orders", 4)
+    assert response.status_code == 200
+    assert response.data.count(b"Unit Price") == 50
@@ -0,0 +1,91 @@
+"""
+test_recommendations.py
+
+Incremental `flask recommendations build` runs must end with the same
+co-purchase scores as a full rebuild, including for orders that commit
+after a build has already passed their id.
+"""
+
+import math
+
+import pytest
+from sqlalchemy import select
+
+from app import db, recommendations
+from app.models import Order, OrderItem, ProductRecommendation
+
+
+@pytest.fixture(autouse=True)
+def recommendations_config(app, tmp_path):
+    app.config.update(RECOMMENDATIONS_STATE_PATH=str(tmp_path / "recommendations.npz"),
+                      RECOMMENDATIONS_MIN_SUPPORT=1)
+
+
+def _order(app, order_id, *product_ids):
+    with app.app_context():
+        db.session.add(Order(id=order_id, total_amount=10.0 * len(product_ids),
+                             items=[OrderItem(product_id=product_id, quantity=1, unit_price=10.0)
+                                    for product_id in product_ids]))
+        db.session.commit()
+
+
+def _build(app, full=False):
+    with app.app_context():
+        recommendations.build(full, log=lambda message: None)
+        return {(row.product_id, row.recommended_id): row.score
+                for row in db.session.scalars(select(ProductRecommendation))}
+
+
+def test_incremental_build_matches_co_purchases(app, make_product):
+    a, b, c = (make_product(name) for name in "ABC")
+    _order(app, 1, a, b)
+    _order(app, 2, a, b)
+    _order(app, 3, a, c)
+
+    scores = _build(app, full=True)
+    # Cosine of the order sets: A is in 3 orders, B in 2, C in 1
+    assert scores[a, b] == pytest.approx(2 / math.sqrt(6), abs=1e-6)
+    assert scores[a, c] == pytest.approx(1 / math.sqrt(3), abs=1e-6)
+    assert (b, c) not in scores
+
+    _order(app, 4, b, c)
+    scores = _build(app)
+    assert scores[b, a] == pytest.approx(2 / 3, abs=1e-6)
+    assert scores[b, c] == pytest.approx(1 / math.sqrt(6), abs=1e-6)
+    assert scores[c, b] == pytest.approx(1 / math.sqrt(6), abs=1e-6)
+    # A was not in the new order, so only B's and C's lists are re-ranked
+    rebuilt = _build(app, full=True)
+    assert {pair: score for pair, score in scores.items() if pair[0] != a} == \
+        {pair: score for pair, score in rebuilt.items() if pair[0] != a}
+
+
+def test_order_committed_below_the_high_water_mark_is_counted(app, make_product):
+    a, b, c = (make_product(name) for name in "ABC")
+    _order(app, 1, a, b)
+    _order(app, 3, a, c)
+    _build(app, full=True)
+
+    # Order 2 was still in flight during that build
+    _order(app, 2, a, b)
+    scores = _build(app)
+    assert scores[a, b] == pytest.approx(2 / math.sqrt(6), abs=1e-6)
+    assert scores[b, a] == pytest.approx(2 / math.sqrt(6), abs=1e-6)
+
+    # ...and is counted only once
+    with app.app_context():
+        matrix, last_order_id, pending = recommendations.load_state(app.config["RECOMMENDATIONS_STATE_PATH"])
+    assert (last_order_id, pending) == (3, {})
+    assert matrix[a, b] == 2
+    assert _build(app) == scores
+
+
+def test_rolled_back_order_ids_are_dropped_after_the_timeout(app, make_product, monkeypatch):
+    a, b = make_product("A"), make_product("B")
+    _order(app, 2, a, b)
+    _build(app, full=True)
+    path = app.config["RECOMMENDATIONS_STATE_PATH"]
+    assert recommendations.load_state(path)[2].keys() == {1}
+
+    monkeypatch.setattr(recommendations, "PENDING_ORDER_TIMEOUT", 0)
+    _build(app)
+    assert recommendations.load_state(path)[2] == {}
@@ -0,0 +1,205 @@
+"""
+test_webhook_fulfillment.py
+
+Checkout against the fake Stripe API, then signed checkout.session events
+posted to /stripe/webhook and the queued fulfillment job run to completion.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app import create_app, db
+from app.jobs import claim_next_job, run_job
+from app.models import CartItem, Job, Order, Product, StockHold
+from app.reservations import SESSION_MIN_LIFETIME, release, sweep_expired_holds
+from config import Config
+
+SECRET = "whsec_test"
+
+
+def _checkout(client):
+    response = client.post("/checkout")
+    assert response.status_code == 303, response.headers.get("Location")
+    return response.headers["Location"].rsplit("/", 1)[1]
+
+
+def _post_event(client, fake_stripe, event_type, session_id, secret=SECRET, **changes):
+    payload, headers = fake_stripe.webhook(event_type, session_id, secret, **changes)
+    return client.post("/stripe/webhook", data=payload, headers=headers)
+
+
+def _pay(client, fake_stripe, session_id):
+    return _post_event(client, fake_stripe, "checkout.session.completed", session_id,
+                       status="complete", payment_status="paid")
+
+
+def _run_jobs(app):
+    with app.app_context():
+        while (job := claim_next_job()) is not None:
+            run_job(job)
+        db.session.remove()
+
+
+def _shop(make_user, make_product, add_to_cart, login, quantity=2, stock=5):
+    user_id = make_user("buyer@example.com")
+    product_id = make_product("Hoodie", price=20.0, stock=stock)
+    add_to_cart(user_id, product_id, quantity)
+    login(user_id)
+    return user_id, product_id
+
+
+def test_paid_checkout_is_fulfilled_from_what_was_charged(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    user_id, product_id = _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+    assert fake_stripe.sessions[session_id]["client_reference_id"] == str(user_id)
+
+    # After paying, the buyer adds more to the cart and the price changes
+    with app.app_context():
+        db.session.execute(update(CartItem).values(quantity=5))
+        db.session.execute(update(Product).values(price=99.0))
+        db.session.commit()
+
+    assert _pay(client, fake_stripe, session_id).status_code == 200
+    assert client.get(f"/checkout/status?session_id={session_id}").get_json()["status"] == "processing"
+    _run_jobs(app)
+
+    status = client.get(f"/checkout/status?session_id={session_id}").get_json()
+    assert status["status"] == "done"
+    with app.app_context():
+        order = db.session.get(Order, status["order_id"])
+        assert [(item.quantity, item.unit_price) for item in order.items] == [(2, 20.0)]
+        assert order.total_amount == 40.0
+        assert db.session.get(Product, product_id).stock == 3
+        assert db.session.scalar(select(func.count(StockHold.id))) == 0
+        # Only the units paid for leave the cart
+        assert db.session.scalars(select(CartItem.quantity)).all() == [3]
+
+
+def test_redelivered_event_creates_one_order(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _, product_id = _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+
+    for _ in range(3):
+        assert _pay(client, fake_stripe, session_id).status_code == 200
+        _run_jobs(app)
+
+    with app.app_context():
+        assert db.session.scalar(select(func.count(Job.id))) == 1
+        assert db.session.scalar(select(func.count(Order.id))) == 1
+        assert db.session.get(Product, product_id).stock == 3
+
+
+def test_bad_signature_is_rejected(app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+
+    response = _post_event(client, fake_stripe, "checkout.session.completed", session_id,
+                           secret="whsec_wrong", payment_status="paid")
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert db.session.scalar(select(func.count(Job.id))) == 0
+
+
+def test_paid_checkout_without_holds_fails_instead_of_confirming(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _, product_id = _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+    with app.app_context():
+        release(fake_stripe.sessions[session_id]["metadata"]["hold_key"])
+
+    _pay(client, fake_stripe, session_id)
+    _run_jobs(app)
+
+    assert client.get(f"/checkout/status?session_id={session_id}").get_json()["status"] == "failed"
+    with app.app_context():
+        assert db.session.scalar(select(func.count(Order.id))) == 0
+        assert db.session.scalar(select(Job.status)) == "failed"
+        assert db.session.get(Product, product_id).stock == 5
+
+
+def test_late_webhook_after_the_hold_expired_is_still_fulfilled(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _, product_id = _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+    with app.app_context():
+        db.session.execute(update(StockHold).values(expires_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+        # Within STOCK_HOLD_RETENTION the sweeper leaves the holds alone
+        assert sweep_expired_holds() == 0
+
+    _pay(client, fake_stripe, session_id)
+    _run_jobs(app)
+
+    with app.app_context():
+        assert db.session.scalar(select(func.count(Order.id))) == 1
+        assert db.session.get(Product, product_id).stock == 3
+
+
+def test_expired_session_releases_its_holds(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+
+    response = _post_event(client, fake_stripe, "checkout.session.expired", session_id, status="expired")
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert db.session.scalar(select(func.count(StockHold.id))) == 0
+        assert db.session.scalar(select(func.count(Job.id))) == 0
+
+
+def test_new_checkout_expires_the_earlier_unpaid_session(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    # Only enough stock for one checkout at a time
+    _shop(make_user, make_product, add_to_cart, login, quantity=2, stock=2)
+    first = _checkout(client)
+
+    second = _checkout(client)
+
+    assert fake_stripe.sessions[first]["status"] == "expired"
+    with app.app_context():
+        assert db.session.scalars(select(StockHold.checkout_session_id)).all() == [second]
+
+
+def test_new_checkout_keeps_the_holds_of_a_paid_session(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    _, product_id = _shop(make_user, make_product, add_to_cart, login, quantity=2, stock=5)
+    first = _checkout(client)
+    _pay(client, fake_stripe, first)
+
+    # Back on the site before the webhook job ran, the buyer checks out again
+    second = _checkout(client)
+    _run_jobs(app)
+
+    assert fake_stripe.sessions[first]["status"] == "complete"
+    with app.app_context():
+        assert [(item.quantity, item.unit_price)
+                for item in db.session.scalar(select(Order)).items] == [(2, 20.0)]
+        assert db.session.get(Product, product_id).stock == 3
+        assert db.session.scalars(select(StockHold.checkout_session_id).distinct()).all() == [second]
+
+
+def test_session_outlives_stripes_minimum_and_holds_last_as_long(
+        app, client, fake_stripe, make_user, make_product, add_to_cart, login):
+    app.config["STOCK_HOLD_TTL"] = SESSION_MIN_LIFETIME
+    _shop(make_user, make_product, add_to_cart, login)
+    session_id = _checkout(client)
+
+    expires_at = fake_stripe.sessions[session_id]["expires_at"]
+    assert expires_at > time.time() + SESSION_MIN_LIFETIME + 60
+    with app.app_context():
+        for hold_expiry in db.session.scalars(select(StockHold.expires_at)):
+            assert hold_expiry.replace(tzinfo=timezone.utc).timestamp() >= expires_at
+
+
+@pytest.mark.parametrize("ttl", [600, 2 * 24 * 3600])
+def test_hold_ttl_outside_stripes_session_limits_is_refused(monkeypatch, ttl):
+    monkeypatch.setattr(Config, "STOCK_HOLD_TTL", ttl)
+    with pytest.raises(RuntimeError, match="STOCK_HOLD_TTL"):
+        create_app()